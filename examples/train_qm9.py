@@ -11,9 +11,11 @@ from cormorant.models.autotest import cormorant_tests
 from cormorant.engine import Engine
 from cormorant.engine import init_argparse, init_file_paths, init_logger, init_cuda
 from cormorant.engine import init_optimizer, init_scheduler
-from cormorant.data.utils import initialize_datasets
+from cormorant.engine import load_pretrained, init_head_only
+from cormorant.data.utils import initialize_datasets, init_dataloaders
 
 from cormorant.data.collate import collate_fn
+from cormorant.inference import PredictionCache
 
 # This makes printing tensors more readable.
 torch.set_printoptions(linewidth=1000, threshold=100000)
@@ -45,12 +47,7 @@ def main():
         dataset.convert_units(qm9_to_eV)
 
     # Construct PyTorch dataloaders from datasets
-    dataloaders = {split: DataLoader(dataset,
-                                     batch_size=args.batch_size,
-                                     shuffle=args.shuffle if (split == 'train') else False,
-                                     num_workers=args.num_workers,
-                                     collate_fn=collate_fn)
-                         for split, dataset in datasets.items()}
+    dataloaders = init_dataloaders(args, datasets, collate_fn=collate_fn, device=device)
 
     # Initialize model
     model = CormorantQM9(args.maxl, args.max_sh, args.num_cg_levels, args.num_channels, num_species,
@@ -58,20 +55,36 @@ def main():
                         args.weight_init, args.level_gain, args.charge_power, args.basis_set,
                         charge_scale, args.gaussian_mask,
                         args.top, args.input, args.num_mpnn_levels,
+                        prune_edges=args.prune_edges, checkpoint_levels=args.checkpoint_levels,
+                        parallel_levels=args.parallel_levels,
                         device=device, dtype=dtype)
+    load_pretrained(args, model)
+
+    # Apply the covariance and permutation invariance tests.
+    cormorant_tests(model, dataloaders['train'], args, charge_scale=charge_scale)
+
+    # Train the output layers only, on atom features of the frozen trunk computed once
+    if args.head_only:
+        model, datasets = init_head_only(args, model, datasets)
+        dataloaders = init_dataloaders(args, datasets, collate_fn=collate_fn, device=device)
+
+    # Compile the model in place, so that checkpoints keep the names of the weights
+    if args.compile:
+        model.compile(dynamic=False)
 
     # Initialize the scheduler and optimizer
     optimizer = init_optimizer(args, model)
-    scheduler, restart_epochs = init_scheduler(args, optimizer)
+    scheduler, restart_epochs = init_scheduler(args, optimizer, minibatch_per_epoch=len(dataloaders['train']))
 
     # Define a loss function. Just use L2 loss for now.
     loss_fn = torch.nn.functional.mse_loss
 
-    # Apply the covariance and permutation invariance tests.
-    cormorant_tests(model, dataloaders['train'], args, charge_scale=charge_scale)
-
     # Instantiate the training class
-    trainer = Engine(args, dataloaders, model, loss_fn, optimizer, scheduler, restart_epochs, device, dtype)
+    # Predictions are keyed on the geometry, which batches of cached features do not have
+    use_cache = args.prediction_cache > 0 and not args.head_only
+    prediction_cache = PredictionCache(args.prediction_cache, path=args.prediction_cache_path) if use_cache else None
+    trainer = Engine(args, dataloaders, model, loss_fn, optimizer, scheduler, restart_epochs, device, dtype,
+                     prediction_cache=prediction_cache)
 
     # Load from checkpoint file. If no checkpoint file exists, automatically does nothing.
     trainer.load_checkpoint()
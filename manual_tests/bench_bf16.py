@@ -0,0 +1,60 @@
+import argparse
+import time
+
+import torch
+
+from cormorant.models import CormorantQM9
+
+parser = argparse.ArgumentParser(description='Accuracy, activation memory and time of CormorantQM9 in float and in bfloat16 mixed precision.')
+parser.add_argument('--batch-size', type=int, default=25)
+parser.add_argument('--num-atoms', type=int, default=20)
+parser.add_argument('--num-cg-levels', type=int, default=4)
+parser.add_argument('--maxl', type=int, default=3)
+parser.add_argument('--num-channels', type=int, default=10)
+parser.add_argument('--num-threads', type=int, default=-1)
+parser.add_argument('--num-steps', type=int, default=5)
+args = parser.parse_args()
+
+if args.num_threads > 0:
+    torch.set_num_threads(args.num_threads)
+
+num_species = 5
+
+torch.manual_seed(0)
+charges = torch.randint(1, num_species + 1, (args.batch_size, args.num_atoms))
+atom_mask = torch.ones(args.batch_size, args.num_atoms, dtype=torch.bool)
+data = {'charges': charges,
+        'positions': 2 * torch.randn(args.batch_size, args.num_atoms, 3),
+        'one_hot': charges.unsqueeze(-1) == torch.arange(1, num_species + 1),
+        'atom_mask': atom_mask,
+        'edge_mask': atom_mask.unsqueeze(1) * atom_mask.unsqueeze(2)}
+
+model = CormorantQM9(args.maxl, args.maxl, args.num_cg_levels, args.num_channels, num_species,
+                     ['learn', 'hard'], 1.73, 1.73, 0.2, 'rand', 1., 2, (3, 3), num_species, False,
+                     'linear', 'linear', 1)
+
+print('Threads: {}'.format(torch.get_num_threads()))
+reference = None
+for name, enabled in [('float', False), ('bfloat16', True)]:
+    saved_bytes = [0]
+
+    def pack(tensor):
+        saved_bytes[0] += tensor.numel() * tensor.element_size()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor), \
+            torch.autocast('cpu', dtype=torch.bfloat16, enabled=enabled):
+        predict = model(data).float()
+    if reference is None:
+        reference = predict.detach()
+
+    t0 = time.perf_counter()
+    for _ in range(args.num_steps):
+        with torch.autocast('cpu', dtype=torch.bfloat16, enabled=enabled):
+            predict = model(data).float()
+        predict.sum().backward()
+    dt = (time.perf_counter() - t0) / args.num_steps
+
+    error = ((predict.detach() - reference).abs().max() / reference.abs().max()).item()
+    print('{}: {:.1f} MB saved for backward, {:.2f} s/step, relative error {:.1e}'.format(
+          name, saved_bytes[0] / 2**20, dt, error))
@@ -0,0 +1,51 @@
+import argparse
+import time
+
+import torch
+from torch.utils.data import DataLoader
+
+from cormorant.data.collate import collate_fn
+from cormorant.data.dataset import ProcessedDataset
+
+parser = argparse.ArgumentParser(description='Collate throughput of molecules fetched one at a time or as a batch.')
+parser.add_argument('--num-molecules', type=int, default=20000)
+parser.add_argument('--batch-size', type=int, default=[25, 100], nargs='+')
+parser.add_argument('--max-atoms', type=int, default=29)
+parser.add_argument('--num-workers', type=int, default=0)
+args = parser.parse_args()
+
+num_species = 5
+
+torch.manual_seed(0)
+num_atoms = torch.randint(3, args.max_atoms + 1, (args.num_molecules,))
+charges = torch.randint(1, num_species + 1, (args.num_molecules, args.max_atoms))
+charges[torch.arange(args.max_atoms) >= num_atoms.unsqueeze(-1)] = 0
+data = {'charges': charges, 'positions': torch.randn(args.num_molecules, args.max_atoms, 3),
+        'index': torch.arange(args.num_molecules)}
+data.update({key: torch.randn(args.num_molecules) for key in ['U0', 'U', 'H', 'G', 'gap', 'homo', 'lumo']})
+dataset = ProcessedDataset(data, shuffle=True)
+
+
+class PerMolecule(torch.utils.data.Dataset):
+    # Hides __getitems__, so that the DataLoader fetches one molecule at a time
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        return self.dataset[idx]
+
+
+print('Molecules: {}, workers: {}'.format(args.num_molecules, args.num_workers))
+for batch_size in args.batch_size:
+    for name, source in [('per molecule', PerMolecule(dataset)), ('batched', dataset)]:
+        loader = DataLoader(source, batch_size=batch_size, shuffle=True, num_workers=args.num_workers,
+                            collate_fn=collate_fn)
+
+        t0 = time.perf_counter()
+        for batch in loader:
+            pass
+        elapsed = time.perf_counter() - t0
+        print('batch size {:>4}, {:>12}: {:>10.0f} samples/s'.format(batch_size, name, len(dataset) / elapsed))
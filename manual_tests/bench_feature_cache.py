@@ -0,0 +1,62 @@
+import argparse
+import tempfile
+import time
+
+import torch
+from torch.utils.data import DataLoader
+
+from cormorant.data.collate import collate_fn
+from cormorant.data.dataset import ProcessedDataset
+from cormorant.data.feature_cache import cache_features
+from cormorant.models import CormorantQM9
+from cormorant.models.feature_head import FeatureHead
+
+parser = argparse.ArgumentParser(description='Epoch time of CormorantQM9 trained end to end, and of its output layers trained on cached atom features.')
+parser.add_argument('--num-molecules', type=int, default=500)
+parser.add_argument('--batch-size', type=int, default=25)
+parser.add_argument('--num-atoms', type=int, default=20)
+parser.add_argument('--num-cg-levels', type=int, default=4)
+parser.add_argument('--maxl', type=int, default=3)
+parser.add_argument('--num-channels', type=int, default=10)
+parser.add_argument('--num-threads', type=int, default=-1)
+args = parser.parse_args()
+
+if args.num_threads > 0:
+    torch.set_num_threads(args.num_threads)
+
+num_species = 5
+
+torch.manual_seed(0)
+num_atoms = torch.randint(args.num_atoms // 2, args.num_atoms + 1, (args.num_molecules,))
+charges = torch.randint(1, num_species + 1, (args.num_molecules, args.num_atoms))
+charges[torch.arange(args.num_atoms) >= num_atoms.unsqueeze(-1)] = 0
+dataset = ProcessedDataset({'charges': charges,
+                            'positions': 2 * torch.randn(args.num_molecules, args.num_atoms, 3),
+                            'U0': torch.randn(args.num_molecules)},
+                           included_species=torch.arange(1, num_species + 1))
+
+model = CormorantQM9(args.maxl, args.maxl, args.num_cg_levels, args.num_channels, num_species,
+                     ['learn', 'hard'], 1.73, 1.73, 0.2, 'rand', 1., 2, (3, 3), num_species, False,
+                     'linear', 'linear', 1)
+
+
+def epoch(model, dataset):
+    optimizer = torch.optim.Adam([param for param in model.parameters() if param.requires_grad])
+    t0 = time.perf_counter()
+    for data in DataLoader(dataset, batch_size=args.batch_size, shuffle=True, collate_fn=collate_fn):
+        optimizer.zero_grad()
+        loss = torch.nn.functional.mse_loss(model(data), data['U0'])
+        loss.backward()
+        optimizer.step()
+    return time.perf_counter() - t0
+
+
+print('Threads: {}'.format(torch.get_num_threads()))
+print('full model: {:.2f} s/epoch'.format(epoch(model, dataset)))
+
+with tempfile.TemporaryDirectory() as path:
+    t0 = time.perf_counter()
+    features = cache_features(model, dataset, path, batch_size=args.batch_size)
+    print('caching features: {:.2f} s ({:.1f} MB)'.format(time.perf_counter() - t0, features.features.nbytes / 2**20))
+
+    print('output layers on cached features: {:.3f} s/epoch'.format(epoch(FeatureHead(model), features)))
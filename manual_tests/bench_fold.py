@@ -0,0 +1,39 @@
+import argparse
+
+import torch
+
+from cormorant.models import CormorantQM9
+from cormorant.inference import fold_report
+
+parser = argparse.ArgumentParser(description='FLOPs and latency of an eager, a frozen and a folded CormorantQM9.')
+parser.add_argument('--batch-size', type=int, default=25)
+parser.add_argument('--num-atoms', type=int, default=20)
+parser.add_argument('--num-cg-levels', type=int, default=4)
+parser.add_argument('--maxl', type=int, default=3)
+parser.add_argument('--num-channels', type=int, default=10)
+parser.add_argument('--num-threads', type=int, default=-1)
+parser.add_argument('--num-steps', type=int, default=20)
+args = parser.parse_args()
+
+if args.num_threads > 0:
+    torch.set_num_threads(args.num_threads)
+
+num_species = 5
+
+torch.manual_seed(0)
+charges = torch.randint(1, num_species + 1, (args.batch_size, args.num_atoms))
+atom_mask = torch.ones(args.batch_size, args.num_atoms, dtype=torch.bool)
+data = {'charges': charges,
+        'positions': 2 * torch.randn(args.batch_size, args.num_atoms, 3),
+        'one_hot': charges.unsqueeze(-1) == torch.arange(1, num_species + 1),
+        'atom_mask': atom_mask,
+        'edge_mask': atom_mask.unsqueeze(1) * atom_mask.unsqueeze(2)}
+
+model = CormorantQM9(args.maxl, args.maxl, args.num_cg_levels, args.num_channels, num_species,
+                     ['learn', 'hard'], 1.73, 1.73, 0.2, 'rand', 10., 2, (3, 3), num_species, False,
+                     'linear', 'linear', 1).eval()
+
+print('Threads: {}'.format(torch.get_num_threads()))
+for name, result in fold_report(model, data, num_steps=args.num_steps).items():
+    print('{}: {:.3f} GFLOP, {:.2f} ms/batch (max error {:.1e})'.format(
+          name, result['flops'] / 1e9, 1000 * result['latency'], result['max_error']))
@@ -0,0 +1,56 @@
+import argparse
+import time
+
+import torch
+
+from cormorant.models import CormorantQM9
+from cormorant.inference import freeze
+
+parser = argparse.ArgumentParser(description='Inference latency of an eager and a frozen CormorantQM9.')
+parser.add_argument('--batch-size', type=int, default=25)
+parser.add_argument('--num-atoms', type=int, default=20)
+parser.add_argument('--num-cg-levels', type=int, default=4)
+parser.add_argument('--maxl', type=int, default=3)
+parser.add_argument('--num-channels', type=int, default=10)
+parser.add_argument('--num-threads', type=int, default=-1)
+parser.add_argument('--num-steps', type=int, default=20)
+parser.add_argument('--compile', type=str, default=None,
+                    help='Also benchmark torch.compile with this backend, e.g. inductor.')
+args = parser.parse_args()
+
+if args.num_threads > 0:
+    torch.set_num_threads(args.num_threads)
+
+num_species = 5
+
+torch.manual_seed(0)
+charges = torch.randint(1, num_species + 1, (args.batch_size, args.num_atoms))
+atom_mask = torch.ones(args.batch_size, args.num_atoms, dtype=torch.bool)
+data = {'charges': charges,
+        'positions': 2 * torch.randn(args.batch_size, args.num_atoms, 3),
+        'one_hot': charges.unsqueeze(-1) == torch.arange(1, num_species + 1),
+        'atom_mask': atom_mask,
+        'edge_mask': atom_mask.unsqueeze(1) * atom_mask.unsqueeze(2)}
+
+model = CormorantQM9(args.maxl, args.maxl, args.num_cg_levels, args.num_channels, num_species,
+                     ['learn', 'hard'], 1.73, 1.73, 0.2, 'rand', 10., 2, (3, 3), num_species, False,
+                     'linear', 'linear', 1).eval()
+
+frozen = freeze(model)
+models = {'eager': model, 'frozen': frozen, 'scripted': torch.jit.script(frozen)}
+if args.compile:
+    models['compiled'] = torch.compile(frozen, backend=args.compile)
+
+print('Threads: {}'.format(torch.get_num_threads()))
+with torch.inference_mode():
+    reference = model(data)
+    for name, module in models.items():
+        error = (module(data) - reference).abs().max().item()
+
+        t0 = time.perf_counter()
+        for _ in range(args.num_steps):
+            module(data)
+        dt = time.perf_counter() - t0
+
+        print('{}: {:.2f} ms/batch ({:.1f} molecules/s, max error {:.1e})'.format(
+              name, 1000 * dt / args.num_steps, args.num_steps * args.batch_size / dt, error))
@@ -0,0 +1,54 @@
+import argparse
+import time
+
+import torch
+from torch.utils.data import DataLoader
+
+from cormorant.data.collate import collate_fn, GeometryCollate
+from cormorant.data.dataset import ProcessedDataset
+from cormorant.models import CormorantQM9
+
+parser = argparse.ArgumentParser(description='Training step time with the geometry computed by the model or by the DataLoader workers.')
+parser.add_argument('--num-molecules', type=int, default=500)
+parser.add_argument('--batch-size', type=int, default=25)
+parser.add_argument('--max-atoms', type=int, default=29)
+parser.add_argument('--max-sh', type=int, default=3)
+parser.add_argument('--cutoff', type=float, default=None,
+                    help='Also find the edges shorter than this in the workers (runs the model with prune_edges).')
+parser.add_argument('--num-workers', type=int, default=2)
+parser.add_argument('--threads', type=int, default=1)
+args = parser.parse_args()
+
+torch.set_num_threads(args.threads)
+num_species = 5
+
+torch.manual_seed(0)
+num_atoms = torch.randint(3, args.max_atoms + 1, (args.num_molecules,))
+charges = torch.randint(1, num_species + 1, (args.num_molecules, args.max_atoms))
+charges[torch.arange(args.max_atoms) >= num_atoms.unsqueeze(-1)] = 0
+dataset = ProcessedDataset({'charges': charges, 'positions': 2 * torch.randn(args.num_molecules, args.max_atoms, 3),
+                            'U0': torch.randn(args.num_molecules)}, included_species=torch.arange(1, num_species + 1))
+
+cutoff_type = ['hard', 'cos'] if args.cutoff is not None else ['hard', 'soft']
+model = CormorantQM9(2, args.max_sh, 2, 4, num_species, cutoff_type, 2.5, 2.5, 0.4, 'rand', 1., 2, (3, 3),
+                     num_species, False, 'linear', 'linear', 1, prune_edges=args.cutoff is not None)
+
+collates = {
+    'model': collate_fn,
+    'workers (norms)': GeometryCollate(cutoff=args.cutoff),
+    'workers (norms, sph)': GeometryCollate(maxl=args.max_sh, cutoff=args.cutoff),
+}
+
+print('Threads: {}, workers: {}'.format(args.threads, args.num_workers))
+for name, collate in collates.items():
+    loader = DataLoader(dataset, batch_size=args.batch_size, num_workers=args.num_workers,
+                        collate_fn=collate, persistent_workers=args.num_workers > 0)
+
+    # Warm up the workers before timing
+    for batch in loader:
+        pass
+
+    t0 = time.perf_counter()
+    for batch in loader:
+        model(batch).sum().backward()
+    print('geometry in {}: {:.2f} s/epoch'.format(name, time.perf_counter() - t0))
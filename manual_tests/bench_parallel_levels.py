@@ -0,0 +1,61 @@
+import argparse
+import time
+
+import torch
+
+from cormorant.cg_lib import SphericalHarmonicsRel
+from cormorant.nn import RadialFilters, InputLinear
+from cormorant.models import CormorantCG
+
+parser = argparse.ArgumentParser(description='Throughput of CormorantCG with serial and parallel atom levels.')
+parser.add_argument('--batch-size', type=int, default=25)
+parser.add_argument('--num-atoms', type=int, default=20)
+parser.add_argument('--num-cg-levels', type=int, default=4)
+parser.add_argument('--maxl', type=int, default=3)
+parser.add_argument('--num-channels', type=int, default=10)
+parser.add_argument('--num-threads', type=int, default=-1)
+parser.add_argument('--num-steps', type=int, default=10)
+args = parser.parse_args()
+
+if args.num_threads > 0:
+    torch.set_num_threads(args.num_threads)
+
+num_species, num_levels = 5, args.num_cg_levels
+maxl, channels = [args.maxl] * num_levels, [args.num_channels] * (num_levels + 1)
+
+torch.manual_seed(0)
+positions = 2 * torch.randn(args.batch_size, args.num_atoms, 3)
+one_hot = torch.eye(num_species)[torch.randint(num_species, (args.batch_size, args.num_atoms))]
+atom_mask = torch.ones(args.batch_size, args.num_atoms, dtype=torch.bool)
+edge_mask = atom_mask.unsqueeze(1) * atom_mask.unsqueeze(2)
+
+sph_harms = SphericalHarmonicsRel(args.maxl, conj=True)
+rad_funcs = RadialFilters(maxl, (3, 3), channels, num_levels)
+input_func = InputLinear(num_species, args.num_channels)
+cormorant_cg = CormorantCG(maxl, maxl, input_func.tau, [], rad_funcs.tau, num_levels, channels,
+                           [10.] * num_levels, 'rand', ['learn'], [1.73] * num_levels, [1.73] * num_levels,
+                           [0.2] * num_levels)
+
+
+def step():
+    sph_harm, norms = sph_harms(positions, positions)
+    rads = rad_funcs(norms, edge_mask * (norms > 0))
+    atom_reps = input_func(one_hot, atom_mask, None, edge_mask, norms)
+    atoms_all, _ = cormorant_cg(atom_reps, atom_mask, None, edge_mask, rads, norms, sph_harm)
+    loss = sum(part.pow(2).sum() for atoms in atoms_all for part in atoms)
+    loss.backward()
+
+
+print('Threads: {}'.format(torch.get_num_threads()))
+for parallel in [False, True]:
+    for level in cormorant_cg.atom_levels:
+        level.parallel = parallel
+
+    step()
+    t0 = time.perf_counter()
+    for _ in range(args.num_steps):
+        step()
+    dt = time.perf_counter() - t0
+
+    print('parallel={}: {:.1f} molecules/s ({:.1f} ms/step)'.format(
+          parallel, args.num_steps * args.batch_size / dt, 1000 * dt / args.num_steps))
@@ -0,0 +1,50 @@
+import argparse
+import time
+
+import torch
+from torch.utils.data import DataLoader
+
+from cormorant.data.collate import collate_fn
+from cormorant.data.dataset import ProcessedDataset
+from cormorant.data.prefetch import DevicePrefetcher
+from cormorant.models import CormorantQM9
+
+parser = argparse.ArgumentParser(description='Training epoch time with and without background prefetching of the batches to the device.')
+parser.add_argument('--num-molecules', type=int, default=500)
+parser.add_argument('--batch-size', type=int, default=25)
+parser.add_argument('--max-atoms', type=int, default=29)
+parser.add_argument('--num-workers', type=int, default=0)
+parser.add_argument('--depths', type=int, nargs='*', default=[0, 1, 2, 4])
+parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+args = parser.parse_args()
+
+device = torch.device(args.device)
+num_species = 5
+
+torch.manual_seed(0)
+num_atoms = torch.randint(3, args.max_atoms + 1, (args.num_molecules,))
+charges = torch.randint(1, num_species + 1, (args.num_molecules, args.max_atoms))
+charges[torch.arange(args.max_atoms) >= num_atoms.unsqueeze(-1)] = 0
+dataset = ProcessedDataset({'charges': charges, 'positions': 2 * torch.randn(args.num_molecules, args.max_atoms, 3),
+                            'U0': torch.randn(args.num_molecules)}, included_species=torch.arange(1, num_species + 1))
+
+model = CormorantQM9(2, 2, 2, 4, num_species, ['hard', 'soft'], 2.5, 2.5, 0.4, 'rand', 1., 2, (3, 3),
+                     num_species, False, 'linear', 'linear', 1, device=device)
+loader = DataLoader(dataset, batch_size=args.batch_size, num_workers=args.num_workers, collate_fn=collate_fn)
+
+
+def sync():
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+
+
+print('Device: {}, workers: {}'.format(device, args.num_workers))
+for depth in args.depths:
+    prefetcher = DevicePrefetcher(loader, device, depth=depth)
+
+    sync()
+    t0 = time.perf_counter()
+    for batch in prefetcher:
+        model(batch).sum().backward()
+    sync()
+    print('prefetch depth {}: {:.2f} s/epoch'.format(depth, time.perf_counter() - t0))
@@ -0,0 +1,47 @@
+import argparse
+import io
+import logging
+import os
+import tarfile
+import tempfile
+import time
+
+import numpy as np
+
+from cormorant.data.prepare.process import process_xyz_gdb9, write_xyz_files
+
+parser = argparse.ArgumentParser(description='Throughput of the preparation of a GDB9-like tarball.')
+parser.add_argument('--num-molecules', type=int, default=20000)
+parser.add_argument('--num-workers', type=int, default=[0, 2, 4], nargs='+')
+args = parser.parse_args()
+
+logging.basicConfig(level=logging.INFO)
+
+rng = np.random.default_rng(0)
+tmpdir = tempfile.mkdtemp()
+tarball = os.path.join(tmpdir, 'dsgdb9nsd.xyz.tar.bz2')
+with tarfile.open(tarball, 'w:bz2') as tardata:
+    for idx in range(args.num_molecules):
+        num_atoms = int(rng.integers(3, 30))
+        lines = [str(num_atoms), 'gdb {} '.format(idx + 1) + ' '.join('{:.6f}'.format(x) for x in rng.normal(size=15))]
+        lines += ['{} {:.8f} {:.8f} {:.8f} 0.0'.format(atom, *rng.normal(size=3))
+                  for atom in rng.choice(['H', 'C', 'N', 'O', 'F'], num_atoms)]
+        lines += [' '.join('{:.4f}'.format(x) for x in rng.uniform(100, 4000, size=3 * num_atoms - 6)), 'C', 'InChI=1S/C']
+        raw = '\n'.join(lines).encode('UTF-8')
+        member = tarfile.TarInfo('dsgdb9nsd_{:06d}.xyz'.format(idx + 1))
+        member.size = len(raw)
+        tardata.addfile(member, io.BytesIO(raw))
+
+# Splits of the same proportions as QM9
+perm = rng.permutation(args.num_molecules)
+num_train, num_test = int(0.77 * args.num_molecules), int(0.1 * args.num_molecules)
+splits = {'train': perm[:num_train], 'valid': perm[num_train + num_test:], 'test': perm[num_train:num_train + num_test]}
+
+print('Molecules: {}, CPUs: {}'.format(args.num_molecules, os.cpu_count()))
+for num_workers in args.num_workers:
+    paths = {split: os.path.join(tmpdir, '{}_{}'.format(split, num_workers)) for split in splits}
+
+    t0 = time.perf_counter()
+    write_xyz_files(tarball, process_xyz_gdb9, paths, splits=splits, num_workers=num_workers)
+    elapsed = time.perf_counter() - t0
+    print('workers: {}, {:.1f} s, {:.0f} molecules/s'.format(num_workers, elapsed, args.num_molecules / elapsed))
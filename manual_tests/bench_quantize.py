@@ -0,0 +1,51 @@
+import argparse
+
+import torch
+
+from cormorant.models import CormorantQM9
+from cormorant.inference import freeze, quantize, quantization_report
+
+parser = argparse.ArgumentParser(description='Accuracy and CPU latency of a frozen and an int8 CormorantQM9.')
+parser.add_argument('--batch-size', type=int, default=25)
+parser.add_argument('--num-atoms', type=int, default=20)
+parser.add_argument('--num-cg-levels', type=int, default=2)
+parser.add_argument('--maxl', type=int, default=2)
+parser.add_argument('--num-channels', type=int, default=32)
+parser.add_argument('--num-threads', type=int, default=-1)
+parser.add_argument('--num-calibration', type=int, default=4)
+parser.add_argument('--num-valid', type=int, default=8)
+args = parser.parse_args()
+
+if args.num_threads > 0:
+    torch.set_num_threads(args.num_threads)
+
+num_species = 5
+
+
+def batch(seed):
+    torch.manual_seed(seed)
+    charges = torch.randint(1, num_species + 1, (args.batch_size, args.num_atoms))
+    atom_mask = torch.ones(args.batch_size, args.num_atoms, dtype=torch.bool)
+    return {'charges': charges,
+            'positions': 2 * torch.randn(args.batch_size, args.num_atoms, 3),
+            'one_hot': charges.unsqueeze(-1) == torch.arange(1, num_species + 1),
+            'atom_mask': atom_mask,
+            'edge_mask': atom_mask.unsqueeze(1) * atom_mask.unsqueeze(2),
+            'target': torch.zeros(args.batch_size)}
+
+
+torch.manual_seed(0)
+model = CormorantQM9(args.maxl, args.maxl, args.num_cg_levels, args.num_channels, num_species,
+                     ['learn', 'hard'], 1.73, 1.73, 0.2, 'rand', 1., 2, (3, 3), num_species, False,
+                     'linear', 'linear', 1).eval()
+
+frozen = freeze(model)
+quantized = quantize(frozen, [batch(seed) for seed in range(args.num_calibration)])
+
+valid = [batch(seed) for seed in range(1000, 1000 + args.num_valid)]
+report = quantization_report(frozen, quantized, valid, 'target')
+
+print('Threads: {}'.format(torch.get_num_threads()))
+print('float: {:.2f} ms/batch, int8: {:.2f} ms/batch ({:.2f}x)'.format(
+      1000 * report['latency_float'] / args.num_valid, 1000 * report['latency_int8'] / args.num_valid, report['speedup']))
+print('Mean absolute prediction: {:.4g}, largest difference: {:.4g}'.format(report['mae_float'], report['max_difference']))
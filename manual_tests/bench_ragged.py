@@ -0,0 +1,59 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from cormorant.data.dataset import ProcessedDataset, RaggedDataset
+from cormorant.data.ragged import convert_npz
+
+parser = argparse.ArgumentParser(description='Disk size and startup time of a dataset padded in a npz file, and in the ragged format.')
+parser.add_argument('--num-molecules', type=int, default=100000)
+parser.add_argument('--num-atoms', type=int, default=18)
+parser.add_argument('--max-atoms', type=int, default=200,
+                    help='Size of the single largest molecule, which sets the padding.')
+args = parser.parse_args()
+
+rng = np.random.default_rng(0)
+num_atoms = rng.integers(args.num_atoms // 2, args.num_atoms + 1, args.num_molecules)
+num_atoms[0] = args.max_atoms
+atom_mask = np.arange(args.max_atoms) < num_atoms[:, None]
+
+data = {'charges': rng.integers(1, 10, atom_mask.shape) * atom_mask,
+        'positions': (rng.standard_normal(atom_mask.shape + (3,)) * atom_mask[..., None]).astype(np.float32),
+        'num_atoms': num_atoms,
+        'U0': rng.standard_normal(args.num_molecules)}
+
+
+def rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, file)) for file in os.listdir(path))
+
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    npzfile, raggeddir = os.path.join(tmpdir, 'train.npz'), os.path.join(tmpdir, 'train')
+    np.savez_compressed(npzfile, **data)
+    convert_npz(npzfile, raggeddir)
+    del data
+
+    rss0 = rss()
+    t0 = time.perf_counter()
+    dataset = RaggedDataset(raggeddir)
+    print('ragged: {:.1f} MB on disk, {:.3f} s to open, +{:.0f} MB resident'.format(
+          size(raggeddir) / 2**20, time.perf_counter() - t0, (rss() - rss0) / 2**20))
+    del dataset
+
+    rss0 = rss()
+    t0 = time.perf_counter()
+    with np.load(npzfile) as f:
+        dataset = ProcessedDataset({key: torch.from_numpy(val) for key, val in f.items()})
+    print('npz: {:.1f} MB on disk, {:.3f} s to open, +{:.0f} MB resident'.format(
+          size(npzfile) / 2**20, time.perf_counter() - t0, (rss() - rss0) / 2**20))
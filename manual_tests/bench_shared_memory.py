@@ -0,0 +1,49 @@
+import argparse
+
+import torch
+from torch.utils.data import DataLoader
+
+from cormorant.data.collate import collate_fn
+from cormorant.data.dataset import ProcessedDataset
+from cormorant.data.utils import memory_usage, format_memory
+
+parser = argparse.ArgumentParser(description='Memory of the DataLoader workers with and without shared-memory datasets.')
+parser.add_argument('--num-molecules', type=int, default=100000)
+parser.add_argument('--max-atoms', type=int, default=29)
+parser.add_argument('--batch-size', type=int, default=100)
+parser.add_argument('--num-workers', type=int, default=2)
+parser.add_argument('--start-methods', type=str, nargs='*', default=['fork', 'spawn'])
+args = parser.parse_args()
+
+
+def build():
+    torch.manual_seed(0)
+    num_atoms = torch.randint(3, args.max_atoms + 1, (args.num_molecules,))
+    charges = torch.randint(1, 6, (args.num_molecules, args.max_atoms))
+    charges[torch.arange(args.max_atoms) >= num_atoms.unsqueeze(-1)] = 0
+    return ProcessedDataset({'charges': charges, 'positions': torch.randn(args.num_molecules, args.max_atoms, 3),
+                             'U0': torch.randn(args.num_molecules)}, included_species=torch.arange(1, 6))
+
+
+if __name__ == '__main__':
+    size = sum(val.nelement() * val.element_size() for val in build().data.values()) / 2**20
+    print('Dataset tensors: {:.1f} MB'.format(size))
+
+    for method in args.start_methods:
+        for shared in [False, True]:
+            dataset = build()
+            if shared:
+                dataset.share_memory()
+
+            loader = DataLoader(dataset, batch_size=args.batch_size, shuffle=True, num_workers=args.num_workers,
+                                collate_fn=collate_fn, multiprocessing_context=method)
+
+            # Memory of the workers at the end of an epoch
+            batches = iter(loader)
+            for idx, batch in enumerate(batches):
+                if idx == len(loader) - 1:
+                    usage = [memory_usage(worker.pid) for worker in batches._workers]
+            del batches
+
+            print('{}, {}: {}'.format(method, 'shared' if shared else 'not shared',
+                                      ' | '.join(format_memory(worker) for worker in usage)))
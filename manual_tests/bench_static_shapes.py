@@ -0,0 +1,60 @@
+import argparse
+import time
+
+import torch
+from torch.utils.data import DataLoader
+
+from cormorant.data.collate import collate_fn, StaticShapeCollate
+from cormorant.data.dataset import ProcessedDataset
+from cormorant.data.samplers import BucketBatchSampler
+from cormorant.models import CormorantQM9
+
+parser = argparse.ArgumentParser(description='Number of distinct batch shapes (and graph compilations) per epoch with and without static-shape padding.')
+parser.add_argument('--num-molecules', type=int, default=2000)
+parser.add_argument('--batch-size', type=int, default=25)
+parser.add_argument('--max-atoms', type=int, default=29)
+parser.add_argument('--atom-buckets', type=int, nargs='*', default=[12, 18, 23, 29])
+parser.add_argument('--compile', action='store_true',
+                    help='Also run a small model compiled with torch.compile(dynamic=False) over --num-batches batches.')
+parser.add_argument('--num-batches', type=int, default=20)
+args = parser.parse_args()
+
+num_species = 5
+
+torch.manual_seed(0)
+num_atoms = torch.randint(3, args.max_atoms + 1, (args.num_molecules,))
+charges = torch.randint(1, num_species + 1, (args.num_molecules, args.max_atoms))
+charges[torch.arange(args.max_atoms) >= num_atoms.unsqueeze(-1)] = 0
+dataset = ProcessedDataset({'charges': charges, 'positions': 2 * torch.randn(args.num_molecules, args.max_atoms, 3),
+                            'U0': torch.randn(args.num_molecules)}, included_species=torch.arange(1, num_species + 1))
+
+loaders = {
+    'dynamic': DataLoader(dataset, batch_size=args.batch_size, shuffle=True, collate_fn=collate_fn),
+    'bucketed': DataLoader(dataset, collate_fn=collate_fn,
+                           batch_sampler=BucketBatchSampler(dataset.atom_counts(), args.batch_size)),
+    'static': DataLoader(dataset, collate_fn=StaticShapeCollate(args.atom_buckets, batch_size=args.batch_size),
+                         batch_sampler=BucketBatchSampler(dataset.atom_counts(), args.batch_size, boundaries=args.atom_buckets)),
+}
+
+for name, loader in loaders.items():
+    shapes = {tuple(batch['charges'].shape) for batch in loader}
+    print('{}: {} distinct batch shapes per epoch'.format(name, len(shapes)))
+
+if args.compile:
+    from torch._dynamo.utils import counters
+
+    for name, loader in loaders.items():
+        torch._dynamo.reset()
+        counters.clear()
+
+        model = CormorantQM9(2, 2, 2, 4, num_species, ['hard', 'soft'], 2.5, 2.5, 0.4, 'rand', 1., 2, (3, 3),
+                             num_species, False, 'linear', 'linear', 1)
+        model.compile(dynamic=False)
+
+        t0 = time.perf_counter()
+        for idx, batch in enumerate(loader):
+            if idx >= args.num_batches:
+                break
+            model(batch).sum().backward()
+        print('{}: {} graph compilations, {:.1f} s for {} batches'.format(
+              name, counters['stats']['unique_graphs'], time.perf_counter() - t0, args.num_batches))
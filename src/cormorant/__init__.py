@@ -3,3 +3,4 @@ from cormorant import so3_lib
 from cormorant import data
 from cormorant import nn
 from cormorant import models
+from cormorant import inference
@@ -59,8 +59,8 @@ class CGModule(nn.Module):
         if dtype is None:
             self._dtype = torch.float
         else:
-            if not (dtype == torch.half or dtype == torch.float or dtype == torch.double):
-                raise ValueError('CG Module only takes internal data types of half/float/double. Got: {}'.format(dtype))
+            if not (dtype == torch.half or dtype == torch.bfloat16 or dtype == torch.float or dtype == torch.double):
+                raise ValueError('CG Module only takes internal data types of half/bfloat16/float/double. Got: {}'.format(dtype))
             self._dtype = dtype
 
     def _init_cg_dict(self, cg_dict, maxl):
@@ -78,8 +78,8 @@ class CGModule(nn.Module):
         """
         # If cg_dict is defined, check it has the right properties
         if cg_dict is not None:
-            if cg_dict.dtype != self.dtype:
-                raise ValueError('CGDict dtype ({}) not match CGModule() dtype ({})'.format(cg_dict.dtype, self.dtype))
+            if cg_dict.dtype != self.cg_dtype:
+                raise ValueError('CGDict dtype ({}) not match CGModule() dtype ({})'.format(cg_dict.dtype, self.cg_dtype))
 
             if cg_dict.device != self.device:
                 raise ValueError('CGDict device ({}) not match CGModule() device ({})'.format(cg_dict.device, self.device))
@@ -97,7 +97,7 @@ class CGModule(nn.Module):
         # If cg_dict is not defined, but
         elif cg_dict is None and maxl is not None:
 
-            self.cg_dict = CGDict(maxl=maxl, device=self.device, dtype=self.dtype)
+            self.cg_dict = CGDict(maxl=maxl, device=self.device, dtype=self.cg_dtype)
             self._maxl = maxl
 
         else:
@@ -112,6 +112,18 @@ class CGModule(nn.Module):
     def dtype(self):
         return self._dtype
 
+    @property
+    def cg_dtype(self):
+        """
+        Data type of the Clebsch-Gordan coefficients. Modules in bfloat16 keep
+        their coefficients, and the products and sums with them, in float.
+        """
+        return self._cg_dtype(self._dtype)
+
+    @staticmethod
+    def _cg_dtype(dtype):
+        return torch.float if dtype == torch.bfloat16 else dtype
+
     @property
     def maxl(self):
         return self._maxl
@@ -122,7 +134,7 @@ class CGModule(nn.Module):
         device, dtype, non_blocking = torch._C._nn._parse_to(*args, **kwargs)
 
         if self.cg_dict is not None:
-            self.cg_dict.to(device=device, dtype=dtype)
+            self.cg_dict.to(device=device, dtype=self._cg_dtype(dtype) if dtype is not None else None)
 
         if device is not None:
             self._device = device
@@ -169,6 +181,17 @@ class CGModule(nn.Module):
 
         return self
 
+    def bfloat16(self):
+        super().bfloat16()
+
+        # The CG coefficients are kept in float
+        if self.cg_dict is not None:
+            self.cg_dict.to(dtype=torch.float)
+
+        self._dtype = torch.bfloat16
+
+        return self
+
     def float(self):
         super().float()
 
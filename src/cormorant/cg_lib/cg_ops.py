@@ -74,7 +74,7 @@ class CGProduct(CGModule):
         else:
             self.minl = 0
 
-    def forward(self, rep1, rep2):
+    def forward(self, rep1, rep2, pairs=None):
         """
         Performs the Clebsch-Gordan product.
 
@@ -84,6 +84,8 @@ class CGProduct(CGModule):
             First :class:`SO3Vec` in the CG product
         rep2 : :class:`SO3Vec`
             Second :class:`SO3Vec` in the CG product
+        pairs : :class:`tuple` of :class:`torch.Tensor`, optional
+            Indices of the pairs to aggregate over. See :func:`cg_product`.
         """
         if self.tau1 and self.tau1 != SO3Tau.from_rep(rep1):
             raise ValueError('Input rep1 does not match predefined tau!')
@@ -91,7 +93,7 @@ class CGProduct(CGModule):
         if self.tau2 and self.tau2 != SO3Tau.from_rep(rep2):
             raise ValueError('Input rep2 does not match predefined tau!')
 
-        return cg_product(self.cg_dict, rep1, rep2, maxl=self.maxl, minl=self.minl, aggregate=self.aggregate, bounded=self.bounded, normalization=self.normalization)
+        return cg_product(self.cg_dict, rep1, rep2, maxl=self.maxl, minl=self.minl, aggregate=self.aggregate, bounded=self.bounded, normalization=self.normalization, pairs=pairs)
 
     @property
     def tau_out(self):
@@ -120,11 +122,16 @@ class CGProduct(CGModule):
                                  '{} {}'.format(self.tau1, self.tau2))
 
 
-def cg_product(cg_dict, rep1, rep2, maxl=inf, minl=0, aggregate=False, ignore_check=False, bounded=False, normalization='none'):
+def cg_product(cg_dict, rep1, rep2, maxl=inf, minl=0, aggregate=False, ignore_check=False, bounded=False, normalization='none', pairs=None):
     """
     Explicit function to calculate the Clebsch-Gordan product.
     See the documentation for CGProduct for more information.
 
+    Half and bfloat16 inputs, and all inputs under autocast, are multiplied
+    and accumulated in the precision of the Clebsch-Gordan coefficients. The
+    output is returned in the precision of the inputs, or in the autocast
+    precision if autocast is enabled.
+
     rep1 : list of :obj:`torch.Tensors`
         First :obj:`SO3Vector` in the CG product
     rep2 : list of :obj:`torch.Tensors`
@@ -142,6 +149,32 @@ def cg_product(cg_dict, rep1, rep2, maxl=inf, minl=0, aggregate=False, ignore_ch
     ignore_check : :obj:`bool`
         Ignore SO3Vec initialization check. Necessary for current implementation
         of :obj:`spherical_harmonics`. Use with caution.
+    pairs : :obj:`tuple` of :obj:`torch.Tensor`, optional
+        Indices ``(batch, i, j)`` of the pairs to aggregate over. Only used
+        with :aggregate=True:. In this case `rep1` has a single leading
+        dimension running over the pairs, and the aggregation is a sum over
+        the listed pairs instead of over all neighbors.
+    """
+    device_type = torch.device(cg_dict.device).type
+    autocast = torch.is_autocast_enabled(device_type)
+    low_precision = [part.dtype for part in list(rep1) + list(rep2) if part.dtype in (torch.half, torch.bfloat16)]
+
+    if not autocast and not low_precision:
+        return _cg_product(cg_dict, rep1, rep2, maxl, minl, aggregate, ignore_check, bounded, normalization, pairs)
+
+    out_dtype = torch.get_autocast_dtype(device_type) if autocast else low_precision[0]
+
+    rep1 = [part.to(cg_dict.dtype) for part in rep1]
+    rep2 = [part.to(cg_dict.dtype) for part in rep2]
+    with torch.autocast(device_type, enabled=False):
+        new_rep = _cg_product(cg_dict, rep1, rep2, maxl, minl, aggregate, ignore_check, bounded, normalization, pairs)
+
+    return SO3Vec([part.to(out_dtype) for part in new_rep], ignore_check=ignore_check)
+
+
+def _cg_product(cg_dict, rep1, rep2, maxl, minl, aggregate, ignore_check, bounded, normalization, pairs):
+    """
+    :func:`cg_product` for inputs in the precision of `cg_dict`.
     """
     tau1 = SO3Tau.from_rep(rep1)
     tau2 = SO3Tau.from_rep(rep2)
@@ -162,8 +195,12 @@ def cg_product(cg_dict, rep1, rep2, maxl=inf, minl=0, aggregate=False, ignore_ch
 
     new_rep = [[] for _ in range(maxL + 1)]
 
+    if aggregate and pairs is not None:
+        pair_batch, pair_i, pair_j = pairs
+        rep2_pairs = [part[pair_batch, pair_j] for part in rep2]
+
     for l1, part1 in zip(ells1, rep1):
-        for l2, part2 in zip(ells2, rep2):
+        for idx2, (l2, part2) in enumerate(zip(ells2, rep2)):
             lmin, lmax = max(abs(l1 - l2), minl), min(l1 + l2, maxL)
             if lmin > lmax:
                 continue
@@ -171,7 +208,11 @@ def cg_product(cg_dict, rep1, rep2, maxl=inf, minl=0, aggregate=False, ignore_ch
             cg_mat = cg_dict[(l1, l2)][:(lmax+1)**2 - (lmin)**2, :]
 
             # Loop over atom irreps accumulating each.
-            irrep_prod = complex_kron_product(part1, part2, aggregate=aggregate)
+            if aggregate and pairs is not None:
+                irrep_prod = complex_kron_product(part1, rep2_pairs[idx2])
+                irrep_prod = part2.new_zeros(part2.shape[:-3] + irrep_prod.shape[1:]).index_put((pair_batch, pair_i), irrep_prod, accumulate=True)
+            else:
+                irrep_prod = complex_kron_product(part1, part2, aggregate=aggregate)
             cg_decomp = torch.matmul(cg_mat, irrep_prod)
 
             split = [2*l+1 for l in range(lmin, lmax+1)]
@@ -279,7 +320,20 @@ def complex_kron_product(z1, z2, aggregate=False):
         # Aggregation is sum over aggregation sum dimension defined above
         z = z.sum(agg_sum_dim, keepdim=False)
 
-    zrot = torch.tensor([[1, 0], [0, 1], [0, 1], [-1, 0]], dtype=z.dtype, device=z.device)
-    z = torch.matmul(z, zrot)
+    z = torch.matmul(z, _zrot(z.dtype, z.device))
 
     return z
+
+
+_zrots = {}
+
+
+def _zrot(dtype, device):
+    """
+    Matrix combining the four products of real and imaginary parts into the
+    real and imaginary parts of the complex product. Cached per dtype and device.
+    """
+    key = (dtype, device)
+    if key not in _zrots:
+        _zrots[key] = torch.tensor([[1, 0], [0, 1], [0, 1], [-1, 0]], dtype=dtype, device=device)
+    return _zrots[key]
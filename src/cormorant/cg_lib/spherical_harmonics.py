@@ -59,8 +59,14 @@ class SphericalHarmonics(CGModule):
         sph_harms : :class:`list` of :class:`torch.Tensor`
             Output list of spherical harmonics from :math:`\ell=0` to :math:`\ell=maxl`
         """
-        return spherical_harmonics(self.cg_dict, pos, self.maxl,
-                                   self.normalize, self.conj, self.sh_norm)
+        # Positions and spherical harmonics are kept in the precision of the CG coefficients
+        sph_harms = spherical_harmonics(self.cg_dict, pos.to(self.cg_dtype), self.maxl,
+                                        self.normalize, self.conj, self.sh_norm)
+
+        if self.dtype != self.cg_dtype:
+            sph_harms = SO3Vec([part.to(self.dtype) for part in sph_harms])
+
+        return sph_harms
 
 
 class SphericalHarmonicsRel(CGModule):
@@ -132,8 +138,45 @@ class SphericalHarmonicsRel(CGModule):
         sph_harms : :class:`list` of :class:`torch.Tensor`
             Output matrix of spherical harmonics from :math:`\ell=0` to :math:`\ell=maxl`
         """
-        return spherical_harmonics_rel(self.cg_dict, pos1, pos2, self.maxl,
-                                       self.normalize, self.conj, self.sh_norm)
+        # Positions and spherical harmonics are kept in the precision of the CG coefficients
+        sph_harms, norms = spherical_harmonics_rel(self.cg_dict, pos1.to(self.cg_dtype), pos2.to(self.cg_dtype),
+                                                   self.maxl, self.normalize, self.conj, self.sh_norm)
+
+        if self.dtype != self.cg_dtype:
+            sph_harms, norms = SO3Vec([part.to(self.dtype) for part in sph_harms]), norms.to(self.dtype)
+
+        return sph_harms, norms
+
+    def from_batch(self, data, pos):
+        """
+        Spherical harmonics and norms of a batch, taken from the ``sph_harms``
+        and ``norms`` keys added by :class:`cormorant.data.collate.GeometryCollate`
+        when they are present, and computed from the positions otherwise.
+
+        Parameters
+        ----------
+        data : :class:`dict`
+            Batch of data.
+        pos : :class:`torch.Tensor`
+            Positions of the atoms of the batch.
+
+        Returns
+        -------
+        sph_harms : :class:`SO3Vec`
+            Spherical harmonics of the relative positions, from ``l=0`` to ``l=maxl``.
+        norms : :class:`torch.Tensor`
+            Matrix of the distances between atoms.
+        """
+        if 'norms' not in data:
+            return self(pos, pos)
+
+        norms = data['norms'].to(self.device, self.dtype)
+        if len(data.get('sph_harms', [])) > self.maxl:
+            sph_harms = SO3Vec([part.to(self.device, self.dtype) for part in data['sph_harms'][:self.maxl+1]])
+        else:
+            sph_harms, _ = self(pos, pos)
+
+        return sph_harms, norms
 
 
 def spherical_harmonics(cg_dict, pos, maxsh, normalize=True, conj=False, sh_norm='unit'):
@@ -1,3 +1,4 @@
 from cormorant.data.utils import initialize_datasets
 from cormorant.data.collate import collate_fn
 from cormorant.data.dataset import ProcessedDataset
+from cormorant.data.dataset import RaggedDataset
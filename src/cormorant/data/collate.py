@@ -1,5 +1,7 @@
 import torch
 
+from cormorant.cg_lib import SphericalHarmonicsRel
+
 
 def batch_stack(props):
     """
@@ -24,8 +26,15 @@ def batch_stack(props):
         return torch.tensor(props)
     elif props[0].dim() == 0:
         return torch.stack(props)
-    else:
+    elif all(prop.shape[1:] == props[0].shape[1:] for prop in props):
         return torch.nn.utils.rnn.pad_sequence(props, batch_first=True, padding_value=0)
+    else:
+        # Per-atom-pair properties of unpadded molecules differ in more than the first axis
+        shape = [max(sizes) for sizes in zip(*[prop.shape for prop in props])]
+        stacked = props[0].new_zeros([len(props)] + shape)
+        for idx, prop in enumerate(props):
+            stacked[(idx,) + tuple(slice(0, size) for size in prop.shape)] = prop
+        return stacked
 
 
 def drop_zeros(props, key, to_keep):
@@ -57,13 +66,36 @@ def drop_zeros(props, key, to_keep):
         return props[:, to_keep, ...]
 
 
+def unstack(batch):
+    """
+    Split a batch fetched by :meth:`cormorant.data.dataset.ProcessedDataset.__getitems__`
+    into a list of datapoints.
+
+    Parameters
+    ----------
+    batch : dict of Pytorch tensors
+        Properties of the datapoints, stacked along the first dimension.
+
+    Returns
+    -------
+    batch : list of datapoints
+        The datapoints.
+    """
+    num_mols = len(next(iter(batch.values())))
+    return [{key: val[idx] for key, val in batch.items()} for idx in range(num_mols)]
+
+
 def collate_fn(batch):
     """
     Collation function that collates datapoints into the batch format for cormorant
 
+    The datapoints can also be fetched as a single batch by
+    :meth:`cormorant.data.dataset.ProcessedDataset.__getitems__`, in which case
+    they are already stacked, and only the padding and masks are computed.
+
     Parameters
     ----------
-    batch : list of datapoints
+    batch : list of datapoints, or dict of Pytorch tensors
         The data to be collated.
 
     Returns
@@ -71,7 +103,8 @@ def collate_fn(batch):
     batch : dict of Pytorch tensors
         The collated data.
     """
-    batch = {prop: batch_stack([mol[prop] for mol in batch]) for prop in batch[0].keys()}
+    if not isinstance(batch, dict):
+        batch = {prop: batch_stack([mol[prop] for mol in batch]) for prop in batch[0].keys()}
 
     to_keep = (batch['charges'].sum(0) > 0)
 
@@ -86,63 +119,229 @@ def collate_fn(batch):
     return batch
 
 
-def collate_siamese(batch):
+class StaticShapeCollate:
     """
-    Collation function that collates datapoints into the batch format for cormorant
+    Collation function that pads batches to a small set of static shapes,
+    so that graph compilers (XLA, or :func:`torch.compile` with
+    ``dynamic=False``) only compile one graph per shape.
+
+    The atom dimension is padded up to the smallest of `atom_buckets` that
+    fits the largest molecule of the batch. If `batch_size` is given, smaller
+    batches are padded with copies of their last molecule, which are marked
+    as padding in the ``mol_mask`` key of the batch and must be left out of
+    the loss.
+
+    Parameters
+    ----------
+    atom_buckets : list of int
+        Sizes the atom dimension is padded to.
+    batch_size : int, optional
+        Size the batch dimension is padded to.
+    collate_fn : callable, optional
+        Collation function of the unpadded batch.
+    """
+    # Per-atom-pair properties, padded along both atom dimensions
+    pair_keys = ('edge_mask', 'bonds')
+
+    def __init__(self, atom_buckets, batch_size=None, collate_fn=collate_fn):
+        self.atom_buckets = sorted(atom_buckets)
+        self.batch_size = batch_size
+        self.collate_fn = collate_fn
+
+    def __call__(self, batch):
+        if isinstance(batch, dict):
+            num_mols = len(batch['charges'])
+            if self.batch_size is not None and num_mols < self.batch_size:
+                index = torch.arange(self.batch_size).clamp(max=num_mols - 1)
+                batch = {key: val[index] if torch.is_tensor(val) and val.dim() > 0 else val
+                         for key, val in batch.items()}
+        else:
+            num_mols = len(batch)
+            if self.batch_size is not None and num_mols < self.batch_size:
+                batch = batch + [batch[-1]] * (self.batch_size - num_mols)
+
+        batch = self.collate_fn(batch)
+
+        num_atoms = batch['charges'].shape[1]
+        sizes = [size for size in self.atom_buckets if size >= num_atoms]
+        if not sizes:
+            raise ValueError('Molecule with {} atoms is larger than the largest atom bucket {}!'.format(
+                             num_atoms, self.atom_buckets[-1]))
+        num_pad = sizes[0] - num_atoms
+
+        def pad(key, prop):
+            if not torch.is_tensor(prop) or prop.dim() < 2 or prop.shape[1] != num_atoms:
+                return prop
+            num_dims = 2 if key in self.pair_keys else 1
+            padding = [0, 0] * (prop.dim() - 1 - num_dims) + [0, num_pad] * num_dims
+            return torch.nn.functional.pad(prop, padding)
+
+        batch = {key: pad(key, prop) for key, prop in batch.items()}
+        batch['mol_mask'] = torch.arange(batch['charges'].shape[0]) < num_mols
+
+        return batch
+
+
+class GeometryCollate:
+    """
+    Collation function that also computes the geometry of the batch, so that
+    it is done in the DataLoader workers, in parallel with the training
+    step, rather than in the forward pass of the model.
+
+    The batch gets a ``norms`` key with the pairwise distances of the atoms,
+    and optionally a ``sph_harms`` key with the list of spherical harmonics
+    of the relative positions for each ``l``, as computed by the
+    :class:`cormorant.cg_lib.SphericalHarmonicsRel` of the models. If
+    `cutoff` is given, the batch also gets an ``edge_pairs`` key, with the
+    indices ``(batch, i, j)`` of the edges shorter than `cutoff`, and an
+    ``edge_cutoff`` key. Models with ``prune_edges`` use these edges when
+    the support of every cutoff of the network is within `cutoff`, and
+    recompute them otherwise.
+
+    Only the fixed geometry is computed here: everything that depends on the
+    parameters of the model (radial functions, learnable cutoffs) stays in
+    the forward pass. Forces computed by differentiating with respect to the
+    positions need the geometry to be computed by the model.
+
+    Parameters
+    ----------
+    maxl : int, optional
+        Compute the spherical harmonics up to ``maxl``, which must be at
+        least the largest ``max_sh`` of the model. If None, only the norms
+        are computed.
+    cutoff : float, optional
+        Largest length of the edges in ``edge_pairs``.
+    dtype : torch.dtype, optional
+        Data type of the geometry, which should be the data type of the
+        Clebsch-Gordan coefficients of the model.
+    collate_fn : callable, optional
+        Collation function of the batch.
+    """
+    def __init__(self, maxl=None, cutoff=None, dtype=torch.float, collate_fn=collate_fn):
+        self.maxl = maxl
+        self.cutoff = cutoff
+        self.dtype = dtype
+        self.collate_fn = collate_fn
+
+        self.sph_harms = None
+        if maxl is not None:
+            self.sph_harms = SphericalHarmonicsRel(maxl, conj=True, device=torch.device('cpu'), dtype=dtype)
+
+    def __call__(self, batch):
+        batch = self.collate_fn(batch)
+
+        positions = batch['positions'].to(self.dtype)
+        if self.sph_harms is not None:
+            sph_harms, norms = self.sph_harms(positions, positions)
+            batch['sph_harms'] = list(sph_harms)
+        else:
+            norms = (positions.unsqueeze(-2) - positions.unsqueeze(-3)).norm(dim=-1)
+        batch['norms'] = norms
+
+        if self.cutoff is not None:
+            edges = batch['edge_mask'].bool() & (norms < self.cutoff)
+            batch['edge_pairs'] = edges.nonzero().t()
+            batch['edge_cutoff'] = torch.tensor(self.cutoff, dtype=self.dtype)
+
+        return batch
+
+
+def stack_siamese(batch, keys=('charges', 'positions', 'species', 'one_hot', 'atom_mask', 'edge_mask')):
+    """
+    Stack the two structures of a collated siamese batch into a single batch,
+    so that both can be run through the network in one pass.
+
+    Parameters
+    ----------
+    batch : dict of Pytorch tensors
+        Batch collated by :func:`collate_siamese` or :func:`collate_activity`,
+        with keys such as ``charges1`` and ``charges2``.
+    keys : tuple of str, optional
+        Per-atom properties to stack, if they are in the batch.
+
+    Returns
+    -------
+    stacked : dict of Pytorch tensors
+        The stacked data, with keys such as ``charges``. The first half of the
+        batch dimension holds the first structures, and the second half holds
+        the second structures. Both halves are zero-padded to the same number
+        of atoms.
+    """
+    num_atoms = max(batch['charges1'].shape[1], batch['charges2'].shape[1])
+
+    def pad(prop, key):
+        num_pad = [0, num_atoms - prop.shape[1]]
+        # Pad the atom dimension(s), which follow the batch dimension
+        if key == 'edge_mask':
+            padding = [0, 0] * (prop.dim() - 3) + num_pad + num_pad
+        else:
+            padding = [0, 0] * (prop.dim() - 2) + num_pad
+        return torch.nn.functional.pad(prop, padding)
+
+    return {key: torch.cat([pad(batch[key + '1'], key), pad(batch[key + '2'], key)]) for key in keys
+            if key + '1' in batch}
+
+
+def split_pairs(batch, split_points, keys=('charges', 'positions', 'species', 'one_hot')):
+    """
+    Collate datapoints that each hold two structures stored one after the other
+    along the atom dimension into the batch format for siamese cormorant models.
 
     Parameters
     ----------
     batch : list of datapoints
         The data to be collated.
+    split_points : list of int
+        For each datapoint, the number of atoms stored for the first structure.
+    keys : tuple of str, optional
+        Per-atom properties to split into the two structures, if they are in the datapoints.
 
     Returns
     -------
     batch : dict of Pytorch tensors
-        The collated data.
+        The collated data, with keys such as ``charges1`` and ``charges2``.
+        Each structure is padded only to the largest structure of its own half.
+        Properties that are not per-atom (such as the label) are stacked as is,
+        and per-atom properties not listed in ``keys`` are dropped.
     """
+    num_atoms = batch[0]['charges'].shape[0]
+    per_atom = [prop for prop, val in batch[0].items()
+                if torch.is_tensor(val) and val.dim() > 0 and val.shape[0] == num_atoms]
+
+    new_batch = {prop: batch_stack([mol[prop] for mol in batch]) for prop in batch[0].keys()
+                 if prop not in per_atom}
+
+    keys = [key for key in keys if key in batch[0]]
 
-    batch = {prop: batch_stack([mol[prop] for mol in batch]) for prop in batch[0].keys()}
+    halves = [[slice(None, split) for split in split_points],
+              [slice(split, None) for split in split_points]]
 
-    assert batch['active'].shape[0] == 1
+    for idx, half in enumerate(halves, start=1):
+        props = {key: batch_stack([mol[key][part] for mol, part in zip(batch, half)]) for key in keys}
 
-    # The following assumes a batch size of 1
-    size_once = int(batch['charges'].shape[1]/2)
-    charges1 = batch['charges'][:,:size_once]
-    charges2 = batch['charges'][:,size_once:]
-    to_keep1 = (charges1.sum(0) > 0)
-    to_keep2 = (charges2.sum(0) > 0)
+        to_keep = (props['charges'].sum(0) > 0)
 
-    new_batch = {}
-    # Copy label data. TODO: Generalize to more labels and arbitrary label names!
-    new_batch['label'] = batch['label']
-    # Split structural data
-    new_batch['charges1']   = drop_zeros( batch['charges'][:,:size_once], to_keep1 )
-    new_batch['charges2']   = drop_zeros( batch['charges'][:,size_once:], to_keep2 )
-    new_batch['positions1'] = drop_zeros( batch['positions'][:,:size_once,:], to_keep1 )
-    new_batch['positions2'] = drop_zeros( batch['positions'][:,size_once:,:], to_keep2 )
-    new_batch['one_hot1']   = drop_zeros( batch['one_hot'][:,:size_once,:], to_keep1 )
-    new_batch['one_hot2']   = drop_zeros( batch['one_hot'][:,size_once:,:], to_keep2 )
+        for key, prop in props.items():
+            new_batch[key + str(idx)] = drop_zeros(prop, key, to_keep)
 
-    atom_mask1 = new_batch['charges1'] > 0
-    atom_mask2 = new_batch['charges2'] > 0
-    edge_mask1 = atom_mask1.unsqueeze(1) * atom_mask1.unsqueeze(2)
-    edge_mask2 = atom_mask2.unsqueeze(1) * atom_mask2.unsqueeze(2)
+        atom_mask = new_batch['charges' + str(idx)] > 0
+        edge_mask = atom_mask.unsqueeze(1) * atom_mask.unsqueeze(2)
 
-    new_batch['atom_mask1'] = atom_mask1
-    new_batch['atom_mask2'] = atom_mask2
-    new_batch['edge_mask1'] = edge_mask1
-    new_batch['edge_mask2'] = edge_mask2
+        new_batch['atom_mask' + str(idx)] = atom_mask
+        new_batch['edge_mask' + str(idx)] = edge_mask
 
     return new_batch
 
 
-def collate_activity(batch):
+def collate_siamese(batch):
     """
     Collation function that collates datapoints into the batch format for cormorant
 
+    Each datapoint holds two structures, each padded to half of the atom dimension.
+
     Parameters
     ----------
-    batch : list of datapoints
+    batch : list of datapoints, or dict of Pytorch tensors
         The data to be collated.
 
     Returns
@@ -150,39 +349,33 @@ def collate_activity(batch):
     batch : dict of Pytorch tensors
         The collated data.
     """
+    if isinstance(batch, dict):
+        batch = unstack(batch)
 
-    batch = {prop: batch_stack([mol[prop] for mol in batch]) for prop in batch[0].keys()}
+    split_points = [mol['charges'].shape[0] // 2 for mol in batch]
 
-    assert batch['active'].shape[0] == 1
+    return split_pairs(batch, split_points)
 
-    # The following assumes a batch size of 1 and 
-    # that all atoms of the active structure are saved first
-    size_once = int(batch['active'].sum())
-    charges1 = batch['charges'][:,:size_once]
-    charges2 = batch['charges'][:,size_once:]
-    to_keep1 = (charges1.sum(0) > 0)
-    to_keep2 = (charges2.sum(0) > 0)
 
-    new_batch = {}
-    # Copy label data. TODO: Generalize to more labels and arbitrary label names!
-    new_batch['label'] = batch['label']
-    # Split structural data
-    new_batch['charges1']   = drop_zeros( batch['charges'][:,:size_once], to_keep1 )
-    new_batch['charges2']   = drop_zeros( batch['charges'][:,size_once:], to_keep2 )
-    new_batch['positions1'] = drop_zeros( batch['positions'][:,:size_once,:], to_keep1 )
-    new_batch['positions2'] = drop_zeros( batch['positions'][:,size_once:,:], to_keep2 )
-    new_batch['one_hot1']   = drop_zeros( batch['one_hot'][:,:size_once,:], to_keep1 )
-    new_batch['one_hot2']   = drop_zeros( batch['one_hot'][:,size_once:,:], to_keep2 )
+def collate_activity(batch):
+    """
+    Collation function that collates datapoints into the batch format for cormorant
 
-    atom_mask1 = new_batch['charges1'] > 0
-    atom_mask2 = new_batch['charges2'] > 0
-    edge_mask1 = atom_mask1.unsqueeze(1) * atom_mask1.unsqueeze(2)
-    edge_mask2 = atom_mask2.unsqueeze(1) * atom_mask2.unsqueeze(2)
+    Each datapoint holds the active structure first, followed by the inactive one.
 
-    new_batch['atom_mask1'] = atom_mask1
-    new_batch['atom_mask2'] = atom_mask2
-    new_batch['edge_mask1'] = edge_mask1
-    new_batch['edge_mask2'] = edge_mask2
+    Parameters
+    ----------
+    batch : list of datapoints, or dict of Pytorch tensors
+        The data to be collated.
 
-    return new_batch
+    Returns
+    -------
+    batch : dict of Pytorch tensors
+        The collated data.
+    """
+    if isinstance(batch, dict):
+        batch = unstack(batch)
+
+    split_points = [int(mol['active'].sum()) for mol in batch]
 
+    return split_pairs(batch, split_points)
@@ -7,6 +7,33 @@ from math import inf
 
 import logging
 
+
+def charges_to_species(charges, included_species):
+    """
+    Species of each atom, as its index in `included_species` plus one. Padding
+    atoms, and atoms of species not in `included_species`, get ``0``.
+
+    Parameters
+    ----------
+    charges : tensor
+        Charges of the atoms.
+    included_species : tensor of scalars
+        Atomic species to include.
+
+    Returns
+    -------
+    species : tensor
+        Species index of each atom, as ``uint8`` (``int16`` for more than 254 species).
+    """
+    values, order = torch.as_tensor(included_species).to(charges.dtype).sort()
+
+    position = torch.searchsorted(values, charges).clamp(max=len(values) - 1)
+    found = values[position] == charges
+
+    dtype = torch.uint8 if len(values) < 255 else torch.int16
+    return torch.where(found, order[position] + 1, 0).to(dtype)
+
+
 class ProcessedDataset(Dataset):
     """
     Data structure for a pre-processed cormorant dataset.  Extends PyTorch Dataset.
@@ -65,15 +92,13 @@ class ProcessedDataset(Dataset):
                 data[key] -= data[key + '_thermo'].to(data[key].dtype)
 
         self.included_species = included_species
-        # One-hot encoding for charges
+        # Species index for charges, rather than a dense one-hot encoding
         charge_keys = []
         for key in self.data.keys():
             if 'charges' in key: charge_keys.append(key)
         for key in charge_keys:
-            nk = key.replace('charges', 'one_hot')
-            self.data[nk] = self.data[key].unsqueeze(-1) == included_species.unsqueeze(0).unsqueeze(0)
-#            self.data.pop(key, None)
-#        self.data['one_hot'] = self.data['charges'].unsqueeze(-1) == included_species.unsqueeze(0).unsqueeze(0)
+            nk = key.replace('charges', 'species')
+            self.data[nk] = charges_to_species(self.data[key], included_species)
         # Set parameters
         self.num_species = len(included_species)
         self.max_charge = max(included_species)
@@ -87,7 +112,8 @@ class ProcessedDataset(Dataset):
             self.perm = None
 
     def calc_stats(self):
-        self.stats = {key: (val.mean(), val.std()) for key, val in self.data.items() if type(val) is torch.Tensor and val.dim() == 1 and val.is_floating_point()}
+        # Missing labels (for instance in multi-target datasets) are stored as NaN, and ignored here
+        self.stats = {key: (val[~val.isnan()].mean(), val[~val.isnan()].std()) for key, val in self.data.items() if type(val) is torch.Tensor and val.dim() == 1 and val.is_floating_point()}
         print(self.stats)
 
     def convert_units(self, units_dict):
@@ -100,7 +126,117 @@ class ProcessedDataset(Dataset):
     def __len__(self):
         return self.num_pts
 
+    def share_memory(self):
+        """
+        Move the tensors of the dataset to shared memory, before the workers
+        of a :class:`torch.utils.data.DataLoader` are started.
+
+        Forked workers then map the same pages as the main process, rather
+        than relying on copy-on-write, and spawned workers receive a handle to
+        the shared memory rather than a pickled copy of the dataset.
+        """
+        for val in self.data.values():
+            if torch.is_tensor(val):
+                val.share_memory_()
+        if self.perm is not None:
+            self.perm.share_memory_()
+        return self
+
+    def _select(self, val):
+        """
+        Entries of a per-molecule tensor for the points of the dataset, in order.
+        """
+        return val[self.perm] if self.perm is not None else val[:self.num_pts]
+
+    def atom_counts(self):
+        """
+        Number of atoms of each molecule, for instance to batch molecules by size.
+        """
+        return self._select((self.data['charges'] > 0).sum(-1))
+
     def __getitem__(self, idx):
         if self.perm is not None:
             idx = self.perm[idx]
         return {key: val[idx] for key, val in self.data.items()}
+
+    def __getitems__(self, indices):
+        """
+        Fetch a batch of molecules at once, as called by the
+        :class:`torch.utils.data.DataLoader` with a list of indices.
+
+        Every property is sliced for all molecules with a single indexing
+        operation, rather than building a dictionary per molecule, and the
+        batch is returned as a dictionary of stacked tensors, which
+        :func:`cormorant.data.collate.collate_fn` collates without stacking.
+
+        Parameters
+        ----------
+        indices : list of int
+            Indices of the molecules.
+
+        Returns
+        -------
+        batch : dict of Pytorch tensors
+            Properties of the molecules, stacked along the first dimension.
+        """
+        index = torch.as_tensor(indices, dtype=torch.long)
+        if self.perm is not None:
+            index = self.perm[index]
+        return {key: val[index] if torch.is_tensor(val) else torch.tensor([val[idx] for idx in index.tolist()])
+                for key, val in self.data.items()}
+
+
+class RaggedDataset(ProcessedDataset):
+    """
+    Pre-processed cormorant dataset stored in the ragged on-disk format
+    (see :class:`cormorant.data.ragged.RaggedWriter`).
+
+    Per-molecule properties are held in memory, as in :class:`ProcessedDataset`.
+    Per-atom properties are memory-mapped and read when a molecule is accessed,
+    without padding, and the species index of the charges is built for that
+    molecule only.
+
+    Parameters
+    ----------
+    data : str or :class:`cormorant.data.ragged.RaggedData`
+        Directory of the dataset, or the opened dataset.
+    included_species : tensor of scalars, optional
+        Atomic species to include in the species index. If None, uses all species.
+    num_pts : int, optional
+        Desired number of points to include in the dataset.
+        Default value, -1, uses all of the datapoints.
+    normalize : bool, optional
+        ????? IS THIS USED?
+    shuffle : bool, optional
+        If true, shuffle the points in the dataset.
+    subtract_thermo : bool, optional
+        If True, subtracts the thermochemical energy of the atoms from each molecule in GDB9.
+        Does nothing for other datasets.
+    """
+    def __init__(self, data, included_species=None, num_pts=-1, normalize=True, shuffle=False, subtract_thermo=False):
+        from cormorant.data.ragged import RaggedData
+
+        self.store = RaggedData(data) if isinstance(data, str) else data
+
+        if included_species is None:
+            included_species = self.store.species
+
+        super().__init__(self.store.molecule_data(), included_species=included_species, num_pts=num_pts,
+                         normalize=normalize, shuffle=shuffle, subtract_thermo=subtract_thermo)
+
+    def atom_counts(self):
+        return self._select(torch.from_numpy(self.store.offsets).diff())
+
+    def __getitem__(self, idx):
+        if self.perm is not None:
+            idx = self.perm[idx]
+
+        item = {key: val[idx] for key, val in self.data.items()}
+        item.update(self.store.atom_data(int(idx)))
+        item['species'] = charges_to_species(item['charges'], self.included_species)
+
+        return item
+
+    def __getitems__(self, indices):
+        # Molecules are read from the memory maps one at a time, and stacked by the collate function
+        return [self[idx] for idx in indices]
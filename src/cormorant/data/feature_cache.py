@@ -0,0 +1,159 @@
+import torch
+import numpy as np
+from torch.utils.data import Dataset, DataLoader
+
+import json
+import logging
+import os
+
+from cormorant.data.collate import collate_fn
+
+logger = logging.getLogger(__name__)
+
+# Weights of the output layers, which are not part of the trunk
+OUTPUT_PREFIXES = ('output_layer',)
+
+
+def cache_features(model, dataset, path, batch_size=64, num_workers=0):
+    """
+    Compute the :class:`cormorant.nn.GetScalarsAtom` features of every
+    molecule of a dataset once, and store them in a memory-mapped array.
+
+    The features only depend on the trunk of the model, so the cache is
+    reused as long as the weights of the trunk do not change.
+
+    Parameters
+    ----------
+    model : :obj:`torch.nn.Module`
+        Model with a ``get_scalars_atom`` layer, with the pretrained trunk.
+    dataset : :obj:`ProcessedDataset`
+        Dataset to compute the features of.
+    path : :obj:`str`
+        Directory of the cache.
+    batch_size : :obj:`int`, optional
+        Number of molecules per forward pass.
+    num_workers : :obj:`int`, optional
+        Number of workers used to collate the molecules.
+
+    Returns
+    -------
+    features : :obj:`FeatureDataset`
+        Dataset of the cached features and the properties of each molecule.
+    """
+    from cormorant.inference.prediction_cache import model_hash
+
+    digest = model_hash(model, exclude=OUTPUT_PREFIXES)
+
+    metafile = os.path.join(path, 'meta.json')
+    if os.path.exists(metafile):
+        with open(metafile) as f:
+            meta = json.load(f)
+        if meta['model_hash'] == digest and meta['num_pts'] == len(dataset):
+            logger.info('Loading cached features from {}'.format(path))
+            return FeatureDataset(dataset, path)
+
+    logger.info('Caching the features of {} molecules to {}'.format(len(dataset), path))
+    os.makedirs(path, exist_ok=True)
+
+    num_atoms = np.array([int((dataset[idx]['charges'] > 0).sum()) for idx in range(len(dataset))])
+    offsets = np.concatenate([[0], np.cumsum(num_atoms)])
+    np.save(os.path.join(path, 'offsets.npy'), offsets)
+
+    captured = []
+    handle = model.get_scalars_atom.register_forward_hook(lambda module, inputs, output: captured.append(output))
+
+    training = model.training
+    model.eval()
+
+    features, start = None, 0
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers, collate_fn=collate_fn)
+    try:
+        with torch.no_grad():
+            for data in loader:
+                captured.clear()
+                model(data)
+
+                atom_scalars = captured[0]
+                atom_scalars = atom_scalars.view(atom_scalars.shape[0], atom_scalars.shape[1], -1)
+                atom_scalars = atom_scalars[data['atom_mask'].to(atom_scalars.device)]
+
+                if features is None:
+                    features = np.lib.format.open_memmap(os.path.join(path, 'features.npy'), mode='w+', dtype=np.float32,
+                                                         shape=(int(offsets[-1]), atom_scalars.shape[-1]))
+                features[start:start + len(atom_scalars)] = atom_scalars.float().cpu().numpy()
+                start += len(atom_scalars)
+    finally:
+        handle.remove()
+        model.train(training)
+
+    features.flush()
+    del features
+
+    with open(metafile, 'w') as f:
+        json.dump({'model_hash': digest, 'num_pts': len(dataset)}, f)
+
+    return FeatureDataset(dataset, path)
+
+
+class FeatureDataset(Dataset):
+    """
+    Cached atom features of a dataset, as written by :func:`cache_features`.
+
+    Each item contains the ``atom_features`` and ``charges`` of the atoms of a
+    molecule, and the properties of the molecule (for instance the learning
+    targets) from the original dataset. Items are collated by
+    :func:`cormorant.data.collate.collate_fn`.
+
+    Parameters
+    ----------
+    dataset : :obj:`ProcessedDataset`
+        Dataset the features were computed from.
+    path : :obj:`str`
+        Directory of the cache.
+    """
+    def __init__(self, dataset, path):
+        self.dataset = dataset
+        self.path = path
+
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'))
+        self.features = np.load(os.path.join(path, 'features.npy'), mmap_mode='r')
+
+    def __getstate__(self):
+        # Workers reopen the memory map, rather than receiving a copy of the features
+        return {'dataset': self.dataset, 'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['dataset'], state['path'])
+
+    def share_memory(self):
+        self.dataset.share_memory()
+        return self
+
+    @property
+    def stats(self):
+        return self.dataset.stats
+
+    @property
+    def included_species(self):
+        return self.dataset.included_species
+
+    @property
+    def num_pts(self):
+        return len(self)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def atom_counts(self):
+        return torch.from_numpy(self.offsets).diff()
+
+    def __getitem__(self, idx):
+        mol = self.dataset[idx]
+
+        item = {key: val for key, val in mol.items() if val.dim() == 0}
+
+        charges = mol['charges']
+        item['charges'] = charges[charges > 0]
+        item['atom_features'] = torch.from_numpy(np.array(self.features[self.offsets[idx]:self.offsets[idx+1]]))
+
+        return item
@@ -0,0 +1,141 @@
+import torch
+
+import queue
+import threading
+
+
+def to_device(data, device, non_blocking=False):
+    """
+    Move the tensors of a batch (including those in lists, tuples and dicts) to a device.
+    """
+    if torch.is_tensor(data):
+        return data.to(device, non_blocking=non_blocking)
+    elif isinstance(data, dict):
+        return {key: to_device(val, device, non_blocking) for key, val in data.items()}
+    elif isinstance(data, (list, tuple)):
+        return type(data)(to_device(val, device, non_blocking) for val in data)
+    return data
+
+
+def pin_memory(data):
+    """
+    Copy the tensors of a batch to page-locked memory, if they are not already.
+    """
+    if torch.is_tensor(data):
+        return data if data.is_pinned() else data.pin_memory()
+    elif isinstance(data, dict):
+        return {key: pin_memory(val) for key, val in data.items()}
+    elif isinstance(data, (list, tuple)):
+        return type(data)(pin_memory(val) for val in data)
+    return data
+
+
+def _record_stream(data, stream):
+    if torch.is_tensor(data):
+        data.record_stream(stream)
+    elif isinstance(data, dict):
+        for val in data.values():
+            _record_stream(val, stream)
+    elif isinstance(data, (list, tuple)):
+        for val in data:
+            _record_stream(val, stream)
+
+
+class DevicePrefetcher:
+    """
+    Wrapper of a :class:`torch.utils.data.DataLoader` that moves the next
+    batches to the device while the current training step runs.
+
+    A background thread takes batches from the loader, and copies the next
+    `depth` batches to `device`. On CUDA devices, the batches are copied from
+    page-locked memory on a side stream, and the stream of the training step
+    waits for the copy of a batch before using it. On other devices, the
+    thread overlaps loading and moving the batches with the training step.
+    With a `depth` of zero, each batch is loaded and moved when it is needed.
+
+    The wrapped loader is the ``_loader`` attribute, as for the device
+    loaders of ``torch_xla``, which is where the :class:`cormorant.engine.Engine`
+    looks for the dataset and the batch sampler.
+
+    Parameters
+    ----------
+    loader : :class:`torch.utils.data.DataLoader`
+        Loader of the batches.
+    device : :class:`torch.device`
+        Device to move the batches to.
+    depth : :obj:`int`, optional
+        Number of batches moved ahead of the training step.
+    """
+    def __init__(self, loader, device, depth=2):
+        self._loader = loader
+        self.device = torch.device(device)
+        self.depth = depth
+
+    def __len__(self):
+        return len(self._loader)
+
+    @property
+    def dataset(self):
+        return self._loader.dataset
+
+    @property
+    def batch_sampler(self):
+        return self._loader.batch_sampler
+
+    def __iter__(self):
+        if self.depth <= 0:
+            for data in self._loader:
+                yield to_device(data, self.device)
+            return
+
+        cuda = self.device.type == 'cuda'
+        stream = torch.cuda.Stream(self.device) if cuda else None
+
+        batches = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+
+        def put(item):
+            # Give up if the consumer stopped iterating
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def prefetch():
+            try:
+                for data in self._loader:
+                    if cuda:
+                        with torch.cuda.stream(stream):
+                            data = to_device(pin_memory(data), self.device, non_blocking=True)
+                            event = torch.cuda.Event()
+                            event.record(stream)
+                    else:
+                        data, event = to_device(data, self.device), None
+                    if not put((data, event, None)):
+                        return
+                put((None, None, None))
+            except Exception as error:
+                put((None, None, error))
+
+        thread = threading.Thread(target=prefetch, daemon=True)
+        thread.start()
+
+        try:
+            while True:
+                data, event, error = batches.get()
+                if error is not None:
+                    raise error
+                if data is None:
+                    break
+                if cuda:
+                    current = torch.cuda.current_stream(self.device)
+                    current.wait_event(event)
+                    # The memory of the batch must not be reused before the training step is done with it
+                    _record_stream(data, current)
+                yield data
+        finally:
+            stop.set()
+            thread.join()
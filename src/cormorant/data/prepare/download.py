@@ -1,6 +1,7 @@
 import logging
 import os
 
+from cormorant.data.ragged import convert_npz, is_ragged
 from cormorant.data.prepare.md17 import download_dataset_md17
 from cormorant.data.prepare.qm9 import download_dataset_qm9
 
@@ -28,8 +29,13 @@ def prepare_dataset(datadir, dataset, suffix='', subset=None, splits=None, clean
     Returns
     -------
     datafiles : dict of strings
-        Dictionary of strings pointing to the files containing the data. 
+        Dictionary of strings pointing to the directories containing the data
+        of each split, in the ragged format (see :class:`cormorant.data.ragged.RaggedWriter`).
 
+    Notes
+    -----
+    Splits that were processed into padded ``.npz`` files are converted to
+    the ragged format the first time they are loaded.
     """
 
     # If datasets have subsets,
@@ -43,11 +49,17 @@ def prepare_dataset(datadir, dataset, suffix='', subset=None, splits=None, clean
     if splits is None: 
         splits = {'train':'train', 'valid':'valid', 'test':'test'}
     
-    # Assume one data file for each split
-    datafiles = {split: os.path.join(*(dataset_dir + [splits[split] + '.npz'])) for split in splits.keys()}
+    # Assume one data directory for each split
+    datafiles = {split: os.path.join(*(dataset_dir + [splits[split]])) for split in splits.keys()}
     print(datafiles)
+
+    # Convert splits processed into padded npz files
+    for datafile in datafiles.values():
+        if not is_ragged(datafile) and os.path.exists(datafile + '.npz') and not force_download:
+            convert_npz(datafile + '.npz', datafile)
+
     # Check datafiles exist
-    datafiles_checks = [os.path.exists(datafile) for datafile in datafiles.values()]
+    datafiles_checks = [is_ragged(datafile) for datafile in datafiles.values()]
 
     # Check if prepared dataset exists, and if not set flag to download below.
     # Probably should add more consistency checks, such as number of datapoints, etc...
@@ -112,6 +124,9 @@ def prepare_dataset(datadir, dataset, suffix='', subset=None, splits=None, clean
         elif dataset.lower().startswith('fup'):
             raise NotImplementedError(
                 'Download of FUP datasets currently not implemented!')
+        elif dataset.lower().startswith('adme'):
+            raise NotImplementedError(
+                'Download of multi-target ADME datasets currently not implemented!')
         else:
             raise ValueError(
                 'Incorrect choice of dataset! Must chose qm9/md17!')
@@ -7,6 +7,7 @@ import torch
 import logging, os, urllib
 
 from cormorant.data.prepare.utils import download_data, is_int, cleanup_file
+from cormorant.data.ragged import write_ragged
 
 md17_base_url = 'http://quantum-machine.org/gdml/data/npz/'
 
@@ -75,8 +76,8 @@ def download_dataset_md17(datadir, dataname, subset, splits=None, cleanup=True):
     # Save processed GDB9 data into train/validation/test splits
     logging.info('Saving processed data:')
     for split, data_split in md17_data_split.items():
-        savefile = join(md17dir, split + '.npz')
-        np.savez_compressed(savefile, **data_split)
+        savefile = join(md17dir, split)
+        write_ragged(data_split, savefile)
 
     cleanup_file(md17_data_npz, cleanup)
 
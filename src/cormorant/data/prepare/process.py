@@ -1,9 +1,17 @@
+import collections
+import contextlib
+import io
+import itertools
 import logging
+import multiprocessing
 import os
 import torch
 import tarfile
+import time
 from torch.nn.utils.rnn import pad_sequence
 
+from cormorant.data.ragged import RaggedWriter
+
 charge_dict = {'H': 1, 'C': 6, 'N': 7, 'O': 8, 'F': 9}
 
 
@@ -33,16 +41,158 @@ def split_dataset(data, split_idxs):
 # def save_database()
 
 
-def process_xyz_files(data, process_file_fn, file_ext=None, file_idx_list=None, stack=True):
+def _read_files(data, file_ext=None, file_idx_list=None):
+    """
+    Read the files of a directory or tarball one after the other, in order,
+    and yield the index and the raw contents of each file.
+    """
+    keep = None if file_idx_list is None else set(int(idx) for idx in file_idx_list)
+
+    if tarfile.is_tarfile(data):
+        # Members are read as the archive is decompressed, rather than listed first and extracted later
+        with tarfile.open(data, 'r') as tardata:
+            idx = 0
+            for member in tardata:
+                if not member.isfile() or (file_ext is not None and not member.name.endswith(file_ext)):
+                    continue
+                if keep is None or idx in keep:
+                    yield idx, tardata.extractfile(member).read()
+                idx += 1
+
+    elif os.path.isdir(data):
+        files = sorted(os.listdir(data))
+        if file_ext is not None:
+            files = [file for file in files if file.endswith(file_ext)]
+        for idx, file in enumerate(files):
+            if keep is None or idx in keep:
+                with open(os.path.join(data, file), 'rb') as openfile:
+                    yield idx, openfile.read()
+
+    else:
+        raise ValueError('Can only read from directory or tarball archive!')
+
+
+def _process_chunk(process_file_fn, chunk):
+    """
+    Process the raw contents of a chunk of files. Runs in the worker processes.
+    """
+    molecules = [process_file_fn(io.BytesIO(raw)) for raw in chunk]
+    # Numpy arrays are pickled back to the main process, rather than moved to shared memory as tensors
+    return [{key: val.numpy() for key, val in mol.items()} for mol in molecules]
+
+
+def iter_xyz_files(data, process_file_fn, file_ext=None, file_idx_list=None, num_workers=0, chunk_size=256,
+                   log_every=10000):
+    """
+    Process a set of datafiles one at a time, as they are read.
+
+    With `num_workers` > 0, the files are read in the main process and sent in
+    chunks to a pool of worker processes that run `process_file_fn`. Only a few
+    chunks per worker are in flight at a time, and molecules are yielded in the
+    order of the files, whatever the order in which the workers finish.
+
+    Parameters
+    ----------
+    data : str
+        Complete path to datafiles. Files must be in a directory or tarball.
+    process_file_fn : callable
+        Function to process files, as for :func:`process_xyz_files`. Must be
+        defined at the top level of a module, so that it can be sent to the workers.
+    file_ext : str, optional
+        Optionally add a file extension if multiple types of files exist.
+    file_idx_list : list of int, optional
+        Indices of the files to process, for example, when constructing a train/valid/test split.
+    num_workers : int, optional
+        Number of worker processes. If 0, files are processed in the main process.
+    chunk_size : int, optional
+        Number of files sent to a worker at a time.
+    log_every : int, optional
+        Log the progress and throughput every `log_every` files.
+
+    Yields
+    ------
+    idx : int
+        Index of the file.
+    molecule : dict
+        Dictionary of properties of the molecule, as returned by `process_file_fn`.
+    """
+    files = _read_files(data, file_ext=file_ext, file_idx_list=file_idx_list)
+    start = time.perf_counter()
+
+    def log_progress(count):
+        elapsed = time.perf_counter() - start
+        logging.info('Processed {} files in {:.1f} s ({:.0f} files/s)'.format(count, elapsed, count / max(elapsed, 1e-9)))
+
+    if num_workers > 0:
+        def chunks():
+            while True:
+                chunk = list(itertools.islice(files, chunk_size))
+                if not chunk:
+                    return
+                yield [idx for idx, _ in chunk], [raw for _, raw in chunk]
+
+        def processed(pool):
+            pending = collections.deque()
+            for idxs, raws in chunks():
+                pending.append((idxs, pool.apply_async(_process_chunk, (process_file_fn, raws))))
+                # Bound the number of chunks in flight, and return them in order
+                if len(pending) >= 2 * num_workers:
+                    idxs, result = pending.popleft()
+                    yield from zip(idxs, result.get())
+            while pending:
+                idxs, result = pending.popleft()
+                yield from zip(idxs, result.get())
+
+        with multiprocessing.Pool(num_workers) as pool:
+            count = 0
+            for idx, molecule in processed(pool):
+                yield idx, {key: torch.from_numpy(val) for key, val in molecule.items()}
+                count += 1
+                if count % log_every == 0:
+                    log_progress(count)
+    else:
+        count = 0
+        for idx, raw in files:
+            yield idx, process_file_fn(io.BytesIO(raw))
+            count += 1
+            if count % log_every == 0:
+                log_progress(count)
+
+    log_progress(count)
+
+
+def stack_molecules(molecules):
+    """
+    Convert a list of molecules to a dictionary of properties, padded and stacked.
+
+    Parameters
+    ----------
+    molecules : list of dict
+        Dictionaries of the properties of each molecule, each of which is a torch.tensor.
+
+    Returns
+    -------
+    molecules : dict
+        Dictionary of the padded and stacked properties.
+    """
+    # Check that all molecules have the same set of items in their dictionary:
+    props = molecules[0].keys()
+    assert all(props == mol.keys() for mol in molecules), 'All molecules must have same set of properties/keys!'
+
+    return {prop: pad_sequence([mol[prop] for mol in molecules], batch_first=True) if molecules[0][prop].dim() > 0
+            else torch.stack([mol[prop] for mol in molecules]) for prop in props}
+
+
+def process_xyz_files(data, process_file_fn, file_ext=None, file_idx_list=None, stack=True, num_workers=0):
     """
     Take a set of datafiles and apply a predefined data processing script to each
-    one. Data can be stored in a directory, tarfile, or zipfile. An optional
+    one. Data can be stored in a directory or tarfile. An optional
     file extension can be added.
 
     Parameters
     ----------
     data : str
-        Complete path to datafiles. Files must be in a directory, tarball, or zip archive.
+        Complete path to datafiles. Files must be in a directory or tarball.
     process_file_fn : callable
         Function to process files. Can be defined externally.
         Must input a file, and output a dictionary of properties, each of which
@@ -50,57 +200,96 @@ def process_xyz_files(data, process_file_fn, file_ext=None, file_idx_list=None,
         {'num_elements', 'charges', 'positions'}
     file_ext : str, optional
         Optionally add a file extension if multiple types of files exist.
-    file_idx_list : ?????, optional
+    file_idx_list : list of int, optional
         Optionally add a file filter to check a file index is in a
         predefined list, for example, when constructing a train/valid/test split.
     stack : bool, optional
-        ?????
+        If True, pad and stack the properties of the molecules into tensors.
+        Otherwise, return a list of tensors for each property.
+    num_workers : int, optional
+        Number of worker processes that parse the files (see :func:`iter_xyz_files`).
     """
     logging.info('Processing data file: {}'.format(data))
-    if tarfile.is_tarfile(data):
-        tardata = tarfile.open(data, 'r')
-        files = tardata.getmembers()
-
-        readfile = lambda data_pt: tardata.extractfile(data_pt)
-
-    elif os.is_dir(data):
-        files = os.listdir(data)
-        files = [os.path.join(data, file) for file in files]
-
-        readfile = lambda data_pt: open(data_pt, 'r')
-
-    else:
-        raise ValueError('Can only read from directory or tarball archive!')
-
-    # Use only files that end with specified extension.
-    if file_ext is not None:
-        files = [file for file in files if file.endswith(file_ext)]
-
-    # Use only files that match desired filter.
-    if file_idx_list is not None:
-        files = [file for idx, file in enumerate(files) if idx in file_idx_list]
-
-    # Now loop over files using readfile function defined above
-    # Process each file accordingly using process_file_fn
 
-    molecules = []
+    molecules = [molecule for _, molecule in iter_xyz_files(data, process_file_fn, file_ext=file_ext,
+                                                            file_idx_list=file_idx_list, num_workers=num_workers)]
 
-    for file in files:
-        with readfile(file) as openfile:
-            molecules.append(process_file_fn(openfile))
+    # If stacking is desireable, pad and then stack.
+    if stack:
+        return stack_molecules(molecules)
 
     # Check that all molecules have the same set of items in their dictionary:
     props = molecules[0].keys()
     assert all(props == mol.keys() for mol in molecules), 'All molecules must have same set of properties/keys!'
 
     # Convert list-of-dicts to dict-of-lists
-    molecules = {prop: [mol[prop] for mol in molecules] for prop in props}
+    return {prop: [mol[prop] for mol in molecules] for prop in props}
 
-    # If stacking is desireable, pad and then stack.
-    if stack:
-        molecules = {key: pad_sequence(val, batch_first=True) if val[0].dim() > 0 else torch.stack(val) for key, val in molecules.items()}
 
-    return molecules
+def write_xyz_files(data, process_file_fn, paths, splits=None, file_ext=None, transform=None, num_workers=0,
+                    batch_size=1000):
+    """
+    Process a set of datafiles, as in :func:`process_xyz_files`, and write
+    the molecules to ragged datasets as they are processed, rather than
+    holding the whole dataset in memory.
+
+    The files are read once, whatever the number of splits. The molecules of
+    each split are written in the order of the files, in padded batches of
+    `batch_size` molecules (see :class:`cormorant.data.ragged.RaggedWriter`).
+
+    Parameters
+    ----------
+    data : str
+        Complete path to datafiles. Files must be in a directory or tarball.
+    process_file_fn : callable
+        Function to process files (see :func:`iter_xyz_files`).
+    paths : dict
+        Directory to write each split to.
+    splits : dict, optional
+        Indices of the files of each split. If None, `paths` must have a
+        single split, which gets all of the files.
+    file_ext : str, optional
+        Optionally add a file extension if multiple types of files exist.
+    transform : callable, optional
+        Function applied to each padded batch before it is written, for
+        example to add the thermochemical energy of the molecules.
+    num_workers : int, optional
+        Number of worker processes that parse the files (see :func:`iter_xyz_files`).
+    batch_size : int, optional
+        Number of molecules written at a time.
+    """
+    logging.info('Processing data file: {}'.format(data))
+
+    if splits is None:
+        if len(paths) != 1:
+            raise ValueError('Splits must be given to write more than one split!')
+        split_of, file_idx_list = None, None
+    else:
+        split_of = {int(idx): split for split, idxs in splits.items() for idx in idxs}
+        file_idx_list = list(split_of)
+
+    with contextlib.ExitStack() as stack:
+        writers = {split: stack.enter_context(RaggedWriter(path)) for split, path in paths.items()}
+        batches = {split: [] for split in paths}
+        only_split = next(iter(paths))
+
+        def write(split):
+            batch = stack_molecules(batches[split])
+            if transform is not None:
+                batch = transform(batch)
+            writers[split].append(batch)
+            batches[split] = []
+
+        for idx, molecule in iter_xyz_files(data, process_file_fn, file_ext=file_ext, file_idx_list=file_idx_list,
+                                            num_workers=num_workers):
+            split = only_split if split_of is None else split_of[idx]
+            batches[split].append(molecule)
+            if len(batches[split]) >= batch_size:
+                write(split)
+
+        for split, batch in batches.items():
+            if batch:
+                write(split)
 
 
 def process_xyz_md17(datafile):
@@ -1,6 +1,7 @@
 import numpy as np
 import torch
 
+import functools
 import logging
 import os
 import urllib
@@ -8,14 +9,21 @@ import urllib
 from os.path import join as join
 import urllib.request
 
-from cormorant.data.prepare.process import process_xyz_files, process_xyz_gdb9
+from cormorant.data.prepare.process import process_xyz_gdb9, write_xyz_files
 from cormorant.data.prepare.utils import download_data, is_int, cleanup_file
 
 
-def download_dataset_qm9(datadir, dataname, splits=None, calculate_thermo=True, exclude=True, cleanup=True):
+def download_dataset_qm9(datadir, dataname, splits=None, calculate_thermo=True, exclude=True, cleanup=True,
+                         num_workers=None):
     """
     Download and prepare the QM9 (GDB9) dataset.
+
+    The xyz files are parsed by `num_workers` worker processes (all CPUs if
+    None), and written to the splits as they are parsed.
     """
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+
     # Define directory for which data will be output.
     gdb9dir = join(*[datadir, dataname])
 
@@ -39,26 +47,16 @@ def download_dataset_qm9(datadir, dataname, splits=None, calculate_thermo=True,
 #    if splits is None:
     splits = gen_splits_gdb9(gdb9dir, cleanup)
 
-    # Process GDB9 dataset, and return dictionary of splits
-    gdb9_data = {}
-    for split, split_idx in splits.items():
-        gdb9_data[split] = process_xyz_files(
-            gdb9_tar_data, process_xyz_gdb9, file_idx_list=split_idx, stack=True)
-
-    # Subtract thermochemical energy if desired.
+    # Thermochemical energy from GDB9 dataset, added to each batch of molecules as it is written
+    transform = None
     if calculate_thermo:
-        # Download thermochemical energy from GDB9 dataset, and then process it into a dictionary
         therm_energy = get_thermo_dict(gdb9dir, cleanup)
+        transform = functools.partial(add_thermo_targets, therm_energy_dict=therm_energy)
 
-        # For each of train/validation/test split, add the thermochemical energy
-        for split_idx, split_data in gdb9_data.items():
-            gdb9_data[split_idx] = add_thermo_targets(split_data, therm_energy)
-
-    # Save processed GDB9 data into train/validation/test splits
-    logging.info('Saving processed data:')
-    for split, data in gdb9_data.items():
-        savedir = join(gdb9dir, split+'.npz')
-        np.savez_compressed(savedir, **data)
+    # Process GDB9 dataset, and save processed data into train/validation/test splits
+    logging.info('Processing and saving data with {} workers:'.format(num_workers))
+    write_xyz_files(gdb9_tar_data, process_xyz_gdb9, {split: join(gdb9dir, split) for split in splits},
+                    splits=splits, transform=transform, num_workers=num_workers)
 
     logging.info('Processing/saving complete!')
 
@@ -213,9 +211,9 @@ def get_unique_charges(charges):
     Get count of each charge for each molecule.
     """
     # Create a dictionary of charges
-    charge_counts = {z: np.zeros(len(charges), dtype=np.int)
+    charge_counts = {z: np.zeros(len(charges), dtype=int)
                      for z in np.unique(charges)}
-    print(charge_counts.keys())
+    logging.debug(charge_counts.keys())
 
     # Loop over molecules, for each molecule get the unique charges
     for idx, mol_charges in enumerate(charges):
@@ -0,0 +1,215 @@
+import torch
+import numpy as np
+
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def _kind(val, num_atoms):
+    """
+    Kind of a padded array: per atom pair, per atom or per molecule.
+    """
+    if val.ndim >= 3 and val.shape[1] == val.shape[2] == num_atoms:
+        return 'pair'
+    elif val.ndim >= 2 and val.shape[1] == num_atoms:
+        return 'atom'
+    else:
+        return 'molecule'
+
+
+class RaggedWriter:
+    """
+    Writer of the ragged on-disk dataset format read by :class:`RaggedData`.
+
+    A dataset is stored in a directory, with one raw binary file per property.
+    Per-atom properties are stored as a flat array over the atoms of all
+    molecules, and per-atom-pair properties as a flat array over the atom
+    pairs of each molecule, so that no space is spent on padding. Per-molecule
+    properties are stored with one row per molecule. The number of atoms of
+    each molecule is stored in ``offsets.npy``, and the kind, type and shape
+    of each property in ``meta.json``.
+
+    Molecules are appended in padded batches, in the format returned by
+    :func:`cormorant.data.prepare.process_xyz_files`. The atoms of each
+    molecule are the entries with a non-zero charge, and must come before the
+    padding. Properties with a second dimension of the size of the atom
+    dimension of ``charges`` are per-atom properties, and properties with a
+    second and third dimension of that size are per-atom-pair properties.
+
+    Parameters
+    ----------
+    path : :obj:`str`
+        Directory to write the dataset to.
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+        self.keys = None
+        self.files = {}
+        self.num_atoms = []
+        self.species = set()
+
+    def append(self, data):
+        """
+        Append a batch of molecules.
+
+        Parameters
+        ----------
+        data : :obj:`dict`
+            Padded arrays (or tensors) of the properties of the molecules.
+        """
+        data = {key: val.numpy() if torch.is_tensor(val) else np.asarray(val) for key, val in data.items()}
+
+        if 'charges' not in data:
+            raise ValueError('The ragged format requires a charges property!')
+        if any('charges' in key for key in data if key != 'charges'):
+            raise ValueError('The ragged format only supports a single charges property!')
+
+        charges = data['charges']
+        atom_mask = charges > 0
+        num_atoms = atom_mask.sum(1)
+        if not (atom_mask == (np.arange(charges.shape[1]) < num_atoms[:, None])).all():
+            raise ValueError('The ragged format requires the atoms of each molecule to come before the padding!')
+
+        keys = {key: {'kind': _kind(val, charges.shape[1]), 'dtype': val.dtype.str}
+                for key, val in data.items()}
+        for key, val in data.items():
+            start = {'pair': 3, 'atom': 2, 'molecule': 1}[keys[key]['kind']]
+            keys[key]['shape'] = list(val.shape[start:])
+
+        if self.keys is None:
+            self.keys = keys
+            self.files = {key: open(os.path.join(self.path, key + '.bin'), 'wb') for key in keys}
+        elif keys != self.keys:
+            raise ValueError('All batches must have the same properties! {} {}'.format(self.keys, keys))
+
+        pair_mask = atom_mask[:, :, None] & atom_mask[:, None, :]
+        for key, val in data.items():
+            kind = keys[key]['kind']
+            rows = val[atom_mask] if kind == 'atom' else val[pair_mask] if kind == 'pair' else val
+            np.ascontiguousarray(rows).tofile(self.files[key])
+
+        self.num_atoms.append(num_atoms.astype(np.int64))
+        self.species.update(np.unique(charges[atom_mask]).tolist())
+
+    def close(self):
+        """
+        Write the offsets and metadata of the dataset.
+        """
+        for file in self.files.values():
+            file.close()
+
+        num_atoms = np.concatenate(self.num_atoms) if self.num_atoms else np.zeros(0, dtype=np.int64)
+        np.save(os.path.join(self.path, 'offsets.npy'), np.concatenate([[0], np.cumsum(num_atoms)]).astype(np.int64))
+
+        meta = {'num_pts': len(num_atoms), 'species': sorted(self.species), 'keys': self.keys or {}}
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            for file in self.files.values():
+                file.close()
+
+
+def write_ragged(data, path):
+    """
+    Write a dictionary of padded arrays in the ragged format. See :class:`RaggedWriter`.
+    """
+    with RaggedWriter(path) as writer:
+        writer.append(data)
+
+
+def convert_npz(npzfile, path):
+    """
+    Convert a padded ``.npz`` dataset file to the ragged format.
+    """
+    logger.info('Converting {} to the ragged format in {}'.format(npzfile, path))
+    with np.load(npzfile) as f:
+        write_ragged(dict(f.items()), path)
+
+
+def is_ragged(path):
+    """
+    Whether a directory holds a complete dataset in the ragged format.
+    """
+    return os.path.exists(os.path.join(path, 'meta.json'))
+
+
+class RaggedData:
+    """
+    Dataset in the ragged format written by :class:`RaggedWriter`.
+
+    Per-atom and per-atom-pair properties are memory-mapped, so that opening
+    a dataset is fast and only the molecules that are accessed are read.
+
+    Parameters
+    ----------
+    path : :obj:`str`
+        Directory of the dataset.
+    """
+    def __init__(self, path):
+        self.path = path
+
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+
+        self.keys = meta['keys']
+        self.num_pts = meta['num_pts']
+        self.species = torch.tensor(meta['species'], dtype=torch.long)
+
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'))
+        num_atoms = np.diff(self.offsets)
+        self.pair_offsets = np.concatenate([[0], np.cumsum(num_atoms**2)])
+
+        self.arrays = {}
+        for key, spec in self.keys.items():
+            num_rows = {'atom': self.offsets[-1], 'pair': self.pair_offsets[-1], 'molecule': self.num_pts}[spec['kind']]
+            shape, dtype = (int(num_rows),) + tuple(spec['shape']), np.dtype(spec['dtype'])
+            if num_rows > 0:
+                self.arrays[key] = np.memmap(os.path.join(path, key + '.bin'), dtype=dtype, mode='r', shape=shape)
+            else:
+                self.arrays[key] = np.zeros(shape, dtype=dtype)
+
+    def __getstate__(self):
+        # Workers reopen the memory maps, rather than receiving a copy of the arrays
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def __len__(self):
+        return self.num_pts
+
+    def molecule_data(self):
+        """
+        Per-molecule properties, as tensors in memory.
+        """
+        return {key: torch.from_numpy(np.array(self.arrays[key]))
+                for key, spec in self.keys.items() if spec['kind'] == 'molecule'}
+
+    def atom_data(self, idx):
+        """
+        Per-atom and per-atom-pair properties of a molecule, as tensors.
+        """
+        start, end = self.offsets[idx], self.offsets[idx+1]
+        num_atoms = end - start
+
+        data = {}
+        for key, spec in self.keys.items():
+            if spec['kind'] == 'atom':
+                data[key] = torch.from_numpy(np.array(self.arrays[key][start:end]))
+            elif spec['kind'] == 'pair':
+                rows = self.arrays[key][self.pair_offsets[idx]:self.pair_offsets[idx+1]]
+                data[key] = torch.from_numpy(np.array(rows)).view((num_atoms, num_atoms) + tuple(spec['shape']))
+
+        return data
@@ -0,0 +1,208 @@
+import torch
+from torch.utils.data import Sampler
+
+import logging
+from math import ceil
+
+logger = logging.getLogger(__name__)
+
+
+def padding_efficiency(num_atoms, batches):
+    """
+    Fraction of the collated atom and edge entries that are real atoms and
+    edges, rather than padding, for a set of batches.
+
+    Parameters
+    ----------
+    num_atoms : :obj:`torch.Tensor`
+        Number of atoms of each molecule of the dataset.
+    batches : iterable of :obj:`list` of :obj:`int`
+        Indices of the molecules of each batch.
+
+    Returns
+    -------
+    efficiency : :obj:`dict`
+        Efficiency of the ``atoms`` and of the ``edges``.
+    """
+    real_atoms, real_edges, padded_atoms, padded_edges = 0, 0, 0, 0
+    for batch in batches:
+        sizes = num_atoms[torch.as_tensor(batch)]
+        real_atoms += sizes.sum().item()
+        real_edges += (sizes**2).sum().item()
+        padded_atoms += len(sizes) * sizes.max().item()
+        padded_edges += len(sizes) * sizes.max().item()**2
+
+    return {'atoms': real_atoms / max(padded_atoms, 1), 'edges': real_edges / max(padded_edges, 1)}
+
+
+class BucketBatchSampler(Sampler):
+    """
+    Batch sampler that groups molecules of similar size, to limit the padding
+    added by :func:`cormorant.data.collate.collate_fn`.
+
+    Molecules are grouped into buckets of `bucket_width` consecutive atom
+    counts, or into the ranges of atom counts between consecutive
+    `boundaries`. Each epoch, the molecules in each bucket are shuffled, the buckets
+    are cut into batches in order of size, and the order of the batches is
+    shuffled.
+
+    Parameters
+    ----------
+    num_atoms : :obj:`torch.Tensor`
+        Number of atoms of each molecule, as returned by
+        :meth:`ProcessedDataset.atom_counts`.
+    batch_size : :obj:`int`
+        Number of molecules per batch.
+    bucket_width : :obj:`int`, optional
+        Range of atom counts grouped in a bucket.
+    boundaries : :obj:`list` of :obj:`int`, optional
+        Largest atom count of each bucket, for instance the atom dimensions
+        of :class:`cormorant.data.collate.StaticShapeCollate`. Overrides `bucket_width`.
+    shuffle : :obj:`bool`, optional
+        Shuffle the molecules and batches every epoch.
+    drop_last : :obj:`bool`, optional
+        Drop the last batch if it is smaller than `batch_size`.
+    seed : :obj:`int`, optional
+        Seed of the shuffling. Defaults to the torch seed.
+    """
+    def __init__(self, num_atoms, batch_size, bucket_width=2, boundaries=None, shuffle=True, drop_last=False, seed=None):
+        self.num_atoms = torch.as_tensor(num_atoms)
+        self.batch_size = batch_size
+        self.bucket_width = bucket_width
+        self.boundaries = None if boundaries is None else torch.tensor(sorted(boundaries))
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = torch.initial_seed() if seed is None else seed
+        self.epoch = 0
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.num_atoms) // self.batch_size
+        return ceil(len(self.num_atoms) / self.batch_size)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def batches(self, generator=None):
+        """
+        Batches of one epoch.
+        """
+        if self.shuffle:
+            order = torch.randperm(len(self.num_atoms), generator=generator)
+        else:
+            order = torch.arange(len(self.num_atoms))
+
+        # Stable sort of the shuffled molecules by bucket, so molecules are shuffled within each bucket
+        if self.boundaries is not None:
+            buckets = torch.searchsorted(self.boundaries, self.num_atoms[order])
+        else:
+            buckets = self.num_atoms[order] // self.bucket_width
+        order = order[torch.sort(buckets, stable=True).indices]
+
+        batches = self._split(order)
+
+        if self.shuffle:
+            batches = [batches[idx] for idx in torch.randperm(len(batches), generator=generator)]
+
+        return [batch.tolist() for batch in batches]
+
+    def _split(self, order):
+        """
+        Cut molecules sorted by bucket into batches.
+        """
+        batches = list(order.split(self.batch_size))
+        if self.drop_last and len(batches[-1]) < self.batch_size:
+            batches = batches[:-1]
+        return batches
+
+    def __iter__(self):
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        self.epoch += 1
+
+        yield from self.batches(generator)
+
+    def padding_efficiency(self):
+        """
+        Padding efficiency of an epoch (see :func:`padding_efficiency`).
+        """
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        return padding_efficiency(self.num_atoms, self.batches(generator))
+
+
+class AtomBudgetBatchSampler(BucketBatchSampler):
+    """
+    Batch sampler that packs molecules of similar size into batches of
+    roughly constant cost, rather than of a constant number of molecules.
+
+    The cost of a batch is the size of the batch after padding, either in
+    edges (number of molecules times the square of the largest number of
+    atoms), or in atoms (number of molecules times the largest number of
+    atoms). Molecules are ordered as in :class:`BucketBatchSampler`, and
+    batches are filled until the next molecule would exceed `budget`. A
+    molecule that exceeds the budget on its own gets a batch of its own.
+
+    The number of batches can change slightly from epoch to epoch.
+
+    Parameters
+    ----------
+    num_atoms : :obj:`torch.Tensor`
+        Number of atoms of each molecule, as returned by
+        :meth:`ProcessedDataset.atom_counts`.
+    budget : :obj:`int`
+        Largest cost of a batch.
+    cost : :obj:`str`, optional
+        Cost of a batch, ``'edges'`` or ``'atoms'``.
+    bucket_width : :obj:`int`, optional
+        Range of atom counts grouped in a bucket.
+    shuffle : :obj:`bool`, optional
+        Shuffle the molecules and batches every epoch.
+    seed : :obj:`int`, optional
+        Seed of the shuffling. Defaults to the torch seed.
+    """
+    # The Engine weighs the loss of each batch by its number of molecules
+    variable_batch_size = True
+
+    def __init__(self, num_atoms, budget, cost='edges', bucket_width=2, shuffle=True, seed=None):
+        if cost not in ['edges', 'atoms']:
+            raise ValueError('Incorrect choice of cost: {} (should be edges or atoms)'.format(cost))
+
+        super().__init__(num_atoms, None, bucket_width=bucket_width, shuffle=shuffle, seed=seed)
+
+        self.budget = budget
+        self.cost = cost
+        self._num_batches = {}
+
+    def __len__(self):
+        # Number of batches of the epoch in progress, or else of the next epoch
+        if self.epoch not in self._num_batches:
+            generator = torch.Generator()
+            generator.manual_seed(self.seed + self.epoch)
+            self._num_batches[self.epoch] = len(self.batches(generator))
+        return self._num_batches[self.epoch]
+
+    def __iter__(self):
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        batches = self.batches(generator)
+
+        self._num_batches = {self.epoch: len(batches)}
+        try:
+            yield from batches
+        finally:
+            self.epoch += 1
+
+    def _split(self, order):
+        power = 2 if self.cost == 'edges' else 1
+
+        batches, start, largest = [], 0, 0
+        for idx, num_atoms in enumerate(self.num_atoms[order].tolist()):
+            largest = max(largest, num_atoms)
+            if idx > start and (idx + 1 - start) * largest**power > self.budget:
+                batches.append(order[start:idx])
+                start, largest = idx, num_atoms
+        if start < len(order):
+            batches.append(order[start:])
+
+        return batches
@@ -3,9 +3,14 @@ import numpy as np
 
 import logging
 import os
+from multiprocessing.util import Finalize
 
 from torch.utils.data import DataLoader
-from cormorant.data.dataset import ProcessedDataset
+from cormorant.data.collate import collate_fn, StaticShapeCollate, GeometryCollate
+from cormorant.data.dataset import RaggedDataset
+from cormorant.data.prefetch import DevicePrefetcher
+from cormorant.data.samplers import BucketBatchSampler, AtomBudgetBatchSampler, padding_efficiency
+from cormorant.data.ragged import RaggedData
 from cormorant.data.prepare import prepare_dataset
 
 
@@ -26,8 +31,9 @@ def initialize_datasets(args, datadir, dataset, suffix='', subset=None, splits=N
         Which subset of a dataset to use.  Action is dependent on the dataset given.
         Must be specified if the dataset has subsets (i.e. MD17).  Otherwise ignored (i.e. GDB9).
     splits : str, optional
-        Dictionary with filenames for training, validation, and test set.
-        Keys must be 'train', 'valid', 'test'. Values must be file names without the '.npz' ending. 
+        Dictionary with directory names for training, validation, and test set.
+        Keys must be 'train', 'valid', 'test'. Padded datasets in files with
+        these names and a '.npz' ending are converted when first loaded.
     force_download : bool, optional
         If true, forces a fresh download of the dataset.
     subtract_thermo : bool, optional
@@ -58,15 +64,11 @@ def initialize_datasets(args, datadir, dataset, suffix='', subset=None, splits=N
     datafiles = prepare_dataset(
         datadir, dataset, suffix, subset, splits, force_download=force_download)
 
-    # Load downloaded/processed datasets
-    datasets = {}
-    for split, datafile in datafiles.items():
-        with np.load(datafile) as f:
-            datasets[split] = {key: torch.from_numpy(
-                val) for key, val in f.items()}
+    # Open downloaded/processed datasets. Per-atom properties are memory-mapped.
+    datasets = {split: RaggedData(datafile) for split, datafile in datafiles.items()}
 
     # Basic error checking: Check the training/test/validation splits have the same set of keys.
-    keys = [list(data.keys()) for data in datasets.values()]
+    keys = [list(data.keys) for data in datasets.values()]
     assert all([key == keys[0] for key in keys]
                ), 'Datasets must have same set of keys!'
 
@@ -74,7 +76,7 @@ def initialize_datasets(args, datadir, dataset, suffix='', subset=None, splits=N
     all_species = _get_species(datasets, ignore_check=ignore_check)
 
     # Now initialize MolecularDataset based upon loaded data
-    datasets = {split: ProcessedDataset(data, num_pts=num_pts.get(
+    datasets = {split: RaggedDataset(data, num_pts=num_pts.get(
         split, -1), included_species=all_species, subtract_thermo=subtract_thermo) for split, data in datasets.items()}
 
     # Now initialize MolecularDataset based upon loaded data
@@ -95,6 +97,185 @@ def initialize_datasets(args, datadir, dataset, suffix='', subset=None, splits=N
     return args, datasets, num_species, max_charge
 
 
+def init_dataloaders(args, datasets, collate_fn=collate_fn, device=None):
+    """
+    Initialize the dataloader of each split.
+
+    Parameters
+    ----------
+    args : dict
+        Dictionary of input arguments detailing the cormorant calculation.
+        With ``args.sampler == 'bucket'``, the training set is batched with a
+        :class:`cormorant.data.samplers.BucketBatchSampler`, and with
+        ``args.sampler == 'budget'``, with a
+        :class:`cormorant.data.samplers.AtomBudgetBatchSampler`. With
+        ``args.static_shapes``, every split is padded to static shapes with a
+        :class:`cormorant.data.collate.StaticShapeCollate`, and the training
+        set is batched by atom bucket. With ``args.num_workers > 0``, the
+        datasets are moved to shared memory before the workers start, and the
+        memory of each worker is logged at debug level. With ``args.precompute_geometry``, the
+        geometry of the batches is computed in the workers by a
+        :class:`cormorant.data.collate.GeometryCollate`.
+    datasets : dict
+        Dictionary of datasets, as returned by :func:`initialize_datasets`.
+    collate_fn : callable, optional
+        Collation function of the batches.
+    device : :class:`torch.device`, optional
+        If given, each loader is wrapped in a
+        :class:`cormorant.data.prefetch.DevicePrefetcher`, which moves the
+        next ``args.prefetch_depth`` batches to `device` in the background.
+
+    Returns
+    -------
+    dataloaders : dict
+        Dictionary of :class:`torch.utils.data.DataLoader` of each split.
+    """
+    atom_buckets = None
+    if getattr(args, 'static_shapes', False):
+        if args.sampler == 'budget':
+            raise ValueError('Static shapes need a fixed --batch-size, and cannot be used with --sampler budget!')
+        atom_buckets = args.atom_buckets or static_atom_buckets(datasets, args.num_atom_buckets)
+        logging.info('Padding batches of {} molecules to {} atoms'.format(args.batch_size, atom_buckets))
+        collate_fn = StaticShapeCollate(atom_buckets, batch_size=args.batch_size, collate_fn=collate_fn)
+
+    geometry = getattr(args, 'precompute_geometry', 'none')
+    if geometry not in ['none', 'norms', 'sph']:
+        raise ValueError('Incorrect choice of precompute_geometry: {} (should be none, norms or sph)'.format(geometry))
+    elif geometry != 'none' and not getattr(args, 'head_only', False):
+        maxl = max(args.max_sh) if geometry == 'sph' else None
+        dtype = torch.double if args.dtype == 'double' else torch.float
+        collate_fn = GeometryCollate(maxl=maxl, cutoff=getattr(args, 'geometry_cutoff', None),
+                                     dtype=dtype, collate_fn=collate_fn)
+
+    # Workers map the tensors of the datasets, rather than copying them
+    worker_init_fn = None
+    if args.num_workers > 0:
+        for dataset in datasets.values():
+            dataset.share_memory()
+        logging.debug('Main process: {}'.format(format_memory(memory_usage())))
+        worker_init_fn = log_worker_memory
+
+    dataloaders = {}
+    for split, dataset in datasets.items():
+        if split == 'train' and (args.sampler in ['bucket', 'budget'] or atom_buckets is not None):
+            num_atoms = dataset.atom_counts()
+            if atom_buckets is not None:
+                # Batches of molecules from the same bucket are padded the least
+                sampler = BucketBatchSampler(num_atoms, args.batch_size,
+                                             boundaries=atom_buckets, shuffle=args.shuffle)
+            elif args.sampler == 'bucket':
+                sampler = BucketBatchSampler(num_atoms, args.batch_size,
+                                             bucket_width=args.bucket_width, shuffle=args.shuffle)
+            else:
+                sampler = AtomBudgetBatchSampler(num_atoms, args.atom_budget, cost=args.budget_cost,
+                                                 bucket_width=args.bucket_width, shuffle=args.shuffle)
+                logging.info('Batches of at most {} {}: {} batches per epoch'.format(
+                             args.atom_budget, args.budget_cost, len(sampler)))
+
+            bucketed = sampler.padding_efficiency()
+            shuffled = padding_efficiency(num_atoms, torch.randperm(len(num_atoms)).split(args.batch_size))
+            logging.info('Bucketed batches: {:.1%} of atoms and {:.1%} of edges are not padding '
+                         '(random batches: {:.1%} and {:.1%})'.format(bucketed['atoms'], bucketed['edges'],
+                                                                     shuffled['atoms'], shuffled['edges']))
+
+            dataloaders[split] = DataLoader(dataset, batch_sampler=sampler,
+                                            num_workers=args.num_workers, collate_fn=collate_fn,
+                                            worker_init_fn=worker_init_fn)
+        elif args.sampler in ['random', 'bucket', 'budget']:
+            dataloaders[split] = DataLoader(dataset,
+                                            batch_size=args.batch_size,
+                                            shuffle=args.shuffle if (split == 'train') else False,
+                                            num_workers=args.num_workers,
+                                            collate_fn=collate_fn,
+                                            worker_init_fn=worker_init_fn)
+        else:
+            raise ValueError('Incorrect choice of sampler: {} (should be random, bucket or budget)'.format(args.sampler))
+
+    if device is not None:
+        depth = getattr(args, 'prefetch_depth', 2)
+        dataloaders = {split: DevicePrefetcher(loader, device, depth=depth) for split, loader in dataloaders.items()}
+
+    return dataloaders
+
+
+def memory_usage(pid='self'):
+    """
+    Memory of a process, in MB, read from ``/proc`` on Linux.
+
+    Parameters
+    ----------
+    pid : int or str, optional
+        Process to report on. Defaults to the current process.
+
+    Returns
+    -------
+    usage : dict
+        The ``resident`` memory, the ``proportional`` share of it (pages
+        shared with other processes are split between them), and the
+        ``private`` pages only mapped by this process, which include the pages
+        duplicated by copy-on-write after a fork. Empty if ``/proc`` is not
+        available.
+    """
+    fields = {'Rss': 'resident', 'Pss': 'proportional', 'Private_Clean': 'private', 'Private_Dirty': 'private'}
+
+    usage = {}
+    try:
+        with open('/proc/{}/smaps_rollup'.format(pid)) as f:
+            for line in f:
+                key, _, val = line.partition(':')
+                if key in fields:
+                    usage[fields[key]] = usage.get(fields[key], 0) + int(val.split()[0]) / 1024
+    except OSError:
+        pass
+
+    return usage
+
+
+def format_memory(usage):
+    return ', '.join('{} {:.1f} MB'.format(key, val) for key, val in usage.items()) or 'unknown memory'
+
+
+def log_worker_memory(worker_id):
+    """
+    DataLoader ``worker_init_fn`` that logs the memory of the worker at
+    debug level, when it starts and when it exits.
+    """
+    pid = os.getpid()
+
+    def log(when):
+        logging.debug('DataLoader worker {} (pid {}) at {}: {}'.format(worker_id, pid, when, format_memory(memory_usage())))
+
+    log('start')
+    Finalize(None, log, args=('exit',), exitpriority=0)
+
+
+def static_atom_buckets(datasets, num_buckets):
+    """
+    Atom dimensions to pad batches to, at evenly spaced quantiles of the
+    number of atoms of the molecules of the training set. The largest bucket
+    fits the largest molecule of every split.
+
+    Parameters
+    ----------
+    datasets : dict
+        Dictionary of datasets, as returned by :func:`initialize_datasets`.
+    num_buckets : int
+        Largest number of buckets.
+
+    Returns
+    -------
+    atom_buckets : list of int
+        Atom dimension of each bucket.
+    """
+    num_atoms = datasets['train'].atom_counts().double()
+    largest = max(dataset.atom_counts().max().item() for dataset in datasets.values())
+
+    quantiles = torch.arange(1, num_buckets, dtype=torch.double) / num_buckets
+    buckets = torch.quantile(num_atoms, quantiles).ceil().long().tolist()
+
+    return sorted(set(bucket for bucket in buckets if bucket < largest) | {int(largest)})
+
+
 def _get_species(datasets, ignore_check=False):
     """
     Generate a list of all species.
@@ -105,7 +286,7 @@ def _get_species(datasets, ignore_check=False):
     Parameters
     ----------
     datasets : dict
-        Dictionary of datasets.  Each dataset is a dict of arrays containing molecular properties.
+        Dictionary of datasets.  Each dataset is a :class:`cormorant.data.ragged.RaggedData`.
     ignore_check : bool
         Ignores/overrides checks to make sure every split includes every species included in the entire dataset
 
@@ -118,11 +299,7 @@ def _get_species(datasets, ignore_check=False):
     # Find the unique list of species in each dataset. 
     split_species = {}
     for split, ds in datasets.items():
-        si = []
-        for key in ds.keys():
-            if 'charges' in key: 
-                si.append(ds[key].unique(sorted=True))
-        split_species[split] = torch.cat(tuple(si)).unique(sorted=True)
+        split_species[split] = ds.species
     # Get a list of all species in the dataset across all splits
     all_species = torch.cat( tuple(split_species.values()) ).unique()
     # If zero charges (padded, non-existent atoms) are included, remove them
@@ -49,6 +49,26 @@ def setup_shared_args(parser):
     # Dataloader and randomness options
     parser.add_argument('--shuffle', action=BoolArg, default=True,
                         help='Shuffle minibatches.')
+    parser.add_argument('--sampler', type=str, default='random', metavar='str',
+                        help='Batching of the training set. (random | bucket: batch molecules of similar size | '
+                             'budget: batch molecules of similar size up to --atom-budget) (default: random)')
+    parser.add_argument('--bucket-width', type=int, default=2, metavar='N',
+                        help='Range of atom counts batched together with --sampler bucket or budget. (default: 2)')
+    parser.add_argument('--atom-budget', type=int, default=8000, metavar='N',
+                        help='Largest padded size of a batch with --sampler budget, in units of --budget-cost. (default: 8000)')
+    parser.add_argument('--budget-cost', type=str, default='edges', metavar='str',
+                        help='Cost of a batch with --sampler budget. (edges | atoms) (default: edges)')
+    parser.add_argument('--static-shapes', action=BoolArg, default=False,
+                        help='Pad batches to --batch-size molecules and a few atom sizes, to bound the number of compiled graphs. (default: False)')
+    parser.add_argument('--atom-buckets', type=int, nargs='*', default=[], metavar='N',
+                        help='Atom sizes batches are padded to with --static-shapes. (default: quantiles of the training set)')
+    parser.add_argument('--num-atom-buckets', type=int, default=4, metavar='N',
+                        help='Number of atom sizes, if --atom-buckets is not given. (default: 4)')
+    parser.add_argument('--precompute-geometry', type=str, default='none', metavar='str',
+                        help='Geometry computed by the collate function in the DataLoader workers instead of the model. '
+                             '(none | norms | sph: norms and spherical harmonics) (default: none)')
+    parser.add_argument('--geometry-cutoff', type=float, default=None, metavar='N',
+                        help='With --precompute-geometry and --prune-edges, also find the edges shorter than this in the workers. (default: None)')
     parser.add_argument('--seed', type=int, default=1, metavar='N',
                         help='Set random number seed. Set to -1 to set based upon clock.')
 
@@ -103,6 +123,9 @@ def setup_shared_args(parser):
     # Directory to place model predictions
     parser.add_argument('--predictdir', type=str, default='predict/',
                         help='Directory to place log and savefiles. (default: predict/)')
+    # Directory to place cached atom features
+    parser.add_argument('--featuredir', type=str, default='features/',
+                        help='Directory to place the atom features cached for --head-only. (default: features/)')
     # Directory to read and save data from
     parser.add_argument('--datadir', type=str, default='data/',
                         help='Directory to look up data from. (default: data/)')
@@ -132,10 +155,35 @@ def setup_shared_args(parser):
                         help='Use floats.')
     parser.add_argument('--double', dest='dtype', action='store_const', const='double',
                         help='Use doubles.')
+    parser.add_argument('--bf16', dest='dtype', action='store_const', const='bfloat16',
+                        help='Use bfloat16 mixed precision: float weights, bfloat16 activations and mixing, '
+                             'float CG products, spherical harmonics and normalizations.')
     parser.set_defaults(dtype='float')
 
     parser.add_argument('--num-workers', type=int, default=1,
                         help='Set number of workers in dataloader. (Default: 1)')
+    parser.add_argument('--prefetch-depth', type=int, default=2, metavar='N',
+                        help='Number of batches moved to the device in the background, ahead of the training step. (0 to disable) (default: 2)')
+
+    parser.add_argument('--prediction-cache', type=int, default=0, metavar='N',
+                        help='Number of predictions to cache in memory during evaluation. (0 to disable) (default: 0)')
+    parser.add_argument('--prediction-cache-path', type=str, default=None, metavar='str',
+                        help='File of the on-disk prediction cache. (default: None)')
+
+    parser.add_argument('--pretrained', type=str, default='', metavar='str',
+                        help='Checkpoint to initialize the model from before training. (default: (empty))')
+    parser.add_argument('--head-only', action=BoolArg, default=False,
+                        help='Freeze the trunk and only train the output layers, on atom features computed once. (default: False)')
+
+    parser.add_argument('--compile', action=BoolArg, default=False,
+                        help='Compile the model with torch.compile(dynamic=False), best combined with --static-shapes. (default: False)')
+
+    parser.add_argument('--checkpoint-levels', action=BoolArg, default=False,
+                        help='Recompute the activations of each CG level during the backward pass to reduce memory. (default: False)')
+    parser.add_argument('--parallel-levels', action=BoolArg, default=False,
+                        help='Run the independent CG aggregation and CG power in each atom level concurrently. (default: False)')
+    parser.add_argument('--num-threads', type=int, default=-1, metavar='N',
+                        help='Number of intra-op threads used by torch on the CPU. (-1 to use the torch default) (default: -1)')
 
     # Model options
     parser.add_argument('--num-cg-levels', type=int, default=4, metavar='N',
@@ -163,7 +211,9 @@ def setup_shared_args(parser):
                         type=float, default=0.2, nargs='*', metavar='N',
                         help='Width of SOFT cutoff in Angstroms (default: 0.2)')
     parser.add_argument('--cutoff-type', '--cutoff', type=str, default=['learn'], nargs='*', metavar='str',
-                        help='Types of cutoffs to include')
+                        help='Types of cutoffs to include (hard | soft | learn | learn_rad | learn_width | cos | poly | learn_cos | learn_poly)')
+    parser.add_argument('--prune-edges', action=BoolArg, default=False,
+                        help='Skip the edges outside of the support of compact (hard | cos | poly) cutoffs. (default: False)')
 
     parser.add_argument('--basis-set', '--krange', type=int, default=[3, 3], nargs=2, metavar='N',
                         help='Radial function basis set (m, n) size (default: [3, 3])')
@@ -186,6 +236,8 @@ def setup_shared_args(parser):
                         help='Concatenate the scalars from different \ell in the dot-product-matrix part of the edge network.')
     parser.add_argument('--target', type=str, default='',
                         help='Learning target for a dataset (such as qm9) with multiple options.')
+    parser.add_argument('--targets', type=str, nargs='*', default=[], metavar='str',
+                        help='Learning targets predicted together by a multi-target model (such as adme). Missing labels should be NaN.')
 
     parser.add_argument('--ignore-check', action=BoolArg, default=False,
                         help='override the condition that all datasets need the same atom species. Use with caution!')
@@ -226,6 +278,12 @@ def setup_argparse(dataset):
     elif dataset in ["mutation", "lep"]:
         parser.add_argument('--num_classes', type=int, default=2,
                             help='number of classes for the classification.')
+        parser.add_argument('--embedding-cache', type=float, default=0, metavar='MB',
+                            help='Memory budget in MB for caching the encoding of repeated structures during inference '
+                                 'or frozen-encoder training. (0 to disable) (default: 0)')
+        if dataset == "mutation":
+            parser.add_argument('--incremental', action=BoolArg, default=False,
+                                help='Only re-evaluate the mutant atoms within the receptive field of the mutation. (default: False)')
     # Other recognized datasets without additional options
     elif dataset in ["pdbbind", "esol", "freesolv", "lipophilicity", "aqsoldb", 
                      "herg", "pxr", "fassif"]:
@@ -237,6 +295,8 @@ def setup_argparse(dataset):
         pass
     elif dataset.lower().startswith('fup'):
         pass
+    elif dataset.lower().startswith('adme'):
+        pass
     else:
         raise ValueError("Dataset is not recognized.")
     return parser
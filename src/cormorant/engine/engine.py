@@ -4,9 +4,18 @@ import torch.optim as optim
 import torch.optim.lr_scheduler as sched
 
 import argparse, os, sys, pickle
+from contextlib import nullcontext
 from datetime import datetime
 from math import sqrt, inf, log, log2, exp, ceil
-from torch_xla.debug import profiler as xp
+
+# torch_xla is optional: without it, the Engine runs eagerly (or with torch.compile) on CPU/CUDA
+try:
+    import torch_xla.core.xla_model as xm
+    import torch_xla.debug.metrics as met
+    from torch_xla.debug import profiler as xp
+except ImportError:
+    xm = met = xp = None
+
 MAE = torch.nn.L1Loss()
 MSE = torch.nn.MSELoss()
 RMSE = lambda x, y : sqrt(MSE(x, y))
@@ -20,6 +29,16 @@ logger = logging.getLogger(__name__)
 torch.autograd.set_detect_anomaly(True)
 
 
+def masked_loss(loss_fn):
+    """
+    Wrap a loss function so that missing (NaN) targets are ignored.
+    """
+    def loss(predict, targets):
+        present = ~torch.isnan(targets)
+        return loss_fn(predict[present], targets[present])
+    return loss
+
+
 class Engine:
     """
     Class for both training and inference phasees of the Cormorant network.
@@ -29,18 +48,20 @@ class Engine:
     Roughly based upon TorchNet
     """
     def __init__(self, args, dataloaders, model, loss_fn, optimizer, scheduler, restart_epochs, device, dtype, 
-                 task='regression', clip_value=None, log_test=False):
+                 task='regression', clip_value=None, log_test=False, prediction_cache=None):
 
         self.args = args
         self.dataloaders = dataloaders
         self.model = model
-        self.loss_fn = loss_fn
+        # Not every target is known for every molecule in multi-target datasets
+        self.loss_fn = masked_loss(loss_fn) if task == 'multitarget' else loss_fn
         self.optimizer = optimizer
         self.scheduler = scheduler
         self.restart_epochs = restart_epochs
         self.clip_value = clip_value
         self.task = task
         self.log_test = log_test
+        self.prediction_cache = prediction_cache
 
         self.stats = dataloaders['train']._loader.dataset.stats
 
@@ -53,6 +74,140 @@ class Engine:
 
         self.device = device
         self.dtype = dtype
+        self.bf16 = getattr(args, 'dtype', None) == 'bfloat16'
+
+        self._checkpoint_memory_logged = False
+
+        # Shapes of the batches seen so far, each of which needs its own compiled graph
+        self._batch_shapes = set()
+
+    def _autocast(self):
+        """
+        Mixed precision context of the forward pass. With bfloat16 mixed
+        precision, the mixing layers run in bfloat16, while the CG products and
+        spherical harmonics keep running in the precision of the CG coefficients.
+        """
+        return torch.autocast(self.device.type, dtype=torch.bfloat16, enabled=self.bf16)
+
+    def _trace(self, name, step=False):
+        """
+        Profiler annotation of a step or region, if torch_xla is available.
+        """
+        if xp is None:
+            return nullcontext()
+        return xp.StepTrace(name) if step else xp.Trace(name)
+
+    def _optimizer_step(self):
+        if xm is None:
+            self.optimizer.step()
+        else:
+            xm.optimizer_step(self.optimizer)
+
+    def _mark_step(self):
+        if xm is not None:
+            xm.mark_step()
+
+    def _unpad(self, data, predict, targets):
+        """
+        Drop the molecules added to pad a batch to a static size
+        (see :class:`cormorant.data.collate.StaticShapeCollate`).
+        """
+        self._batch_shapes.add(tuple(data['charges'].shape))
+
+        if 'mol_mask' not in data:
+            return predict, targets
+
+        mol_mask = data['mol_mask'].to(predict.device)
+        return predict[mol_mask], targets[mol_mask]
+
+    def _num_compilations(self):
+        """
+        Number of graphs compiled so far, by torch_xla or by torch.compile.
+        """
+        if met is not None:
+            compile_time = met.metric_data('CompileTime')
+            return compile_time[0] if compile_time is not None else 0
+
+        from torch._dynamo.utils import counters
+        return counters['stats']['unique_graphs']
+
+    def _log_compilations(self):
+        logging.info('Batch shapes: {} distinct, {} graph compilations'.format(
+                     len(self._batch_shapes), self._num_compilations()))
+
+    def _checkpoint_modules(self):
+        """
+        Modules of the model that support checkpointing their CG levels.
+        """
+        return [module for module in self.model.modules() if hasattr(module, 'checkpoint_levels')]
+
+    def _activation_memory(self, data):
+        """
+        Measure the memory of a single forward/backward pass.
+
+        On CUDA devices this is the peak allocated memory. On other devices,
+        this is the total size of the tensors saved for the backward pass.
+        """
+        saved_bytes = [0]
+
+        def pack(tensor):
+            saved_bytes[0] += tensor.numel() * tensor.element_size()
+            return tensor
+
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats(self.device)
+            base_bytes = torch.cuda.memory_allocated(self.device)
+
+        with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor), self._autocast():
+            loss = self.loss_fn(self.model(data).to(self.dtype), self._get_target(data))
+        loss.backward()
+        self.optimizer.zero_grad()
+        self._mark_step()
+
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize()
+            return torch.cuda.max_memory_allocated(self.device) - base_bytes
+        else:
+            return saved_bytes[0]
+
+    def _log_checkpoint_memory(self, data):
+        """
+        Log the reduction in memory from checkpointing the CG levels,
+        measured once on the first training minibatch.
+        """
+        self._checkpoint_memory_logged = True
+
+        modules = self._checkpoint_modules()
+        checkpoint_levels = [module.checkpoint_levels for module in modules]
+        if not any(checkpoint_levels):
+            return
+
+        for module in modules:
+            module.checkpoint_levels = False
+        mem_full = self._activation_memory(data)
+
+        for module in modules:
+            module.checkpoint_levels = True
+        mem_ckpt = self._activation_memory(data)
+
+        for module, checkpoint in zip(modules, checkpoint_levels):
+            module.checkpoint_levels = checkpoint
+
+        description = 'peak memory' if self.device.type == 'cuda' else 'saved activation bytes'
+        logging.info('Level checkpointing {}: {:.1f} MB -> {:.1f} MB ({:.1f}% reduction)'.format(
+                     description, mem_full / 2**20, mem_ckpt / 2**20, 100 * (1 - mem_ckpt / max(mem_full, 1))))
+
+    def _log_embedding_cache(self):
+        """
+        Log the hit rate and the time saved by the embedding caches of the model.
+        """
+        for module in self.model.modules():
+            cache = getattr(module, 'embedding_cache', None)
+            if cache is None:
+                continue
+            logging.info('Embedding cache: {} hits, {} misses ({:.1f}% hit rate), {} entries ({:.1f} MB), {:.1f}s saved'.format(
+                         cache.hits, cache.misses, 100 * cache.hit_rate, len(cache), cache.num_bytes / 2**20, cache.time_saved))
 
     def _save_checkpoint(self, valid_mae):
         if not self.args.save: return
@@ -63,7 +218,9 @@ class Engine:
                      'scheduler_state': self.scheduler.state_dict(),
                      'epoch': self.epoch,
                      'minibatch': self.minibatch,
-                     'best_loss': self.best_loss}
+                     'best_loss': self.best_loss,
+                     'included_species': self.dataloaders['train']._loader.dataset.included_species,
+                     'stats': self.stats}
 
         if (valid_mae < self.best_loss):
             self.best_loss = save_dict['best_loss'] = valid_mae
@@ -158,7 +315,7 @@ class Engine:
             idx = restart_epochs.index(epoch)
             self.scheduler.T_max = restart_epochs[idx+1] - restart_epochs[idx]
             if self.args.lr_minibatch:
-                self.scheduler.T_max *= ceil(self.args.num_train / self.args.batch_size)
+                self.scheduler.T_max *= len(self.dataloaders['train'])
             self.scheduler.step(0)
 
     def _log_minibatch(self, batch_idx, loss, targets, predict, batch_t, epoch_t):
@@ -177,6 +334,18 @@ class Engine:
             # Define what to log
             log1, log2, log3 = sqrt(mini_batch_loss), self.mae, self.rmse
 
+        elif self.task == 'multitarget':
+            present = ~torch.isnan(targets)
+            mini_batch_mae = MAE(predict[present], targets[present])
+            mini_batch_rmse = RMSE(predict[present], targets[present])
+            if batch_idx == 0:
+                self.mae, self.rmse = mini_batch_mae, mini_batch_rmse
+            else:
+                alpha = self.args.alpha
+                self.mae = alpha * self.mae + (1 - alpha) * mini_batch_mae
+                self.rmse = alpha * self.rmse + (1 - alpha) * mini_batch_rmse
+            log1, log2, log3 = sqrt(mini_batch_loss), self.mae, self.rmse
+
         elif self.task == 'classification':
             mini_batch_crossent = CROSSENT(predict, targets)
             pred_class = predict.argmax(dim=-1)
@@ -211,8 +380,8 @@ class Engine:
             self.scheduler.step()
 
     def train(self):
-        server = xp.start_server(3924)
-        
+        server = xp.start_server(3924) if xp is not None else None
+
         epoch0 = self.epoch
         for epoch in range(epoch0, self.args.num_epoch):
             self.epoch = epoch
@@ -222,15 +391,13 @@ class Engine:
             self._warm_restart(epoch)
             self._step_lr_epoch()
 
-            import pdb
-            #pdb.set_trace()
             train_predict, train_targets = self.train_epoch()
             valid_predict, valid_targets = self.predict('valid')
 
             if self.log_test:
                 test_predict,  test_targets  = self.predict('test')
 
-            if self.task == 'regression':
+            if self.task in ['regression', 'multitarget']:
                 train_mae, train_rmse = self.log_predict(train_predict, train_targets, 'train', epoch=epoch)
                 valid_mae, valid_rmse = self.log_predict(valid_predict, valid_targets, 'valid', epoch=epoch)
                 self._save_checkpoint(valid_mae)
@@ -243,8 +410,10 @@ class Engine:
                 if self.log_test:
                     test_crossent,  test_accuracy  = self.log_predict(test_predict,  test_targets,  'test',  epoch=epoch)
             else:
-                raise ValueError('Improper choice of task! {} (should be either regression or classification)'.format(self.task))
+                raise ValueError('Improper choice of task! {} (should be either regression, multitarget or classification)'.format(self.task))
 
+            self._log_embedding_cache()
+            self._log_compilations()
             logging.info('Epoch {} complete!'.format(epoch+1))
 
     def _get_target(self, data):
@@ -257,6 +426,12 @@ class Engine:
         if self.task == 'classification':
             target_dtype = torch.long
 
+        if self.task == 'multitarget':
+            # One column for each target, normalized with the statistics of that target
+            targets = torch.stack([data[target] for target in self.args.targets], dim=-1).to(self.device, target_dtype)
+            mu, sigma = self._target_stats()
+            return (targets - mu.to(targets)) / sigma.to(targets)
+
         targets = data[self.args.target].to(self.device, target_dtype)
 
         if self.task == 'regression' and self.args.target in self.stats.keys():
@@ -265,48 +440,62 @@ class Engine:
 
         return targets
 
+    def _target_stats(self):
+        """
+        Mean and standard deviation of each target in a multi-target task.
+        """
+        mu = torch.stack([torch.as_tensor(self.stats[target][0]) for target in self.args.targets])
+        sigma = torch.stack([torch.as_tensor(self.stats[target][1]) for target in self.args.targets])
+        return mu, sigma
+
     def train_epoch(self):
         dataloader = self.dataloaders['train']
 
         current_idx, num_data_pts = 0, len(dataloader._loader.dataset)
 
-        if self.task == 'regression':
+        # With a variable number of molecules per batch, the loss of each batch is weighed by
+        # its number of molecules, so that every molecule has the same weight over an epoch
+        variable_batch_size = getattr(dataloader._loader.batch_sampler, 'variable_batch_size', False)
+
+        if self.task in ['regression', 'multitarget']:
             self.mae, self.rmse, self.batch_time = 0, 0, 0
         elif self.task == 'classification':
             self.crossent, self.accuracy, self.batch_time = 0, 0, 0
         else:
-            raise ValueError('Improper choice of task! {} (should be either regression or classification)'.format(self.task))
+            raise ValueError('Improper choice of task! {} (should be either regression, multitarget or classification)'.format(self.task))
         all_predict, all_targets = [], []
         sum_loss = 0
 
         self.model.train()
         epoch_t = datetime.now()
         for batch_idx, data in enumerate(dataloader):
-            with xp.StepTrace('ENN-TRAIN'):
+            with self._trace('ENN-TRAIN', step=True):
                 batch_t = datetime.now()
 
+                if not self._checkpoint_memory_logged:
+                    self._log_checkpoint_memory(data)
+
                 # Standard zero-gradient
                 self.optimizer.zero_grad()
                 
                 # Get targets and predictions
                 targets = self._get_target(data)
-                predict = self.model(data)
+                with self._autocast():
+                    predict = self.model(data).to(self.dtype)
+                predict, targets = self._unpad(data, predict, targets)
                 
                 # Calculate loss and backprop
                 loss = self.loss_fn(predict, targets)
-                with xp.Trace('loss_backward'):
-                    loss.backward()
+                weight = len(targets) * len(dataloader) / num_data_pts if variable_batch_size else 1.
+                with self._trace('loss_backward'):
+                    (loss * weight).backward()
                 
                 # Clip the gradient
                 if self.clip_value is not None:
                     torch.nn.utils.clip_grad_value_(self.model.parameters(), self.clip_value)
                 
                 # Step optimizer and learning rate
-                import torch_xla.core.xla_model as xm
-                # self.optimizer.step()
-                xm.optimizer_step(self.optimizer.step())
-                import pdb
-                #pdb.set_trace()
+                self._optimizer_step()
                 self._step_lr_batch()
                 
                 #targets, predict = targets.detach().cpu(), predict.detach().cpu()
@@ -317,7 +506,7 @@ class Engine:
                 self._log_minibatch(batch_idx, loss, targets, predict, batch_t, epoch_t)
                 
                 self.minibatch += 1
-                xm.mark_step()
+                self._mark_step()
 
         all_predict = torch.cat(all_predict)
         all_targets = torch.cat(all_targets)
@@ -332,13 +521,18 @@ class Engine:
         start_time = datetime.now()
         logging.info('Starting testing on {} set: '.format(set))
 
-        for batch_idx, data in enumerate(dataloader):
+        with torch.no_grad(), self._autocast():
+            for batch_idx, data in enumerate(dataloader):
 
-            targets = self._get_target(data)
-            predict = self.model(data).detach()
+                targets = self._get_target(data)
+                if self.prediction_cache is not None:
+                    predict = self.prediction_cache(self.model, data).detach().to(self.dtype)
+                else:
+                    predict = self.model(data).detach().to(self.dtype)
+                predict, targets = self._unpad(data, predict, targets)
 
-            all_targets.append(targets)
-            all_predict.append(predict)
+                all_targets.append(targets)
+                all_predict.append(predict)
 
         all_predict = torch.cat(all_predict)
         all_targets = torch.cat(all_targets)
@@ -346,6 +540,11 @@ class Engine:
         dt = (datetime.now() - start_time).total_seconds()
         logging.info(' Done! (Time: {}s)'.format(dt))
 
+        if self.prediction_cache is not None:
+            cache = self.prediction_cache
+            logging.info('Prediction cache: {} hits ({} from disk), {} misses ({:.1f}% hit rate)'.format(
+                         cache.hits, cache.disk_hits, cache.misses, 100 * cache.hit_rate))
+
         return all_predict, all_targets
 
     def log_predict(self, predict, targets, dataset, epoch=-1, description='Current'):
@@ -359,6 +558,20 @@ class Engine:
             mae_units = sigma*mae
             rmse_units = sigma*rmse
             log1, log2, log3, log4 = mae, rmse, mae_units, rmse_units
+        elif self.task == 'multitarget':
+            predict = predict.cpu().double()
+            targets = targets.cpu().double()
+            mu, sigma = self._target_stats()
+            maes, rmses = [], []
+            # Errors of each target, only over the molecules for which it is known
+            for idx, target in enumerate(self.args.targets):
+                present = ~torch.isnan(targets[:, idx])
+                maes.append(MAE(predict[present, idx], targets[present, idx]))
+                rmses.append(RMSE(predict[present, idx], targets[present, idx]))
+                logging.info('{} {}: MAE: {:8.4f} RMSE: {:8.4f}   w/units: {:8.4f} {:8.4f} ({} labels)'.format(
+                             dataset, target, maes[-1], rmses[-1], sigma[idx]*maes[-1], sigma[idx]*rmses[-1], int(present.sum())))
+            mae, rmse = sum(maes) / len(maes), sum(rmses) / len(rmses)
+            log1, log2, log3, log4 = mae, rmse, mae, rmse
         elif self.task == 'classification':
             predict = predict.cpu().double()
             targets = targets.cpu()
@@ -382,7 +595,7 @@ class Engine:
         if self.args.predict:
             file = self.args.predictfile + '.' + suffix + '.' + dataset + '.pt'
             logging.info('Saving predictions to file: {}'.format(file))
-            if self.task == 'regression':
+            if self.task in ['regression', 'multitarget']:
                 torch.save({'predict': predict, 'targets': targets, 'mu': mu, 'sigma': sigma}, file)
             else:
                 torch.save({'predict': predict, 'targets': targets}, file)
@@ -141,6 +141,9 @@ def init_file_paths(args):
     elif args.dataset.startswith('fup'):
        if not args.target:
             args.target = 'TRANSFORMED_ACTIVITY'
+    elif args.dataset.startswith('adme'):
+       if not args.targets:
+            raise ValueError('The adme dataset requires a list of --targets!')
     else:
         raise ValueError('Dataset not recognized!')
 
@@ -162,7 +165,9 @@ def init_file_paths(args):
 
 def init_optimizer(args, model):
 
-    params = {'params': model.parameters(), 'lr': args.lr_init, 'weight_decay': args.weight_decay}
+    # Frozen parameters (for instance the trunk with --head-only) are not optimized
+    params = {'params': [param for param in model.parameters() if param.requires_grad],
+              'lr': args.lr_init, 'weight_decay': args.weight_decay}
     params = [params]
 
     optim_type = args.optim.lower()
@@ -180,11 +185,13 @@ def init_optimizer(args, model):
 
     return optimizer
 
-def init_scheduler(args, optimizer):
+def init_scheduler(args, optimizer, minibatch_per_epoch=None):
     lr_init, lr_final = args.lr_init, args.lr_final
     lr_decay = min(args.lr_decay, args.num_epoch)
 
-    minibatch_per_epoch = ceil(args.num_train / args.batch_size)
+    # The number of batches of the training set, if not batched by --batch-size
+    if minibatch_per_epoch is None:
+        minibatch_per_epoch = ceil(args.num_train / args.batch_size)
     if args.lr_minibatch:
         lr_decay = lr_decay*minibatch_per_epoch
 
@@ -231,11 +238,66 @@ def init_cuda(args):
         logger.info('Beginning training on CPU!')
         device = torch.device('cpu')
 
+    if args.num_threads > 0:
+        logger.info('Setting number of intra-op threads to {}'.format(args.num_threads))
+        torch.set_num_threads(args.num_threads)
+
     if args.dtype == 'double':
         dtype = torch.double
     elif args.dtype == 'float':
         dtype = torch.float
+    elif args.dtype == 'bfloat16':
+        # Weights are kept in float, and the forward pass runs under bfloat16 autocast in the Engine
+        logger.info('Using bfloat16 mixed precision.')
+        dtype = torch.float
     else:
         raise ValueError('Incorrect data type chosen!')
 
     return device, dtype
+
+def load_pretrained(args, model):
+    """
+    Initialize the weights of a model from the checkpoint in ``args.pretrained``, if any.
+    """
+    if args.pretrained:
+        logger.info('Initializing model from pretrained checkpoint: {}'.format(args.pretrained))
+        checkpoint = torch.load(args.pretrained, map_location='cpu', weights_only=False)
+        model.load_state_dict(checkpoint['model_state'])
+
+    return model
+
+def init_head_only(args, model, datasets):
+    """
+    Freeze the trunk of a model and cache its atom features on every split,
+    so that only the output layers are trained (``--head-only``).
+
+    Parameters
+    ----------
+    args : :class:`Namespace`
+        Arguments of the run.
+    model : :class:`torch.nn.Module`
+        Model with the pretrained trunk.
+    datasets : :class:`dict`
+        Dataset of each split.
+
+    Returns
+    -------
+    model : :class:`cormorant.models.feature_head.FeatureHead`
+        Output layers of the model, applied to the cached features.
+    datasets : :class:`dict`
+        :class:`cormorant.data.feature_cache.FeatureDataset` of each split.
+    """
+    from cormorant.data.feature_cache import cache_features
+    from cormorant.models.feature_head import FeatureHead
+
+    featuredir = os.path.join(args.workdir, args.featuredir, args.prefix)
+
+    datasets = {split: cache_features(model, dataset, os.path.join(featuredir, split),
+                                      batch_size=args.batch_size, num_workers=args.num_workers)
+                for split, dataset in datasets.items()}
+
+    head = FeatureHead(model)
+    logger.info('Training the output layers only: {} trainable parameters'.format(
+        sum(param.numel() for param in head.parameters() if param.requires_grad)))
+
+    return head, datasets
@@ -0,0 +1,5 @@
+from cormorant.inference.prediction_cache import PredictionCache
+from cormorant.inference.predictor import Predictor, build_model
+from cormorant.inference.freeze import FrozenCormorant, freeze
+from cormorant.inference.fold import fold, fold_report, count_flops
+from cormorant.inference.quantize import quantize, quantization_report
@@ -0,0 +1,204 @@
+import torch
+import torch.nn as nn
+
+import copy
+import time
+from typing import List
+
+from torch.utils.flop_counter import FlopCounterMode
+
+from cormorant.inference.freeze import FrozenCormorant, _Buffer
+
+
+def fold(frozen):
+    """
+    Fold adjacent linear maps of a frozen model.
+
+    Two folds are applied:
+
+    - Unless the radial functions are mixed, the edge mixing of each level
+      applies one mixing matrix per weight to the same radial functions. These
+      matrices are stacked, so the radial functions are mixed with a single
+      matrix product for all weights.
+    - In an :class:`cormorant.nn.OutputPMLP`, the last linear layer of the
+      per-atom MLP, the masked sum over atoms, and the first linear layer of
+      the molecule MLP are all linear. They are folded into a single layer
+      applied after the sum.
+
+    Parameters
+    ----------
+    frozen : :obj:`FrozenCormorant`
+        Model returned by :func:`cormorant.inference.freeze`.
+
+    Returns
+    -------
+    folded : :obj:`FrozenCormorant`
+        Folded copy of `frozen`. The predictions agree up to floating point
+        rounding.
+    """
+    if not isinstance(frozen, FrozenCormorant):
+        raise ValueError('Can only fold a FrozenCormorant, got {}'.format(type(frozen).__name__))
+
+    folded = copy.deepcopy(frozen)
+
+    for level in folded.levels:
+        # The radial functions are only shared between weights if they are not mixed
+        rad_widths = set(width[2] for width in level.edge_mix.widths)
+        if level.rad_func.mix == 'none' and len(rad_widths) == 1 and 0 not in rad_widths:
+            level.edge_mix = _StackedEdgeMix(level.edge_mix)
+
+    folded.output_layers = nn.ModuleList([_FoldedOutput(output) if output.masked else output
+                                          for output in folded.output_layers])
+
+    return folded.eval()
+
+
+def count_flops(model, data):
+    """
+    Number of floating point operations of the matrix products in a forward pass.
+
+    Parameters
+    ----------
+    model : :obj:`torch.nn.Module`
+        Model to evaluate.
+    data : :obj:`dict`
+        Batch to evaluate the model on.
+
+    Returns
+    -------
+    flops : :obj:`int`
+        Total count, as reported by :class:`torch.utils.flop_counter.FlopCounterMode`.
+    """
+    counter = FlopCounterMode(display=False)
+    with torch.no_grad(), counter:
+        model(data)
+    return counter.get_total_flops()
+
+
+def fold_report(model, data, num_steps=10):
+    """
+    Compare the FLOPs, latency and predictions of a model, its frozen version,
+    and its folded version.
+
+    Parameters
+    ----------
+    model : :obj:`torch.nn.Module`
+        Trained model.
+    data : :obj:`dict`
+        Batch to evaluate the models on.
+    num_steps : :obj:`int`, optional
+        Number of forward passes to average the latency over.
+
+    Returns
+    -------
+    report : :obj:`dict`
+        For each of ``eager``, ``frozen`` and ``folded``, the FLOPs, latency in
+        seconds, and largest absolute difference to the eager prediction.
+    """
+    from cormorant.inference.freeze import freeze
+
+    frozen = freeze(model)
+    models = {'eager': model, 'frozen': frozen, 'folded': fold(frozen)}
+
+    report = {}
+    with torch.no_grad():
+        reference = model(data)
+        for name, module in models.items():
+            error = (module(data) - reference).abs().max().item()
+
+            t0 = time.perf_counter()
+            for _ in range(num_steps):
+                module(data)
+            latency = (time.perf_counter() - t0) / num_steps
+
+            report[name] = {'flops': count_flops(module, data), 'latency': latency, 'max_error': error}
+
+    return report
+
+
+class _StackedEdgeMix(nn.Module):
+    """
+    :class:`_EdgeMix` with the mixing matrices of the radial functions
+    stacked over the weights.
+    """
+    def __init__(self, edge_mix):
+        super().__init__()
+
+        self.widths = edge_mix.widths
+        self.num_out: List[int] = []
+
+        rad_weights = []
+        self.weights = nn.ModuleList()
+        for l, mix in enumerate(edge_mix.mixes):
+            # Rows of the block matrix: real parts of (edge, dot, rad), then imaginary parts
+            num_edge, num_dot, num_rad = self.widths[l]
+            num_own, num_in = num_edge + num_dot, num_edge + num_dot + num_rad
+
+            weight = mix.weight
+            rad_weights.append(torch.cat([weight[num_own:num_in], weight[num_in + num_own:]]))
+            self.weights.append(_Buffer(torch.cat([weight[:num_own], weight[num_in:num_in + num_own]])))
+            self.num_out.append(weight.shape[1])
+
+        self.register_buffer('rad_weight', torch.cat(rad_weights, dim=1))
+
+    def forward(self, edge_in: List[torch.Tensor], dot: torch.Tensor, rad: List[torch.Tensor]) -> List[torch.Tensor]:
+        # The radial functions are the same for every weight
+        rad_mix = torch.matmul(torch.cat([rad[0][..., 0], rad[0][..., 1]], dim=-1), self.rad_weight)
+        rad_mix = rad_mix.split(self.num_out, dim=-1)
+
+        edge_mix: List[torch.Tensor] = []
+        for l, weight in enumerate(self.weights):
+            parts: List[torch.Tensor] = []
+            if self.widths[l][0] > 0:
+                parts.append(edge_in[l])
+            if self.widths[l][1] > 0:
+                parts.append(dot)
+
+            out = rad_mix[l]
+            if len(parts) > 0:
+                parts_r = [part[..., 0] for part in parts]
+                parts_i = [part[..., 1] for part in parts]
+                out = out + torch.matmul(torch.cat(parts_r + parts_i, dim=-1), weight.tensor)
+            out_r, out_i = out.chunk(2, dim=-1)
+            edge_mix.append(torch.stack([out_r, out_i], dim=-1))
+
+        return edge_mix
+
+
+class _FoldedOutput(nn.Module):
+    """
+    :class:`_Output` of an :class:`cormorant.nn.OutputPMLP`, with the last
+    per-atom linear layer folded through the sum over atoms into the first
+    molecule linear layer.
+    """
+    def __init__(self, output):
+        super().__init__()
+
+        atom_layers, mlp_layers = list(output.atom_mlp), list(output.mlp)
+        last, first = atom_layers[-1], mlp_layers[0]
+
+        weight = first.weight.double() @ last.weight.double()
+        # The bias of the last per-atom layer is summed once for every atom
+        atom_bias = first.weight.double() @ last.bias.double() if last.bias is not None else torch.zeros_like(first.weight[:, 0]).double()
+        bias = first.bias.double() if first.bias is not None else torch.zeros_like(atom_bias)
+
+        folded = nn.Linear(weight.shape[1], weight.shape[0]).to(device=first.weight.device, dtype=first.weight.dtype)
+        with torch.no_grad():
+            folded.weight.copy_(weight)
+            folded.bias.copy_(bias)
+
+        self.atom_mlp = nn.Sequential(*atom_layers[:-1])
+        self.folded = folded
+        self.register_buffer('atom_bias', atom_bias.to(first.weight.dtype))
+        self.mlp = nn.Sequential(*mlp_layers[1:])
+
+    def forward(self, atom_scalars: torch.Tensor, atom_mask: torch.Tensor) -> torch.Tensor:
+        x = self.atom_mlp(atom_scalars.view(atom_scalars.shape[0], atom_scalars.shape[1], -1))
+
+        atom_mask = atom_mask.unsqueeze(-1)
+        x = torch.where(atom_mask, x, torch.zeros_like(x)).sum(1)
+        num_atoms = atom_mask.sum(1).to(x.dtype)
+
+        x = self.folded(x) + num_atoms * self.atom_bias
+
+        return self.mlp(x).squeeze(-1)
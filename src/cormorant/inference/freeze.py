@@ -0,0 +1,739 @@
+import torch
+import torch.nn as nn
+
+import copy
+from math import sqrt, pi
+from typing import Dict, List, Tuple
+
+from cormorant.nn import InputLinear, InputMPNN, NoLayer, GetScalarsAtom
+from cormorant.nn import OutputLinear, OutputLinearMeanPool, OutputPMLP, OutputSoftmax
+
+
+def freeze(model):
+    """
+    Freeze a trained model into a :class:`FrozenCormorant` for inference.
+
+    Parameters
+    ----------
+    model : :obj:`torch.nn.Module`
+        Trained single-structure model, for instance :class:`cormorant.models.CormorantQM9`.
+
+    Returns
+    -------
+    frozen : :obj:`FrozenCormorant`
+        Plain-tensor copy of the model, in evaluation mode.
+    """
+    return FrozenCormorant(model).eval()
+
+
+class FrozenCormorant(nn.Module):
+    """
+    Inference-only copy of a trained Cormorant model, built from plain tensors.
+
+    The eager models pass :class:`SO3Vec`/:class:`SO3Scalar` lists through
+    Python-level dispatch, and check the tau of every input at run time. Here
+    the tau of every representation is resolved once, when the model is
+    frozen: the Clebsch-Gordan coefficients of each pair of weights, the
+    complex mixing matrices and the cutoff parameters become buffers, and the
+    loops over weights only depend on integers fixed at construction. The
+    module can then be compiled with :func:`torch.jit.script` or
+    :func:`torch.compile`.
+
+    The weights are copied, so later changes to `model` are not reflected.
+    Edges are never pruned, since pruning uses data-dependent shapes.
+
+    Parameters
+    ----------
+    model : :obj:`torch.nn.Module`
+        Trained single-structure model with an :class:`InputLinear` or
+        :class:`InputMPNN` input layer, no edge input, and an
+        :class:`OutputLinear`, :class:`OutputLinearMeanPool`,
+        :class:`OutputPMLP` or :class:`OutputSoftmax` output layer (or a
+        list of them in ``output_layers_atom``).
+    """
+    def __init__(self, model):
+        super().__init__()
+
+        if hasattr(model, 'forward_once'):
+            raise NotImplementedError('Freezing is only implemented for single-structure models!')
+        if not isinstance(getattr(model, 'input_func_edge', None), NoLayer):
+            raise NotImplementedError('Freezing is only implemented for models without edge inputs!')
+        if not isinstance(model.get_scalars_atom, GetScalarsAtom):
+            raise NotImplementedError('Unsupported scalar layer {}'.format(type(model.get_scalars_atom).__name__))
+
+        dtype, device = model.dtype, model.device
+        cg_dict = model.cg_dict
+
+        self.charge_scale = float(model.charge_scale)
+        self.num_species = int(model.num_species)
+        self.register_buffer('charge_powers', torch.arange(model.charge_power + 1., device=device, dtype=dtype))
+
+        sph_harms = model.sph_harms
+        self.sph_harms = _SphericalHarmonics(cg_dict, sph_harms.maxl, sph_harms.normalize, sph_harms.conj,
+                                             sph_harms.sh_norm, device=device, dtype=dtype)
+
+        input_func = model.input_func_atom
+        if isinstance(input_func, InputLinear):
+            self.input_func = _InputLinear(input_func)
+        elif isinstance(input_func, InputMPNN):
+            self.input_func = _InputMPNN(input_func)
+        else:
+            raise NotImplementedError('Unsupported input layer {}'.format(type(input_func).__name__))
+
+        cormorant_cg = model.cormorant_cg
+        self.levels = nn.ModuleList([_Level(edge_level, atom_level, rad_func, max_sh, cg_dict)
+                                     for edge_level, atom_level, rad_func, max_sh
+                                     in zip(cormorant_cg.edge_levels, cormorant_cg.atom_levels,
+                                            model.rad_funcs.rad_funcs, cormorant_cg.max_sh)])
+
+        self.get_scalars = _GetScalars(model.get_scalars_atom, [level.tau for level in cormorant_cg.atom_levels])
+
+        # Multi-target models have one output layer for each target
+        if hasattr(model, 'output_layers_atom'):
+            self.output_layers = nn.ModuleList([_Output(layer) for layer in model.output_layers_atom])
+            self.stack_outputs = True
+        else:
+            self.output_layers = nn.ModuleList([_Output(model.output_layer_atom)])
+            self.stack_outputs = False
+
+        self.to(device=device, dtype=dtype)
+
+    def forward(self, data: Dict[str, torch.Tensor]) -> torch.Tensor:
+        """
+        Predict a batch collated by :func:`cormorant.data.collate.collate_fn`.
+
+        Parameters
+        ----------
+        data : :obj:`dict`
+            Batch with at least the keys ``charges``, ``positions``,
+            ``species`` (or ``one_hot``), ``atom_mask`` and ``edge_mask``.
+
+        Returns
+        -------
+        prediction : :obj:`torch.Tensor`
+            Output of the model.
+        """
+        dtype, device = self.charge_powers.dtype, self.charge_powers.device
+
+        positions = data['positions'].to(device, dtype)
+        if 'species' in data:
+            species = data['species'].to(device=device, dtype=torch.long)
+        else:
+            one_hot = data['one_hot'].to(device=device, dtype=torch.long)
+            species = torch.where(one_hot.sum(-1) > 0, one_hot.argmax(-1) + 1, 0)
+        charges = data['charges'].to(device, dtype)
+        atom_mask = data['atom_mask'].to(device=device, dtype=torch.bool)
+        edge_mask = data['edge_mask'].to(device=device, dtype=torch.bool)
+
+        batch_size, num_atoms = charges.shape[0], charges.shape[1]
+
+        charge_tensor = (charges.unsqueeze(-1) / self.charge_scale).pow(self.charge_powers)
+        one_hot = nn.functional.one_hot(species, self.num_species + 1)[..., 1:].to(dtype)
+        atom_scalars = (one_hot.unsqueeze(-1) * charge_tensor.unsqueeze(-2)).view(batch_size, num_atoms, -1)
+
+        rel_pos = positions.unsqueeze(-2) - positions.unsqueeze(-3)
+        norms = torch.linalg.vector_norm(rel_pos, dim=-1)
+        sph_harm = self.sph_harms(rel_pos)
+
+        rad_mask = edge_mask & (norms > 0)
+
+        atom_reps = [self.input_func(atom_scalars, atom_mask, edge_mask, norms)]
+        edge_net: List[torch.Tensor] = []
+
+        atoms_all: List[List[torch.Tensor]] = []
+        for level in self.levels:
+            atom_reps, edge_net = level(atom_reps, edge_net, edge_mask, rad_mask, norms, sph_harm)
+            atoms_all.append(atom_reps)
+
+        scalars = self.get_scalars(atoms_all)
+
+        predictions: List[torch.Tensor] = []
+        for output in self.output_layers:
+            predictions.append(output(scalars, atom_mask))
+
+        if self.stack_outputs:
+            return torch.stack(predictions, dim=-1)
+        return predictions[0]
+
+
+def complex_outer(z1, z2):
+    """
+    Complex outer product of the last non-complex dimension of two tensors.
+
+    Parameters
+    ----------
+    z1 : :obj:`torch.Tensor`
+        Tensor of shape (..., M1, 2).
+    z2 : :obj:`torch.Tensor`
+        Tensor of shape (..., M2, 2).
+
+    Returns
+    -------
+    z : :obj:`torch.Tensor`
+        Tensor of shape (..., M1 * M2, 2), in the order of
+        :func:`cormorant.cg_lib.cg_ops.complex_kron_product`.
+    """
+    z1_r, z1_i = z1.unsqueeze(-2).unbind(-1)
+    z2_r, z2_i = z2.unsqueeze(-3).unbind(-1)
+
+    z = torch.stack([z1_r*z2_r - z1_i*z2_i, z1_r*z2_i + z1_i*z2_r], dim=-1)
+
+    return z.flatten(-3, -2)
+
+
+def complex_aggregate(edges, atoms):
+    """
+    Complex outer product of edge and atom representations, summed over the
+    neighbors of each atom, without forming the product for every edge.
+
+    Parameters
+    ----------
+    edges : :obj:`torch.Tensor`
+        Tensor of shape (batch, atoms, atoms, channels, M1, 2).
+    atoms : :obj:`torch.Tensor`
+        Tensor of shape (batch, atoms, channels, M2, 2).
+
+    Returns
+    -------
+    z : :obj:`torch.Tensor`
+        Tensor of shape (batch, atoms, channels, M1 * M2, 2).
+    """
+    edges_r, edges_i = edges.unbind(-1)
+    atoms_r, atoms_i = atoms.unbind(-1)
+
+    z_r = torch.einsum('bijcm,bjcn->bicmn', edges_r, atoms_r) - torch.einsum('bijcm,bjcn->bicmn', edges_i, atoms_i)
+    z_i = torch.einsum('bijcm,bjcn->bicmn', edges_r, atoms_i) + torch.einsum('bijcm,bjcn->bicmn', edges_i, atoms_r)
+
+    return torch.stack([z_r, z_i], dim=-1).flatten(-3, -2)
+
+
+def complex_scale(scalar, part):
+    """
+    Multiply a part of an :class:`SO3Vec` by a complex scalar for each channel.
+    """
+    scalar_r, scalar_i = scalar.unsqueeze(-2).unbind(-1)
+    part_r, part_i = part.unbind(-1)
+
+    return torch.stack([part_r*scalar_r - part_i*scalar_i, part_r*scalar_i + part_i*scalar_r], dim=-1)
+
+
+class _SphericalHarmonics(nn.Module):
+    """
+    Relative spherical harmonics, see :func:`cormorant.cg_lib.spherical_harmonics`,
+    with the Clebsch-Gordan coefficients of the recursion folded into buffers.
+    """
+    def __init__(self, cg_dict, maxsh, normalize, conj, sh_norm, device=None, dtype=None):
+        super().__init__()
+
+        if sh_norm not in ['qm', 'unit']:
+            raise ValueError('Incorrect choice of spherial harmonic normalization!')
+
+        self.maxsh = maxsh
+        self.normalize = normalize
+        self.conj = conj
+
+        # The recursion Y^l = <Y^{l-1} x Y^1>_l, with the constant of each step
+        # folded into the rows of the coefficients for weight l
+        self.recursion = nn.ModuleList()
+        for l in range(2, maxsh+1):
+            cg_coeff = float(cg_dict[(1, l-1)][5*(l-1)+1, 3*(l-1)+1])
+            lmin = l - 2
+            cg_mat = cg_dict[(l-1, 1)][l**2 - lmin**2:(l+1)**2 - lmin**2, :]
+            self.recursion.append(_Buffer(cg_mat * (sqrt((4*pi*(2*l+1))/(3*(2*l-1))) / cg_coeff)))
+
+        # Factors from the quantum mechanical to the chosen normalization
+        if sh_norm == 'unit':
+            self.scales = [sqrt((4*pi)/(2*ell+1)) for ell in range(maxsh+1)]
+        else:
+            self.scales = [1.] * (maxsh + 1)
+        self.scales[0] *= sqrt(1/(4*pi))
+        self.sqrt_half = sqrt(1/2)
+        self.psi1_norm = sqrt(3/(4*pi))
+
+        self.to(device=device, dtype=dtype)
+
+    def forward(self, pos: torch.Tensor) -> List[torch.Tensor]:
+        if self.normalize:
+            norm = torch.linalg.vector_norm(pos, dim=-1, keepdim=True)
+            pos = torch.where(norm > 0, pos / norm, torch.zeros_like(pos))
+
+        psi0 = torch.stack([torch.ones_like(pos[..., :1]), torch.zeros_like(pos[..., :1])], dim=-1)
+        sph_harms = [self.scales[0] * psi0.unsqueeze(-3)]
+
+        if self.maxsh >= 1:
+            pos_x, pos_y, pos_z = pos.unbind(-1)
+            sign_y = 1. if self.conj else -1.
+            pos_m = self.sqrt_half * torch.stack([pos_x, sign_y*pos_y], -1)
+            pos_p = self.sqrt_half * torch.stack([-pos_x, sign_y*pos_y], -1)
+            pos_0 = torch.stack([pos_z, torch.zeros_like(pos_z)], -1)
+
+            # The l=1 harmonics in the quantum mechanical normalization
+            psi1 = self.psi1_norm * torch.stack([pos_m, pos_0, pos_p], dim=-2).unsqueeze(-3)
+            sph_harms.append(self.scales[1] * psi1)
+
+            new_psi = psi1
+            for idx, cg_mat in enumerate(self.recursion):
+                new_psi = torch.matmul(cg_mat.tensor, complex_outer(new_psi, psi1))
+                sph_harms.append(self.scales[idx+2] * new_psi)
+
+        return sph_harms
+
+
+class _Buffer(nn.Module):
+    """
+    Holds a single buffer, so lists of buffers of different shapes can be kept
+    in a :class:`torch.nn.ModuleList` and follow the module to a device.
+    """
+    def __init__(self, tensor):
+        super().__init__()
+        self.register_buffer('tensor', tensor.detach().clone())
+
+
+class _CatMix(nn.Module):
+    """
+    One weight of :class:`cormorant.nn.CatMixReps`. The complex mixing matrix
+    is stored as a single real block matrix, so the concatenation and the
+    mixing are a single matrix product.
+    """
+    def __init__(self, weight, scalar):
+        super().__init__()
+
+        weight_r, weight_i = weight.detach().unbind(-1)
+        block = torch.cat([torch.cat([weight_r, -weight_i], dim=1),
+                           torch.cat([weight_i, weight_r], dim=1)], dim=0)
+
+        self.scalar = scalar
+        self.register_buffer('weight', block.t().contiguous() if scalar else block.contiguous())
+
+    def forward(self, parts: List[torch.Tensor]) -> torch.Tensor:
+        parts_r: List[torch.Tensor] = []
+        parts_i: List[torch.Tensor] = []
+        for part in parts:
+            parts_r.append(part[..., 0])
+            parts_i.append(part[..., 1])
+
+        if self.scalar:
+            out = torch.matmul(torch.cat(parts_r + parts_i, dim=-1), self.weight)
+            out_r, out_i = out.chunk(2, dim=-1)
+        else:
+            out = torch.matmul(self.weight, torch.cat(parts_r + parts_i, dim=-2))
+            out_r, out_i = out.chunk(2, dim=-2)
+
+        return torch.stack([out_r, out_i], dim=-1)
+
+
+class _EdgeMix(nn.Module):
+    """
+    The :class:`cormorant.nn.CatMixReps` of an edge level, mixing the edges of
+    the previous level, the dot products and the radial functions.
+    """
+    def __init__(self, cat_mix):
+        super().__init__()
+
+        # The edges of the previous level are missing at the first level
+        taus_in = [list(tau) for tau in cat_mix.cat_reps.taus_in]
+        taus_in = [[]] * (3 - len(taus_in)) + taus_in
+
+        weights = cat_mix.mix_reps.weights
+        self.widths = [[tau[l] if l < len(tau) else 0 for tau in taus_in] for l in range(len(weights))]
+        self.mixes = nn.ModuleList([_CatMix(weight, scalar=True) for weight in weights])
+
+    def forward(self, edge_in: List[torch.Tensor], dot: torch.Tensor, rad: List[torch.Tensor]) -> List[torch.Tensor]:
+        edge_mix: List[torch.Tensor] = []
+        for l, mix in enumerate(self.mixes):
+            parts: List[torch.Tensor] = []
+            if self.widths[l][0] > 0:
+                parts.append(edge_in[l])
+            if self.widths[l][1] > 0:
+                parts.append(dot)
+            if self.widths[l][2] > 0:
+                parts.append(rad[l])
+            edge_mix.append(mix(parts))
+
+        return edge_mix
+
+
+class _CGProduct(nn.Module):
+    """
+    :func:`cormorant.cg_lib.cg_product` for fixed input weights, with one
+    block of Clebsch-Gordan coefficients for each pair of input weights.
+    """
+    def __init__(self, cg_product, ells1, ells2):
+        super().__init__()
+
+        if cg_product.minl > 0:
+            raise NotImplementedError('minl > 0 not yet implemented!')
+        if cg_product.normalization not in ['none', 'normal', 'relu', 'softplus']:
+            raise ValueError('Unknown normalization {}'.format(cg_product.normalization))
+
+        self.aggregate = cg_product.aggregate
+        self.bounded = cg_product.bounded
+        self.normalization = cg_product.normalization
+
+        maxL = min(max(ells1) + max(ells2), cg_product.maxl)
+        self.num_ells = maxL + 1
+
+        cg_dict = cg_product.cg_dict
+
+        self.blocks = nn.ModuleList()
+        self.plan: List[List[int]] = []
+        for idx1, l1 in enumerate(ells1):
+            for idx2, l2 in enumerate(ells2):
+                lmin, lmax = abs(l1 - l2), min(l1 + l2, maxL)
+                if lmin > lmax:
+                    continue
+                self.blocks.append(_Buffer(cg_dict[(l1, l2)][:(lmax+1)**2 - lmin**2, :]))
+                self.plan.append([idx1, idx2, lmin, lmax])
+
+    def forward(self, rep1: List[torch.Tensor], rep2: List[torch.Tensor]) -> List[torch.Tensor]:
+        new_rep: List[List[torch.Tensor]] = []
+        for _ in range(self.num_ells):
+            new_rep.append(torch.jit.annotate(List[torch.Tensor], []))
+
+        for idx, block in enumerate(self.blocks):
+            idx1, idx2, lmin, lmax = self.plan[idx][0], self.plan[idx][1], self.plan[idx][2], self.plan[idx][3]
+
+            if self.aggregate:
+                irrep_prod = complex_aggregate(rep1[idx1], rep2[idx2])
+            else:
+                irrep_prod = complex_outer(rep1[idx1], rep2[idx2])
+            cg_decomp = torch.matmul(block.tensor, irrep_prod)
+
+            start = 0
+            for l in range(lmin, lmax+1):
+                new_rep[l].append(cg_decomp[..., start:start+2*l+1, :])
+                start += 2*l+1
+
+        out: List[torch.Tensor] = []
+        for parts in new_rep:
+            if len(parts) > 0:
+                part = torch.cat(parts, dim=-3)
+                if self.bounded:
+                    part = torch.tanh(part)
+                out.append(self._normalize(part))
+
+        return out
+
+    def _normalize(self, part: torch.Tensor) -> torch.Tensor:
+        if self.normalization == 'none':
+            return part
+
+        norm = torch.linalg.vector_norm(part.flatten(1), dim=1).view([-1] + [1] * (part.dim() - 1))
+        if self.normalization == 'normal':
+            return part / norm
+        elif self.normalization == 'relu':
+            return part / (torch.relu(norm - 1) + 1)
+        else:
+            return part / nn.functional.softplus(norm)
+
+
+class _Mask(nn.Module):
+    """
+    :class:`cormorant.nn.MaskLevel` with its cutoff parameters resolved.
+    """
+    def __init__(self, mask_level):
+        super().__init__()
+
+        self.hard_cut_rad = float(mask_level.hard_cut_rad) if mask_level.hard_cut_rad is not None else -1.
+        self.use_hard = mask_level.hard_cut_rad is not None
+        self.use_soft = mask_level.soft_cut_rad is not None
+        self.envelope = mask_level.envelope if mask_level.envelope is not None else ''
+        self.gaussian_mask = mask_level.gaussian_mask
+        self.pi = pi
+
+        if self.use_soft:
+            cut_rad = torch.max(mask_level.eps, mask_level.soft_cut_rad.detach().abs()).view(-1)
+            cut_width = torch.max(mask_level.eps, mask_level.soft_cut_width.detach().abs()).view(-1)
+        else:
+            cut_rad = cut_width = torch.ones(1)
+        self.register_buffer('cut_rad', cut_rad.clone())
+        self.register_buffer('cut_width', cut_width.clone())
+
+    def forward(self, edge_mask: torch.Tensor, norms: torch.Tensor) -> torch.Tensor:
+        """
+        Returns the mask, with a trailing channel and complex dimension.
+        """
+        if self.use_hard:
+            edge_mask = edge_mask & (norms < self.hard_cut_rad)
+
+        mask = edge_mask.to(norms.dtype).unsqueeze(-1)
+
+        if self.use_soft:
+            norms = norms.unsqueeze(-1)
+            if self.envelope == 'cos' or self.envelope == 'poly':
+                t = ((norms - (self.cut_rad - self.cut_width)) / self.cut_width).clamp(0, 1)
+                if self.envelope == 'cos':
+                    mask = mask * 0.5 * (1 + torch.cos(self.pi * t))
+                else:
+                    mask = mask * (1 - t.pow(3) * (10 - 15 * t + 6 * t.pow(2)))
+            elif self.gaussian_mask:
+                mask = mask * torch.exp(-(norms / self.cut_rad).pow(2))
+            else:
+                mask = mask * torch.sigmoid((self.cut_rad - norms) / self.cut_width)
+
+        return mask.unsqueeze(-1)
+
+
+class _Radial(nn.Module):
+    """
+    :class:`cormorant.nn.RadPolyTrig`, returning one tensor for each weight.
+    """
+    def __init__(self, rad_func):
+        super().__init__()
+
+        self.rpow = rad_func.rpow
+        self.max_sh = rad_func.max_sh
+        self.num_rad = rad_func.num_rad
+        self.num_channels = rad_func.num_channels
+
+        self.register_buffer('scales', 2*pi*rad_func.scales.detach().view(-1))
+        self.register_buffer('phases', rad_func.phases.detach().view(-1).clone())
+
+        self.mix = rad_func.mix
+        if rad_func.mix in ['cplx', 'real', True]:
+            self.mix = 'cplx' if rad_func.mix is True else rad_func.mix
+            self.linear = copy.deepcopy(rad_func.linear)
+        else:
+            self.mix = 'none'
+            self.linear = nn.ModuleList()
+
+    def forward(self, norms: torch.Tensor, edge_mask: torch.Tensor) -> List[torch.Tensor]:
+        s = list(norms.shape)
+
+        edge_mask = (edge_mask & (norms > 0)).unsqueeze(-1)
+        norms = norms.unsqueeze(-1)
+
+        zero = torch.zeros_like(norms)
+        rad_powers = torch.stack([torch.where(edge_mask, norms.pow(-p), zero) for p in range(self.rpow+1)], dim=-1)
+
+        rad_trig = torch.where(edge_mask, torch.sin(self.scales*norms + self.phases), zero).unsqueeze(-1)
+
+        rad_prod = (rad_powers*rad_trig).view(s + [1, 2*self.num_rad])
+
+        radial_functions: List[torch.Tensor] = []
+        if self.mix == 'cplx':
+            for linear in self.linear:
+                radial_functions.append(linear(rad_prod).view(s + [self.num_channels, 2]))
+        elif self.mix == 'real':
+            for linear in self.linear:
+                rad = linear(rad_prod).view(s + [self.num_channels])
+                radial_functions.append(torch.stack([rad, torch.zeros_like(rad)], dim=-1))
+        else:
+            rad = rad_prod.view(s + [self.num_rad, 2])
+            for _ in range(self.max_sh+1):
+                radial_functions.append(rad)
+
+        return radial_functions
+
+
+class _Level(nn.Module):
+    """
+    One edge level and atom level of :class:`cormorant.models.CormorantCG`.
+    """
+    def __init__(self, edge_level, atom_level, rad_func, max_sh, cg_dict):
+        super().__init__()
+
+        if not edge_level.dot_matrix.cat:
+            raise NotImplementedError('Freezing is only implemented for concatenated dot products!')
+
+        self.max_sh = max_sh
+        self.num_dot = len(edge_level.dot_matrix.tau_in)
+
+        dot_maxl = self.num_dot - 1
+        self.register_buffer('signs', torch.tensor(-1.).pow(torch.arange(-dot_maxl, dot_maxl+1.)))
+
+        self.rad_func = _Radial(rad_func)
+        self.edge_mix = _EdgeMix(edge_level.cat_mix)
+        self.mask = _Mask(edge_level.mask_layer)
+
+        ells_in = list(range(len(atom_level.tau_in)))
+        ells_edge = list(range(len(edge_level.tau)))
+
+        self.cg_aggregate = _CGProduct(atom_level.cg_aggregate, ells_edge, ells_in)
+        self.cg_power = _CGProduct(atom_level.cg_power, ells_in, ells_in)
+        self.atom_mix = nn.ModuleList([_CatMix(weight, scalar=False) for weight in atom_level.cat_mix.mix_reps.weights])
+
+    def forward(self, atom_reps: List[torch.Tensor], edge_in: List[torch.Tensor], edge_mask: torch.Tensor,
+                rad_mask: torch.Tensor, norms: torch.Tensor,
+                sph_harm: List[torch.Tensor]) -> Tuple[List[torch.Tensor], List[torch.Tensor]]:
+        rad = self.rad_func(norms, rad_mask)
+
+        # Matrix of dot products between the atom representations, concatenated over the weights
+        dots: List[torch.Tensor] = []
+        dot_maxl = self.num_dot - 1
+        for l, part in enumerate(atom_reps):
+            part_r, part_i = part.unbind(-1)
+            sign = self.signs[dot_maxl-l:dot_maxl+l+1]
+            flip_r, flip_i = sign*part_r.flip(-1), sign*part_i.flip(-1)
+            dot_r = torch.einsum('bicm,bjcm->bijc', part_r, flip_r) - torch.einsum('bicm,bjcm->bijc', part_i, flip_i)
+            dot_i = torch.einsum('bicm,bjcm->bijc', part_r, flip_i) + torch.einsum('bicm,bjcm->bijc', part_i, flip_r)
+            dots.append(torch.stack([dot_r, dot_i], dim=-1))
+        dot = torch.cat(dots, dim=-2)
+
+        # Edge network
+        mask = self.mask(edge_mask, norms)
+        edge_net: List[torch.Tensor] = []
+        for part in self.edge_mix(edge_in, dot, rad):
+            edge_net.append(part * mask)
+
+        edge_reps: List[torch.Tensor] = []
+        for l, part in enumerate(edge_net):
+            edge_reps.append(complex_scale(part, sph_harm[l]))
+
+        # Atom level
+        reps_ag = self.cg_aggregate(edge_reps, atom_reps)
+        reps_sq = self.cg_power(atom_reps, atom_reps)
+
+        reps_out: List[torch.Tensor] = []
+        for l, mix in enumerate(self.atom_mix):
+            parts: List[torch.Tensor] = []
+            if l < len(reps_ag):
+                parts.append(reps_ag[l])
+            if l < len(atom_reps):
+                parts.append(atom_reps[l])
+            if l < len(reps_sq):
+                parts.append(reps_sq[l])
+            reps_out.append(mix(parts))
+
+        return reps_out, edge_net
+
+
+class _GetScalars(nn.Module):
+    """
+    :class:`cormorant.nn.GetScalarsAtom`.
+    """
+    def __init__(self, get_scalars, tau_levels):
+        super().__init__()
+
+        self.full_scalars = get_scalars.full_scalars
+        self.maxl = get_scalars.maxl
+        self.num_levels = len(tau_levels)
+
+        signs = torch.pow(-1, torch.arange(-self.maxl, self.maxl+1.))
+        self.register_buffer('signs', torch.stack([signs, -signs], dim=-1))
+
+    def forward(self, atoms_all: List[List[torch.Tensor]]) -> torch.Tensor:
+        reps: List[torch.Tensor] = []
+        for l in range(self.maxl+1):
+            parts: List[torch.Tensor] = []
+            for atoms in atoms_all:
+                if l < len(atoms):
+                    parts.append(atoms[l])
+            reps.append(torch.cat(parts, dim=-3))
+
+        scalars = [reps[0]]
+        if self.full_scalars:
+            for l, part in enumerate(reps):
+                sign = self.signs[self.maxl-l:self.maxl+l+1]
+                scalars_tr = (sign*part*part.flip(-2)).sum(dim=(-1, -2), keepdim=True)
+                scalars_mag = (part*part).sum(dim=(-1, -2), keepdim=True)
+                scalars.append(torch.cat([scalars_tr, scalars_mag], dim=-1))
+
+        return torch.cat(scalars, dim=-3)
+
+
+def _mlp(basic_mlp):
+    """
+    Convert a :class:`cormorant.nn.BasicMLP` to a :class:`torch.nn.Sequential`.
+    """
+    layers = []
+    for lin, activation in zip(basic_mlp.linear, basic_mlp.activations):
+        layers += [copy.deepcopy(lin), copy.deepcopy(activation)]
+    layers.append(copy.deepcopy(basic_mlp.linear[-1]))
+
+    return nn.Sequential(*layers)
+
+
+class _InputLinear(nn.Module):
+    """
+    :class:`cormorant.nn.InputLinear`.
+    """
+    def __init__(self, input_linear):
+        super().__init__()
+        self.channels_out = input_linear.channels_out
+        self.lin = copy.deepcopy(input_linear.lin)
+
+    def forward(self, features: torch.Tensor, atom_mask: torch.Tensor,
+                edge_mask: torch.Tensor, norms: torch.Tensor) -> torch.Tensor:
+        out = torch.where(atom_mask.unsqueeze(-1), self.lin(features), torch.zeros_like(features[..., :1]))
+
+        return out.view(features.shape[0], features.shape[1], self.channels_out, 1, 2)
+
+
+class _InputMPNN(nn.Module):
+    """
+    :class:`cormorant.nn.InputMPNN`.
+    """
+    def __init__(self, input_mpnn):
+        super().__init__()
+        self.channels_out = input_mpnn.channels_out
+
+        self.layers = nn.ModuleList([_MPNNLayer(rad_filt, mask, mlp) for rad_filt, mask, mlp
+                                     in zip(input_mpnn.rad_filts, input_mpnn.masks, input_mpnn.mlps)])
+
+    def forward(self, features: torch.Tensor, atom_mask: torch.Tensor,
+                edge_mask: torch.Tensor, norms: torch.Tensor) -> torch.Tensor:
+        s = features.shape
+        atom_mask = atom_mask.unsqueeze(-1)
+
+        for layer in self.layers:
+            features = layer(features, atom_mask, edge_mask, norms)
+
+        return features.view(s[0], s[1], self.channels_out, 1, 2)
+
+
+class _MPNNLayer(nn.Module):
+    """
+    One message passing layer of :class:`cormorant.nn.InputMPNN`.
+    """
+    def __init__(self, rad_filt, mask, mlp):
+        super().__init__()
+        self.rad_filt = _Radial(rad_filt)
+        self.mask = _Mask(mask)
+        self.mlp = _mlp(mlp)
+
+    def forward(self, features: torch.Tensor, atom_mask: torch.Tensor,
+                edge_mask: torch.Tensor, norms: torch.Tensor) -> torch.Tensor:
+        rad = self.rad_filt(norms, edge_mask)[0][..., 0]
+        edge = rad * self.mask(edge_mask, norms).squeeze(-1)
+
+        features_mp = torch.einsum('baxc,bxc->bac', edge, features)
+        features_mp = torch.cat([features_mp, features], dim=-1)
+
+        features = self.mlp(features_mp)
+
+        return torch.where(atom_mask, features, torch.zeros_like(features))
+
+
+class _Output(nn.Module):
+    """
+    The supported output layers, as an optional per-atom MLP followed by a
+    sum or mean over the atoms and a final MLP.
+    """
+    def __init__(self, output_layer):
+        super().__init__()
+
+        self.mean = False
+        self.masked = False
+        if isinstance(output_layer, OutputPMLP):
+            self.atom_mlp = _mlp(output_layer.mlp1)
+            self.mlp = _mlp(output_layer.mlp2)
+            self.masked = True
+        elif isinstance(output_layer, (OutputLinear, OutputLinearMeanPool, OutputSoftmax)):
+            self.atom_mlp = nn.Identity()
+            self.mlp = copy.deepcopy(output_layer.lin)
+            self.mean = isinstance(output_layer, OutputLinearMeanPool)
+        else:
+            raise NotImplementedError('Unsupported output layer {}'.format(type(output_layer).__name__))
+
+    def forward(self, atom_scalars: torch.Tensor, atom_mask: torch.Tensor) -> torch.Tensor:
+        x = self.atom_mlp(atom_scalars.view(atom_scalars.shape[0], atom_scalars.shape[1], -1))
+
+        if self.masked:
+            x = torch.where(atom_mask.unsqueeze(-1), x, torch.zeros_like(x))
+        x = x.sum(1)
+
+        if self.mean:
+            x = x / atom_mask.unsqueeze(-1).sum(1)
+
+        return self.mlp(x).squeeze(-1)
@@ -0,0 +1,232 @@
+import torch
+
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def model_hash(model, exclude=()):
+    """
+    Digest of the weights and buffers of a model.
+
+    Parameters
+    ----------
+    model : :obj:`torch.nn.Module`
+        Model to hash.
+    exclude : :obj:`tuple` of :obj:`str`, optional
+        Prefixes of the names of weights left out of the digest.
+
+    Returns
+    -------
+    digest : :obj:`str`
+        Hexadecimal digest, which changes whenever any weight changes.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for name, tensor in model.state_dict().items():
+        if name.startswith(tuple(exclude)):
+            continue
+        digest.update(name.encode())
+        digest.update(str(tensor.dtype).encode())
+        digest.update(tensor.detach().cpu().contiguous().reshape(-1).view(torch.uint8).numpy().tobytes())
+    return digest.hexdigest()
+
+
+def geometry_keys(charges, positions, atom_mask, decimals=4):
+    """
+    Canonical digest of each molecule in a batch.
+
+    Only the atoms in `atom_mask` are used. Positions are rounded to
+    `decimals` decimal places, and the atoms are sorted by species and
+    rounded position, so the key does not depend on the padding or on
+    the order of the atoms.
+
+    Parameters
+    ----------
+    charges : :obj:`torch.Tensor`
+        Atomic numbers, of shape (batch, atoms).
+    positions : :obj:`torch.Tensor`
+        Positions, of shape (batch, atoms, 3).
+    atom_mask : :obj:`torch.Tensor`
+        Mask of the atoms that are present.
+    decimals : :obj:`int`, optional
+        Number of decimal places the positions are rounded to.
+
+    Returns
+    -------
+    keys : :obj:`list` of :obj:`str`
+        One key for each molecule.
+    """
+    charges, positions, atom_mask = charges.cpu().long(), positions.detach().cpu().double(), atom_mask.cpu().bool()
+    rounded = torch.round(positions * 10**decimals).long()
+
+    keys = []
+    for charge, position, mask in zip(charges, rounded, atom_mask):
+        atoms = torch.cat([charge[mask].unsqueeze(-1), position[mask]], dim=-1)
+        # Sort the atoms lexicographically by (species, x, y, z)
+        for column in reversed(range(atoms.shape[1])):
+            atoms = atoms[torch.argsort(atoms[:, column], stable=True)]
+        keys.append(hashlib.blake2b(atoms.numpy().tobytes(), digest_size=16).hexdigest())
+
+    return keys
+
+
+class PredictionCache:
+    """
+    Cache of model predictions, keyed on the geometry of each molecule and on
+    the weights of the model.
+
+    Entries are kept in an in-memory least-recently-used tier and, if `path`
+    is given, in an on-disk SQLite tier that persists between runs. When the
+    weights of the model change, the in-memory tier is cleared and the on-disk
+    entries of other weights are deleted.
+
+    Parameters
+    ----------
+    max_entries : :obj:`int`
+        Number of predictions kept in memory.
+    path : :obj:`str`, optional
+        File of the on-disk tier.
+    decimals : :obj:`int`, optional
+        Number of decimal places positions are rounded to in the keys.
+    """
+    def __init__(self, max_entries, path=None, decimals=4):
+        self.max_entries = max_entries
+        self.decimals = decimals
+
+        self.entries = OrderedDict()
+
+        self.db = None
+        if path is not None:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute('CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, model TEXT, value BLOB)')
+
+        self.model_hash = None
+        self._model_version = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.
+
+    def __len__(self):
+        return len(self.entries)
+
+    def validate(self, model):
+        """
+        Invalidate the cache if the weights of `model` changed.
+        """
+        # The version counters change on every in-place update, and are much
+        # cheaper to check than hashing the weights
+        version = tuple(tensor._version for tensor in model.state_dict().values())
+        if version == self._model_version:
+            return
+        self._model_version = version
+
+        digest = model_hash(model)
+        if digest == self.model_hash:
+            return
+
+        if self.model_hash is not None:
+            logger.info('Model weights changed, invalidating the prediction cache.')
+        self.model_hash = digest
+        self.entries.clear()
+
+        if self.db is not None:
+            with self.db:
+                self.db.execute('DELETE FROM predictions WHERE model != ?', (digest,))
+
+    def get(self, key):
+        """
+        Look up a prediction, first in memory and then on disk. Returns None on a miss.
+        """
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        if self.db is not None:
+            row = self.db.execute('SELECT value FROM predictions WHERE key = ?', (key + self.model_hash,)).fetchone()
+            if row is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                value = torch.load(io.BytesIO(row[0]))
+                self._put_memory(key, value)
+                return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """
+        Store a prediction in both tiers.
+        """
+        value = value.detach().cpu()
+        self._put_memory(key, value)
+
+        if self.db is not None:
+            buffer = io.BytesIO()
+            torch.save(value, buffer)
+            with self.db:
+                self.db.execute('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)',
+                                (key + self.model_hash, self.model_hash, buffer.getvalue()))
+
+    def _put_memory(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def __call__(self, model, data):
+        """
+        Predict a collated batch, only running the model on the molecules
+        that are not in the cache.
+
+        Parameters
+        ----------
+        model : :obj:`torch.nn.Module`
+            Model to evaluate.
+        data : :obj:`dict`
+            Batch collated by :func:`cormorant.data.collate.collate_fn`.
+
+        Returns
+        -------
+        predict : :obj:`torch.Tensor`
+            Prediction for each molecule in the batch.
+        """
+        self.validate(model)
+
+        keys = geometry_keys(data['charges'], data['positions'], data['atom_mask'], decimals=self.decimals)
+
+        # Molecules repeated within the batch are only evaluated once
+        cached = {key: self.get(key) for key in OrderedDict.fromkeys(keys)}
+        missing = [keys.index(key) for key, value in cached.items() if value is None]
+
+        device = None
+        if missing:
+            index = torch.tensor(missing)
+            batch_size = len(keys)
+            subset = {key: val[index] if torch.is_tensor(val) and val.dim() > 0 and val.shape[0] == batch_size else val
+                      for key, val in data.items()}
+
+            predict = model(subset)
+            device = predict.device
+
+            for idx, value in zip(missing, predict):
+                cached[keys[idx]] = value
+                self.put(keys[idx], value)
+
+        if device is None:
+            device = next(model.parameters()).device
+
+        return torch.stack([cached[key].to(device) for key in keys])
@@ -0,0 +1,337 @@
+import torch
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+
+from cormorant.data.collate import collate_fn
+from cormorant.data.dataset import charges_to_species
+from cormorant.inference.prediction_cache import PredictionCache
+
+logger = logging.getLogger(__name__)
+
+
+def build_model(model_class, args, num_species, charge_scale, device=None, dtype=None):
+    """
+    Build a model with the arguments of a training run, in the same way as the
+    training scripts do.
+
+    Parameters
+    ----------
+    model_class : :obj:`type`
+        Model to build, for instance :class:`cormorant.models.CormorantQM9`.
+    args : :obj:`argparse.Namespace`
+        Arguments of the training run, as saved in the checkpoint.
+    num_species : :obj:`int`
+        Number of species of atoms the model was trained on.
+    charge_scale : :obj:`int`
+        Largest atomic number the model was trained on.
+
+    Returns
+    -------
+    model : :obj:`torch.nn.Module`
+        The model, with freshly initialized weights.
+    """
+    return model_class(args.maxl, args.max_sh, args.num_cg_levels, args.num_channels, num_species,
+                       args.cutoff_type, args.hard_cut_rad, args.soft_cut_rad, args.soft_cut_width,
+                       args.weight_init, args.level_gain, args.charge_power, args.basis_set,
+                       charge_scale, args.gaussian_mask,
+                       args.top, args.input, args.num_mpnn_levels,
+                       prune_edges=getattr(args, 'prune_edges', False),
+                       device=device, dtype=dtype)
+
+
+class Predictor:
+    """
+    Inference front-end for a trained Cormorant model.
+
+    Molecules are given as atomic numbers and positions. They can be predicted
+    directly with :meth:`predict`, or submitted concurrently with :meth:`submit`
+    (or through the JSON-lines server of :meth:`serve`). Submitted molecules are
+    grouped into micro-batches of molecules with a similar number of atoms, and
+    each micro-batch is run once it is full or once its oldest request has
+    waited for `max_delay` seconds.
+
+    Parameters
+    ----------
+    model : :obj:`torch.nn.Module`
+        Trained model.
+    included_species : :obj:`torch.Tensor`
+        Atomic numbers of the species the model was trained on, in the order of
+        the one-hot encoding.
+    stats : :obj:`dict`, optional
+        Statistics of the training set, as stored in :attr:`ProcessedDataset.stats`.
+        If `target` is in `stats`, predictions are converted back to the units of the target.
+    target : :obj:`str`, optional
+        Learning target of the model.
+    max_batch_size : :obj:`int`, optional
+        Largest number of molecules in a micro-batch.
+    max_delay : :obj:`float`, optional
+        Longest time in seconds a request waits for its micro-batch to fill up.
+    bucket_width : :obj:`int`, optional
+        Molecules are only batched with molecules in the same range of
+        `bucket_width` atom counts, which limits the padding in a batch.
+    num_latencies : :obj:`int`, optional
+        Number of recent requests used for the latency percentiles.
+    cache : :obj:`PredictionCache`, optional
+        Cache of predictions, checked before running the model.
+    """
+    def __init__(self, model, included_species, stats=None, target=None,
+                 max_batch_size=32, max_delay=0.005, bucket_width=8, num_latencies=10000,
+                 cache=None):
+        self.model = model.eval()
+        self.cache = cache
+        self.included_species = torch.as_tensor(included_species)
+
+        self.mu, self.sigma = (stats or {}).get(target, (0., 1.))
+
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.bucket_width = bucket_width
+
+        self.latencies = deque(maxlen=num_latencies)
+        self.num_requests = 0
+        self.num_molecules = 0
+        self.num_batches = 0
+        self.busy_time = 0.
+
+        self._buckets = {}
+        self._lock = None
+
+    @classmethod
+    def from_checkpoint(cls, checkfile, model_class, device=None, dtype=None, **kwargs):
+        """
+        Load a predictor from a checkpoint saved by :class:`cormorant.engine.Engine`.
+
+        Parameters
+        ----------
+        checkfile : :obj:`str`
+            Checkpoint (or best model) file.
+        model_class : :obj:`type`
+            Model class that was trained, for instance :class:`cormorant.models.CormorantQM9`.
+        **kwargs
+            Passed on to :class:`Predictor`.
+        """
+        checkpoint = torch.load(checkfile, map_location='cpu', weights_only=False)
+        args, included_species = checkpoint['args'], checkpoint['included_species']
+
+        model = build_model(model_class, args, len(included_species), max(included_species),
+                            device=device, dtype=dtype)
+        model.load_state_dict(checkpoint['model_state'])
+
+        return cls(model, included_species, stats=checkpoint.get('stats'), target=args.target, **kwargs)
+
+    def collate(self, molecules):
+        """
+        Collate a list of ``(charges, positions)`` pairs into a batch.
+        """
+        batch = []
+        for charges, positions in molecules:
+            charges = torch.as_tensor(charges)
+            batch.append({'charges': charges,
+                          'positions': torch.as_tensor(positions, dtype=torch.float),
+                          'species': charges_to_species(charges, self.included_species)})
+
+        return collate_fn(batch)
+
+    def predict(self, molecules):
+        """
+        Predict a list of molecules in a single batch.
+
+        Parameters
+        ----------
+        molecules : :obj:`list` of :obj:`tuple`
+            Atomic numbers and positions of each molecule.
+
+        Returns
+        -------
+        predict : :obj:`torch.Tensor`
+            Prediction for each molecule.
+        """
+        t0 = time.perf_counter()
+
+        with torch.inference_mode():
+            batch = self.collate(molecules)
+            predict = self.cache(self.model, batch) if self.cache is not None else self.model(batch)
+            predict = predict.cpu()
+
+        self.busy_time += time.perf_counter() - t0
+        self.num_molecules += len(molecules)
+        self.num_batches += 1
+
+        return predict * self.sigma + self.mu
+
+    async def submit(self, charges, positions):
+        """
+        Submit a molecule to be predicted as part of a micro-batch.
+
+        Parameters
+        ----------
+        charges : :obj:`list` or :obj:`torch.Tensor`
+            Atomic number of each atom.
+        positions : :obj:`list` or :obj:`torch.Tensor`
+            Positions of each atom.
+
+        Returns
+        -------
+        predict : :obj:`torch.Tensor`
+            Prediction for the molecule.
+        """
+        loop = asyncio.get_running_loop()
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        t0 = time.perf_counter()
+        future = loop.create_future()
+
+        key = len(charges) // self.bucket_width
+        if key not in self._buckets:
+            bucket = self._buckets[key] = []
+            # Deadline of the oldest request in the bucket
+            loop.call_later(self.max_delay, self._flush, key, bucket)
+        self._buckets[key].append(((charges, positions), future))
+
+        if len(self._buckets[key]) >= self.max_batch_size:
+            self._flush(key, self._buckets[key])
+
+        predict = await future
+
+        self.latencies.append(time.perf_counter() - t0)
+        self.num_requests += 1
+
+        return predict
+
+    def _flush(self, key, bucket):
+        """
+        Schedule the pending requests of a bucket, unless it was already scheduled.
+        """
+        if self._buckets.get(key) is bucket:
+            asyncio.ensure_future(self._run(self._buckets.pop(key)))
+
+    async def _run(self, requests):
+        """
+        Run a micro-batch of requests.
+        """
+        molecules, futures = zip(*requests)
+
+        # Batches run one at a time, off the event loop
+        async with self._lock:
+            try:
+                predict = await asyncio.get_running_loop().run_in_executor(None, self.predict, list(molecules))
+            except Exception as error:
+                for future in futures:
+                    future.set_exception(error)
+                return
+
+        for future, value in zip(futures, predict):
+            future.set_result(value)
+
+    def metrics(self):
+        """
+        Latency percentiles (in seconds) and throughput counters.
+        """
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else float('nan')
+
+        return {'requests': self.num_requests,
+                'molecules': self.num_molecules,
+                'batches': self.num_batches,
+                'mean_batch_size': self.num_molecules / max(self.num_batches, 1),
+                'p50': percentile(0.5),
+                'p99': percentile(0.99),
+                'molecules_per_second': self.num_molecules / self.busy_time if self.busy_time > 0 else 0.}
+
+    async def handle(self, reader, writer):
+        """
+        Serve one client connection.
+
+        Each line sent by the client is a JSON object with the keys ``charges``
+        and ``positions`` (and optionally ``id``). Each answer is a JSON line
+        with the ``id`` and the ``prediction``. A line with ``{"metrics": true}``
+        is answered with :meth:`metrics`.
+        """
+        async def answer(request):
+            if request.get('metrics'):
+                response = self.metrics()
+            else:
+                try:
+                    predict = await self.submit(request['charges'], request['positions'])
+                    response = {'id': request.get('id'), 'prediction': predict.tolist()}
+                except Exception as error:
+                    response = {'id': request.get('id'), 'error': str(error)}
+            writer.write((json.dumps(response) + '\n').encode())
+
+        pending = set()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            # Requests on a connection are answered as soon as they are ready,
+            # so that they can share micro-batches with each other
+            task = asyncio.ensure_future(answer(json.loads(line)))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+        if pending:
+            await asyncio.wait(pending)
+        await writer.drain()
+        writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        """
+        Start a JSON-lines server. See :meth:`handle` for the protocol.
+
+        Returns
+        -------
+        server : :obj:`asyncio.AbstractServer`
+            The running server.
+        """
+        server = await asyncio.start_server(self.handle, host, port)
+        logger.info('Serving predictions on {}'.format(', '.join(str(sock.getsockname()) for sock in server.sockets)))
+        return server
+
+
+def main():
+    import cormorant.models
+
+    parser = argparse.ArgumentParser(description='Serve predictions of a trained Cormorant model.')
+    parser.add_argument('checkfile', type=str,
+                        help='Checkpoint file saved during training.')
+    parser.add_argument('--model', type=str, default='CormorantQM9',
+                        help='Model class of the checkpoint. (default: CormorantQM9)')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-delay', type=float, default=0.005,
+                        help='Longest time in seconds a request waits for its micro-batch. (default: 0.005)')
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help='Number of predictions cached in memory. (0 to disable) (default: 0)')
+    parser.add_argument('--cache-path', type=str, default=None,
+                        help='File of the on-disk prediction cache. (default: None)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    cache = PredictionCache(args.cache_size, path=args.cache_path) if args.cache_size > 0 else None
+
+    predictor = Predictor.from_checkpoint(args.checkfile, getattr(cormorant.models, args.model),
+                                          max_batch_size=args.max_batch_size, max_delay=args.max_delay,
+                                          cache=cache)
+
+    async def run():
+        server = await predictor.serve(args.host, args.port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
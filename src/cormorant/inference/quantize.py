@@ -0,0 +1,244 @@
+import torch
+import torch.nn as nn
+
+import copy
+import time
+from typing import List
+
+from cormorant.inference.freeze import FrozenCormorant, _CatMix
+
+
+def quantize(frozen, calibration, num_batches=None):
+    """
+    Post-training int8 quantization of a frozen model for CPU inference.
+
+    The mixing matrices of the edge and atom levels, and the linear layers of
+    the input and output MLPs, are replaced by int8 matrix products. Weights
+    are quantized symmetrically with one scale per output channel. The largest
+    absolute value of each input channel is fitted on the calibration batches.
+    As the activations have a few channels of much larger magnitude, part of
+    the range of each input channel is moved to the weight (as in SmoothQuant),
+    and the rescaled inputs are quantized symmetrically with one scale per
+    layer. Clebsch-Gordan coefficients, spherical harmonics, radial functions
+    and normalizations stay in floating point.
+
+    Parameters
+    ----------
+    frozen : :obj:`FrozenCormorant`
+        Model returned by :func:`cormorant.inference.freeze`.
+    calibration : iterable of :obj:`dict`
+        Batches to fit the input scales on, for instance a
+        :obj:`torch.utils.data.DataLoader` over a sample of the training split.
+    num_batches : :obj:`int`, optional
+        Largest number of calibration batches to use.
+
+    Returns
+    -------
+    quantized : :obj:`FrozenCormorant`
+        Quantized copy of `frozen`.
+    """
+    if not isinstance(frozen, FrozenCormorant):
+        raise ValueError('Can only quantize a FrozenCormorant, got {}'.format(type(frozen).__name__))
+
+    quantized = copy.deepcopy(frozen).eval()
+
+    # The linear layers of the radial functions of an InputMPNN are kept in floating point
+    targets = {name: module for name, module in quantized.named_modules()
+               if isinstance(module, _CatMix) or (isinstance(module, nn.Linear) and '.rad_filt.' not in name)}
+
+    # Largest absolute value of each input channel of each target layer on the calibration batches
+    ranges = {}
+
+    def observe(name):
+        def hook(module, inputs):
+            if isinstance(module, _CatMix):
+                # Real parts of the inputs, then imaginary parts, as in the block matrix
+                dim = -1 if module.scalar else -2
+                parts = [part[..., idx] for idx in range(2) for part in inputs[0]]
+                channels = [part.detach().abs().transpose(dim, -1).reshape(-1, part.shape[dim]).amax(0) for part in parts]
+                channels = torch.cat(channels)
+            else:
+                channels = inputs[0].detach().abs().reshape(-1, module.in_features).amax(0)
+            ranges[name] = torch.maximum(ranges[name], channels) if name in ranges else channels
+        return hook
+
+    handles = [module.register_forward_pre_hook(observe(name)) for name, module in targets.items()]
+    try:
+        with torch.no_grad():
+            for idx, data in enumerate(calibration):
+                if num_batches is not None and idx >= num_batches:
+                    break
+                quantized(data)
+    finally:
+        for handle in handles:
+            handle.remove()
+
+    for name, module in targets.items():
+        if name not in ranges:
+            continue
+        if isinstance(module, _CatMix):
+            layer = _QuantizedCatMix(module, ranges[name])
+        else:
+            layer = _QuantizedLinear(module, ranges[name])
+        _set_submodule(quantized, name, layer)
+
+    return quantized
+
+
+def quantization_report(frozen, quantized, loader, target, stats=None, num_batches=None):
+    """
+    Compare the accuracy and CPU latency of a frozen model and its quantized
+    version on a split, for instance the validation split.
+
+    Parameters
+    ----------
+    frozen : :obj:`FrozenCormorant`
+        Floating point model.
+    quantized : :obj:`FrozenCormorant`
+        Model returned by :func:`quantize`.
+    loader : iterable of :obj:`dict`
+        Batches of the split to evaluate on.
+    target : :obj:`str`
+        Learning target of the model.
+    stats : :obj:`dict`, optional
+        Statistics of the training set, as stored in :attr:`ProcessedDataset.stats`.
+        If `target` is in `stats`, predictions are converted back to the units of the target.
+    num_batches : :obj:`int`, optional
+        Largest number of batches to evaluate.
+
+    Returns
+    -------
+    report : :obj:`dict`
+        Mean absolute error of both models, the largest absolute difference
+        between their predictions, and the time spent in each model.
+    """
+    mu, sigma = (stats or {}).get(target, (0., 1.))
+
+    errors = {'float': 0., 'int8': 0.}
+    latency = {'float': 0., 'int8': 0.}
+    max_difference, num_pts = 0., 0
+
+    with torch.no_grad():
+        for idx, data in enumerate(loader):
+            if num_batches is not None and idx >= num_batches:
+                break
+
+            predictions = {}
+            for name, model in [('float', frozen), ('int8', quantized)]:
+                t0 = time.perf_counter()
+                predictions[name] = model(data) * sigma + mu
+                latency[name] += time.perf_counter() - t0
+
+                errors[name] += (predictions[name] - data[target]).abs().sum().item()
+
+            max_difference = max(max_difference, (predictions['float'] - predictions['int8']).abs().max().item())
+            num_pts += data[target].shape[0]
+
+    return {'mae_float': errors['float'] / max(num_pts, 1),
+            'mae_int8': errors['int8'] / max(num_pts, 1),
+            'max_difference': max_difference,
+            'latency_float': latency['float'],
+            'latency_int8': latency['int8'],
+            'speedup': latency['float'] / latency['int8'] if latency['int8'] > 0 else float('nan')}
+
+
+def _set_submodule(model, name, module):
+    """
+    Replace the submodule `name` of `model`.
+    """
+    parent, _, child = name.rpartition('.')
+    setattr(model.get_submodule(parent) if parent else model, child, module)
+
+
+def _quantize_weight(weight, input_range):
+    """
+    Symmetric int8 quantization of a weight of shape (in, out), with one scale
+    per output channel, and of its input, with one scale per layer.
+
+    The range of each input channel is balanced with the range of the
+    corresponding row of the weight before quantizing.
+
+    Returns
+    -------
+    weight_q : :obj:`torch.Tensor`
+        Quantized weight.
+    input_mult : :obj:`torch.Tensor`
+        Factor of each input channel, mapping the inputs to int8.
+    scale : :obj:`torch.Tensor`
+        Factor of each output channel, mapping the int32 products back.
+    """
+    weight, input_range = weight.double(), input_range.double().clamp(min=1e-8)
+
+    smooth = (input_range / weight.abs().amax(dim=1).clamp(min=1e-8)).sqrt()
+    weight = weight * smooth.unsqueeze(1)
+    input_scale = (input_range / smooth).max() / 127
+
+    weight_scale = weight.abs().amax(dim=0).clamp(min=1e-8) / 127
+    weight_q = torch.round(weight / weight_scale).clamp(-127, 127).to(torch.int8)
+
+    return weight_q.contiguous(), 1 / (smooth * input_scale), weight_scale * input_scale
+
+
+def _int8_matmul(x: torch.Tensor, weight_q: torch.Tensor, input_mult: torch.Tensor, scale: torch.Tensor) -> torch.Tensor:
+    """
+    Product of `x` with an int8 weight, with `x` quantized on the fly.
+    """
+    shape = x.shape
+    x_q = torch.round(x.reshape(-1, shape[-1]) * input_mult).clamp(-127, 127).to(torch.int8)
+
+    out = torch._int_mm(x_q, weight_q).to(x.dtype) * scale
+
+    return out.view(list(shape[:-1]) + [weight_q.shape[1]])
+
+
+class _QuantizedCatMix(nn.Module):
+    """
+    :class:`_CatMix` with an int8 block matrix.
+    """
+    def __init__(self, cat_mix, input_range):
+        super().__init__()
+
+        # The weight is stored as (in, out) in both cases
+        weight = cat_mix.weight if cat_mix.scalar else cat_mix.weight.t()
+        weight_q, input_mult, scale = _quantize_weight(weight, input_range)
+
+        self.scalar = cat_mix.scalar
+        self.register_buffer('weight_q', weight_q)
+        self.register_buffer('input_mult', input_mult.to(cat_mix.weight.dtype))
+        self.register_buffer('scale', scale.to(cat_mix.weight.dtype))
+
+    def forward(self, parts: List[torch.Tensor]) -> torch.Tensor:
+        parts_r: List[torch.Tensor] = []
+        parts_i: List[torch.Tensor] = []
+        for part in parts:
+            parts_r.append(part[..., 0])
+            parts_i.append(part[..., 1])
+
+        if self.scalar:
+            out = _int8_matmul(torch.cat(parts_r + parts_i, dim=-1), self.weight_q, self.input_mult, self.scale)
+            out_r, out_i = out.chunk(2, dim=-1)
+        else:
+            x = torch.cat(parts_r + parts_i, dim=-2).transpose(-1, -2)
+            out = _int8_matmul(x, self.weight_q, self.input_mult, self.scale).transpose(-1, -2)
+            out_r, out_i = out.chunk(2, dim=-2)
+
+        return torch.stack([out_r, out_i], dim=-1)
+
+
+class _QuantizedLinear(nn.Module):
+    """
+    :class:`torch.nn.Linear` with an int8 weight.
+    """
+    def __init__(self, linear, input_range):
+        super().__init__()
+
+        weight_q, input_mult, scale = _quantize_weight(linear.weight.detach().t(), input_range)
+
+        self.register_buffer('weight_q', weight_q)
+        self.register_buffer('input_mult', input_mult.to(linear.weight.dtype))
+        self.register_buffer('scale', scale.to(linear.weight.dtype))
+        self.register_buffer('bias', linear.bias.detach().clone() if linear.bias is not None
+                             else torch.zeros_like(linear.weight[:, 0]).detach())
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return _int8_matmul(x, self.weight_q, self.input_mult, self.scale) + self.bias
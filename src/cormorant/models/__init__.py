@@ -28,4 +28,5 @@ from cormorant.models.cormorant_fassif import CormorantFASSIF
 from cormorant.models.cormorant_clint import CormorantCLINT
 from cormorant.models.cormorant_cyp import CormorantCYP
 from cormorant.models.cormorant_fup import CormorantFUP
+from cormorant.models.cormorant_adme import CormorantADME
 
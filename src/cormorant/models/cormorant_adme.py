@@ -0,0 +1,235 @@
+import torch
+import torch.nn as nn
+
+import logging
+
+from cormorant.cg_lib import CGModule, SphericalHarmonicsRel
+
+from cormorant.models.cormorant_cg import CormorantCG
+
+from cormorant.nn import RadialFilters
+from cormorant.nn import InputLinear
+from cormorant.nn import OutputLinear, OutputLinearMeanPool, GetScalarsAtom
+from cormorant.nn import NoLayer
+from cormorant.nn import species_index
+
+
+class CormorantADME(CGModule):
+    """
+    Cormorant Network with one shared trunk and one output head for each of
+    several ADME endpoints (hERG, PXR, FaSSIF, CYP, CLint, FUP, ...), so that
+    all endpoints are predicted in a single forward pass.
+
+    Parameters
+    ----------
+    maxl : :obj:`int` of :class:`list` of :class:`int`
+        Maximum weight in the output of CG products. (Expanded to list of
+        length :obj:`num_cg_levels`)
+    max_sh : :class:`int` of :class:`list` of :class:`int`
+        Maximum weight in the output of the spherical harmonics  (Expanded to list of
+        length :obj:`num_cg_levels`)
+    num_cg_levels : :class:`int`
+        Number of cg levels to use.
+    num_channels : :class:`int` of :class:`list` of :class:`int`
+        Number of channels that the output of each CG are mixed to (Expanded to list of
+        length :obj:`num_cg_levels`)
+    num_species : :class:`int`
+        Number of species of atoms included in the input dataset.
+    targets : :class:`list` of :class:`str`
+        Names of the learning targets. One output head is created for each.
+    device : :class:`torch.device`
+        Device to initialize the level to
+    dtype : :class:`torch.torch.dtype`
+        Data type to initialize the level to level to
+    dummy_torch_obj: :class:`torch.Tensor`
+        Object created for testing external links.
+    cg_dict : :class:`CGDict <cormorant.cg_lib.CGDict>`
+        Clebsch-gordan dictionary object.
+    """
+    def __init__(self, maxl, max_sh, num_cg_levels, num_channels, num_species,
+                 cutoff_type, hard_cut_rad, soft_cut_rad, soft_cut_width,
+                 weight_init, level_gain, charge_power, basis_set,
+                 charge_scale, gaussian_mask, top, input, num_mpnn_layers, targets,
+                 activation='leakyrelu', cgprod_bounded=False,
+                 cg_agg_normalization='none', cg_pow_normalization='none',
+                 prune_edges=False,
+                 checkpoint_levels=False,
+                 parallel_levels=False,
+                 device=None, dtype=None, cg_dict=None):
+
+        logging.info('Initializing network!')
+        level_gain = expand_var_list(level_gain, num_cg_levels)
+
+        hard_cut_rad = expand_var_list(hard_cut_rad, num_cg_levels)
+        soft_cut_rad = expand_var_list(soft_cut_rad, num_cg_levels)
+        soft_cut_width = expand_var_list(soft_cut_width, num_cg_levels)
+
+        maxl = expand_var_list(maxl, num_cg_levels)
+        max_sh = expand_var_list(max_sh, num_cg_levels)
+        num_channels = expand_var_list(num_channels, num_cg_levels+1)
+
+        logging.info('hard_cut_rad: {}'.format(hard_cut_rad))
+        logging.info('soft_cut_rad: {}'.format(soft_cut_rad))
+        logging.info('soft_cut_width: {}'.format(soft_cut_width))
+        logging.info('maxl: {}'.format(maxl))
+        logging.info('max_sh: {}'.format(max_sh))
+        logging.info('num_channels: {}'.format(num_channels))
+
+        super().__init__(maxl=max(maxl+max_sh), device=device, dtype=dtype, cg_dict=cg_dict)
+        device, dtype, cg_dict = self.device, self.dtype, self.cg_dict
+
+        self.num_cg_levels = num_cg_levels
+        self.num_channels = num_channels
+        self.charge_power = charge_power
+        self.charge_scale = charge_scale
+        self.num_species = num_species
+        self.targets = list(targets)
+
+        # Set up spherical harmonics
+        self.sph_harms = SphericalHarmonicsRel(max(max_sh), conj=True,
+                                               device=device, dtype=dtype, cg_dict=cg_dict)
+
+        # Set up position functions, now independent of spherical harmonics
+        self.rad_funcs = RadialFilters(max_sh, basis_set, num_channels, num_cg_levels,
+                                       device=self.device, dtype=self.dtype)
+        tau_pos = self.rad_funcs.tau
+
+        num_scalars_in = self.num_species * (self.charge_power + 1)
+        num_scalars_out = num_channels[0]
+
+        self.input_func_atom = InputLinear(num_scalars_in, num_scalars_out,
+                                           device=self.device, dtype=self.dtype)
+        self.input_func_edge = NoLayer()
+
+        tau_in_atom = self.input_func_atom.tau
+        tau_in_edge = self.input_func_edge.tau
+
+        self.cormorant_cg = CormorantCG(maxl, max_sh, tau_in_atom, tau_in_edge,
+                     tau_pos, num_cg_levels, num_channels, level_gain, weight_init,
+                     cutoff_type, hard_cut_rad, soft_cut_rad, soft_cut_width,
+                     cat=True, gaussian_mask=False, 
+                     cgprod_bounded=cgprod_bounded,
+                     cg_agg_normalization=cg_agg_normalization,
+                     cg_pow_normalization=cg_pow_normalization,
+                     prune_edges=prune_edges,
+                     checkpoint_levels=checkpoint_levels,
+                     parallel_levels=parallel_levels,
+                     device=self.device, dtype=self.dtype, cg_dict=self.cg_dict)
+
+        tau_cg_levels_atom = self.cormorant_cg.tau_levels_atom
+        tau_cg_levels_edge = self.cormorant_cg.tau_levels_edge
+
+        self.get_scalars_atom = GetScalarsAtom(tau_cg_levels_atom,
+                                               device=self.device, dtype=self.dtype)
+        self.get_scalars_edge = NoLayer()
+
+        num_scalars_atom = self.get_scalars_atom.num_scalars
+        num_scalars_edge = self.get_scalars_edge.num_scalars
+
+        # One output head for each target, all sharing the same scalars
+        self.output_layers_atom = nn.ModuleList([OutputLinearMeanPool(num_scalars_atom, bias=True,
+                                                                      device=self.device, dtype=self.dtype)
+                                                 for target in self.targets])
+        self.output_layer_edge = NoLayer()
+
+        logging.info('Model initialized. Number of parameters: {}'.format(
+            sum([p.nelement() for p in self.parameters()])))
+
+    def forward(self, data, covariance_test=False):
+        """
+        Runs a forward pass of the network.
+
+        Parameters
+        ----------
+        data : :obj:`dict`
+            Dictionary of data to pass to the network.
+        covariance_test : :obj:`bool`, optional
+            If true, returns all of the atom-level representations twice.
+
+        Returns
+        -------
+        prediction : :obj:`torch.Tensor`
+            The output of the layer, with one column for each target in
+            :attr:`targets`.
+        """
+        # Get and prepare the data
+        atom_scalars, species, atom_mask, edge_scalars, edge_mask, atom_positions = self.prepare_input(data)
+
+        # Calculate spherical harmonics (unless precomputed by GeometryCollate) and radial functions
+        spherical_harmonics, norms = self.sph_harms.from_batch(data, atom_positions)
+        edge_pairs = self.cormorant_cg.edge_pairs(edge_mask, norms, pairs=data.get('edge_pairs'),
+                                                  cutoff=data.get('edge_cutoff'))
+        rad_func_levels = self.rad_funcs(norms, edge_mask * (norms > 0), pairs=edge_pairs)
+
+        # Prepare the input reps for both the atom and edge network
+        atom_reps_in = self.input_func_atom(atom_scalars, atom_mask, edge_scalars, edge_mask, norms, species=species)
+        edge_net_in = self.input_func_edge(atom_scalars, atom_mask, edge_scalars, edge_mask, norms)
+
+        # Clebsch-Gordan layers central to the network
+        atoms_all, edges_all = self.cormorant_cg(atom_reps_in, atom_mask, edge_net_in, edge_mask,
+                                                 rad_func_levels, norms, spherical_harmonics,
+                                                 pairs=edge_pairs)
+
+        # Construct scalars for network output
+        atom_scalars = self.get_scalars_atom(atoms_all)
+        edge_scalars = self.get_scalars_edge(edges_all)
+
+        # Prediction in this case will depend only on the atom_scalars. Can make
+        # it more general here.
+        prediction = torch.stack([output_layer(atom_scalars, atom_mask)
+                                  for output_layer in self.output_layers_atom], dim=-1)
+
+        # Covariance test
+        if covariance_test:
+            return prediction, atoms_all, atoms_all
+        else:
+            return prediction
+
+    def prepare_input(self, data):
+        """
+        Extracts input from data class
+
+        Parameters
+        ----------
+        data : ?????
+            Information on the state of the system.
+
+        Returns
+        -------
+        atom_scalars : :obj:`torch.Tensor`
+            Powers of the charge of each atom.
+        species : :obj:`torch.Tensor`
+            Species index of each atom.
+        atom_mask : :obj:`torch.Tensor`
+            Mask used for batching data.
+        atom_positions: :obj:`torch.Tensor`
+            Positions of the atoms
+        edge_mask: :obj:`torch.Tensor`
+            Mask used for batching data.
+        """
+        charge_power, charge_scale, device, dtype = self.charge_power, self.charge_scale, self.device, self.dtype
+
+        atom_positions = data['positions'].to(device, dtype)
+        species = species_index(data).to(device)
+        charges = data['charges'].to(device, dtype)
+
+        atom_mask = data['atom_mask'].to(device)
+        edge_mask = data['edge_mask'].to(device)
+
+        charge_tensor = (charges.unsqueeze(-1)/charge_scale).pow(torch.arange(charge_power+1., device=device, dtype=dtype))
+        # The input layer looks up the weights of the species of each atom, rather
+        # than multiplying them with the one-hot encoding of the species
+        atom_scalars = charge_tensor
+
+        edge_scalars = torch.tensor([])
+
+        return atom_scalars, species, atom_mask, edge_scalars, edge_mask, atom_positions
+
+def expand_var_list(var, num_cg_levels):
+    if type(var) is list:
+        var_list = var + (num_cg_levels-len(var))*[var[-1]]
+    elif type(var) in [float, int]:
+        var_list = [var] * num_cg_levels
+    else:
+        raise ValueError('Incorrect type {}'.format(type(var)))
+    return var_list
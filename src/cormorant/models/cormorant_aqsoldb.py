@@ -11,6 +11,7 @@ from cormorant.nn import RadialFilters
 from cormorant.nn import InputLinear
 from cormorant.nn import OutputLinear, OutputLinearMeanPool, GetScalarsAtom
 from cormorant.nn import NoLayer
+from cormorant.nn import species_index
 
 import logging
 
@@ -49,6 +50,9 @@ class CormorantAqSolDB(CGModule):
                  charge_scale, gaussian_mask, top, input, num_mpnn_layers, 
                  activation='leakyrelu', cgprod_bounded=False,
                  cg_agg_normalization='none', cg_pow_normalization='none',
+                 prune_edges=False,
+                 checkpoint_levels=False,
+                 parallel_levels=False,
                  device=None, dtype=None, cg_dict=None):
 
         logging.info('Initializing network!')
@@ -72,8 +76,6 @@ class CormorantAqSolDB(CGModule):
         super().__init__(maxl=max(maxl+max_sh), device=device, dtype=dtype, cg_dict=cg_dict)
         device, dtype, cg_dict = self.device, self.dtype, self.cg_dict
 
-        print('CGDICT', cg_dict.maxl)
-
         self.num_cg_levels = num_cg_levels
         self.num_channels = num_channels
         self.charge_power = charge_power
@@ -106,6 +108,9 @@ class CormorantAqSolDB(CGModule):
                      cgprod_bounded=cgprod_bounded,
                      cg_agg_normalization=cg_agg_normalization, 
                      cg_pow_normalization=cg_pow_normalization,
+                     prune_edges=prune_edges,
+                     checkpoint_levels=checkpoint_levels,
+                     parallel_levels=parallel_levels,
                      device=self.device, dtype=self.dtype, cg_dict=self.cg_dict)
 
         tau_cg_levels_atom = self.cormorant_cg.tau_levels_atom
@@ -144,19 +149,22 @@ class CormorantAqSolDB(CGModule):
             The output of the layer
         """
         # Get and prepare the data
-        atom_scalars, atom_mask, edge_scalars, edge_mask, atom_positions = self.prepare_input(data)
+        atom_scalars, species, atom_mask, edge_scalars, edge_mask, atom_positions = self.prepare_input(data)
 
-        # Calculate spherical harmonics and radial functions
-        spherical_harmonics, norms = self.sph_harms(atom_positions, atom_positions)
-        rad_func_levels = self.rad_funcs(norms, edge_mask * (norms > 0))
+        # Calculate spherical harmonics (unless precomputed by GeometryCollate) and radial functions
+        spherical_harmonics, norms = self.sph_harms.from_batch(data, atom_positions)
+        edge_pairs = self.cormorant_cg.edge_pairs(edge_mask, norms, pairs=data.get('edge_pairs'),
+                                                  cutoff=data.get('edge_cutoff'))
+        rad_func_levels = self.rad_funcs(norms, edge_mask * (norms > 0), pairs=edge_pairs)
 
         # Prepare the input reps for both the atom and edge network
-        atom_reps_in = self.input_func_atom(atom_scalars, atom_mask, edge_scalars, edge_mask, norms)
+        atom_reps_in = self.input_func_atom(atom_scalars, atom_mask, edge_scalars, edge_mask, norms, species=species)
         edge_net_in = self.input_func_edge(atom_scalars, atom_mask, edge_scalars, edge_mask, norms)
 
         # Clebsch-Gordan layers central to the network
         atoms_all, edges_all = self.cormorant_cg(atom_reps_in, atom_mask, edge_net_in, edge_mask,
-                                                 rad_func_levels, norms, spherical_harmonics)
+                                                 rad_func_levels, norms, spherical_harmonics,
+                                                 pairs=edge_pairs)
 
         # Construct scalars for network output
         atom_scalars = self.get_scalars_atom(atoms_all)
@@ -184,7 +192,9 @@ class CormorantAqSolDB(CGModule):
         Returns
         -------
         atom_scalars : :obj:`torch.Tensor`
-            Tensor of scalars for each atom.
+            Powers of the charge of each atom.
+        species : :obj:`torch.Tensor`
+            Species index of each atom.
         atom_mask : :obj:`torch.Tensor`
             Mask used for batching data.
         atom_positions: :obj:`torch.Tensor`
@@ -195,19 +205,20 @@ class CormorantAqSolDB(CGModule):
         charge_power, charge_scale, device, dtype = self.charge_power, self.charge_scale, self.device, self.dtype
 
         atom_positions = data['positions'].to(device, dtype)
-        one_hot = data['one_hot'].to(device, dtype)
+        species = species_index(data).to(device)
         charges = data['charges'].to(device, dtype)
 
         atom_mask = data['atom_mask'].to(device)
         edge_mask = data['edge_mask'].to(device)
 
         charge_tensor = (charges.unsqueeze(-1)/charge_scale).pow(torch.arange(charge_power+1., device=device, dtype=dtype))
-        charge_tensor = charge_tensor.view(charges.shape + (1, charge_power+1))
-        atom_scalars = (one_hot.unsqueeze(-1) * charge_tensor).view(charges.shape[:2] + (-1,))
+        # The input layer looks up the weights of the species of each atom, rather
+        # than multiplying them with the one-hot encoding of the species
+        atom_scalars = charge_tensor
 
         edge_scalars = torch.tensor([])
 
-        return atom_scalars, atom_mask, edge_scalars, edge_mask, atom_positions
+        return atom_scalars, species, atom_mask, edge_scalars, edge_mask, atom_positions
 
 def expand_var_list(var, num_cg_levels):
     if type(var) is list:
@@ -1,11 +1,13 @@
 import torch
 import torch.nn as nn
+from torch.utils.checkpoint import checkpoint
 
 from cormorant.models import CormorantAtomLevel, CormorantEdgeLevel
 
 from cormorant.nn import MaskLevel, DotMatrix
 from cormorant.nn import CatMixReps
 from cormorant.cg_lib import CGProduct, CGModule
+from cormorant.so3_lib import SO3Vec, SO3Scalar
 
 import logging
 
@@ -17,11 +19,14 @@ class CormorantCG(CGModule):
                  cutoff_type, hard_cut_rad, soft_cut_rad, soft_cut_width,
                  cat=True, gaussian_mask=False, cgprod_bounded=False,
                  cg_agg_normalization='none', cg_pow_normalization='none',
+                 checkpoint_levels=False, prune_edges=False, parallel_levels=False,
                  device=None, dtype=None, cg_dict=None):
         super().__init__(device=device, dtype=dtype, cg_dict=cg_dict)
         device, dtype, cg_dict = self.device, self.dtype, self.cg_dict
 
         self.max_sh = max_sh
+        self.checkpoint_levels = checkpoint_levels
+        self.prune_edges = prune_edges
 
         tau_atom_in = atom_in.tau if type(tau_in_atom) is CGModule else tau_in_atom
         tau_edge_in = edge_in.tau if type(tau_in_edge) is CGModule else tau_in_edge
@@ -48,6 +53,7 @@ class CormorantCG(CGModule):
                                           cgprod_bounded=cgprod_bounded,
                                           cg_agg_normalization=cg_agg_normalization, 
                                           cg_pow_normalization=cg_pow_normalization,
+                                          parallel=parallel_levels,
                                           device=device, dtype=dtype, cg_dict=cg_dict)
             atom_levels.append(atom_lvl)
             tau_atom = atom_lvl.tau
@@ -60,7 +66,67 @@ class CormorantCG(CGModule):
         self.tau_levels_atom = [level.tau for level in atom_levels]
         self.tau_levels_edge = [level.tau for level in edge_levels]
 
-    def forward(self, atom_reps, atom_mask, edge_net, edge_mask, rad_funcs, norms, sph_harm):
+    @property
+    def support_radii(self):
+        """
+        Radius at each level beyond which edges are guaranteed to be zero,
+        or ``None`` if the cutoff at that level has infinite support.
+        """
+        return [level.mask_layer.support_radius for level in self.edge_levels]
+
+    def edge_pairs(self, edge_mask, norms, pairs=None, cutoff=None):
+        """
+        Find the edges that can be non-zero at some CG level.
+
+        Every edge level masks its output with a :class:`MaskLevel`. If all of
+        these masks have compact support (a hard cutoff or a ``cos``/``poly``
+        envelope), the edges outside of the union of the supports are exactly
+        zero at every level, and can be dropped without changing the result.
+
+        Parameters
+        ----------
+        edge_mask : :obj:`torch.Tensor`
+            Batch mask for the edges.
+        norms : :obj:`torch.Tensor`
+            Matrix of the magnitudes of relative position vectors of pairs of atoms.
+        pairs : :obj:`torch.Tensor`, optional
+            Indices ``(batch, i, j)`` of the edges shorter than `cutoff`, as
+            computed in the DataLoader workers by
+            :class:`cormorant.data.collate.GeometryCollate`. They are used
+            when the support of every mask is within `cutoff`.
+        cutoff : :obj:`torch.Tensor` or :obj:`float`, optional
+            Largest length of the edges in `pairs`.
+
+        Returns
+        -------
+        pairs : :obj:`tuple` of :obj:`torch.Tensor` or None
+            Indices ``(batch, i, j)`` of the edges to keep, to be passed to
+            :meth:`forward` and :class:`cormorant.nn.RadialFilters`. If
+            :attr:`prune_edges` is not set, or some level has a cutoff with
+            infinite support, ``None`` is returned and the dense path is used.
+
+        Notes
+        -----
+        The number of edges kept depends on the data, so this uses a dynamic
+        shape and synchronizes with the device. It is intended for eager
+        CPU/GPU execution, and should be left off for graph-compiler backends.
+        """
+        mask_layers = [level.mask_layer for level in self.edge_levels]
+
+        if not self.prune_edges or not all(mask.compact_support for mask in mask_layers):
+            return None
+
+        if pairs is not None and all(mask.support_radius <= float(cutoff) for mask in mask_layers):
+            return tuple(pairs.to(edge_mask.device))
+
+        support = torch.zeros_like(edge_mask, dtype=torch.bool)
+        for mask in mask_layers:
+            support = support | mask.edge_support(edge_mask, norms)
+
+        return support.nonzero(as_tuple=True)
+
+    def forward(self, atom_reps, atom_mask, edge_net, edge_mask, rad_funcs, norms, sph_harm, pairs=None,
+                fixed_atoms=None):
         """
         Runs a forward pass of the Cormorant CG layers.
 
@@ -84,6 +150,15 @@ class CormorantCG(CGModule):
         sph_harm : SO3 Vector
             Representation of spherical harmonics calculated from the relative
             position vectors of pairs of points.
+        pairs : :obj:`tuple` of :obj:`torch.Tensor`, optional
+            Edges to restrict the edge and atom levels to, as returned by
+            :meth:`edge_pairs`. The radial filters `rad_funcs` must then be
+            evaluated on the same edges.
+        fixed_atoms : :obj:`tuple` of :obj:`list`, optional
+            Pair ``(atoms_fixed, fixed_mask)`` of known atom representations
+            at each level, and masks of the atoms they are used for. After
+            each level, the output for these atoms is replaced by the known
+            representations before being passed on to the next level.
 
         Returns
         -------
@@ -91,21 +166,57 @@ class CormorantCG(CGModule):
             The concatenated output of the representations output at each level.
         edges_all : list of SO3 Scalars
             The concatenated output of the scalar edge network output at each level.
+            If `pairs` is specified, these only include the edges in `pairs`.
+
+        Notes
+        -----
+        If :attr:`checkpoint_levels` is set, each (edge level, atom level) pair
+        is wrapped in activation checkpointing during training. Only the outputs
+        of each level are kept for the backward pass, and the intermediate edge
+        representations and CG products are recomputed. Peak memory then scales
+        with a single level instead of with the number of CG levels.
         """
         assert len(self.atom_levels) == len(self.edge_levels) == len(rad_funcs)
 
+        # Restrict the edge inputs to the edges that can be non-zero
+        if pairs is not None:
+            edge_mask, norms = edge_mask[pairs], norms[pairs]
+            sph_harm = SO3Vec([part[pairs] for part in sph_harm])
+            if edge_net is not None:
+                edge_net = SO3Scalar([part[pairs] for part in edge_net])
+
         # Construct iterated multipoles
         atoms_all = []
         edges_all = []
 
-        for idx, (atom_level, edge_level, max_sh) in enumerate(zip(self.atom_levels, self.edge_levels, self.max_sh)):
- 
-            edge_net = edge_level(edge_net, atom_reps, rad_funcs[idx], edge_mask, norms)
-            edge_reps = edge_net * sph_harm[:max_sh+1]
-            atom_reps = atom_level(atom_reps, edge_reps, atom_mask)
+        for idx in range(len(self.atom_levels)):
+
+            if self.checkpoint_levels and self.training and torch.is_grad_enabled():
+                edge_net, atom_reps = checkpoint(self._forward_level, idx, atom_reps, atom_mask, edge_net, edge_mask,
+                                                 rad_funcs[idx], norms, sph_harm, pairs, use_reentrant=False)
+            else:
+                edge_net, atom_reps = self._forward_level(idx, atom_reps, atom_mask, edge_net, edge_mask,
+                                                          rad_funcs[idx], norms, sph_harm, pairs)
+
+            if fixed_atoms is not None:
+                atoms_fixed, fixed_mask = fixed_atoms[0][idx], fixed_atoms[1][idx]
+                atom_reps = SO3Vec([torch.where(fixed_mask.view(fixed_mask.shape + (1, 1, 1)), fixed, part)
+                                    for fixed, part in zip(atoms_fixed, atom_reps)])
 
             atoms_all.append(atom_reps)
             edges_all.append(edge_net)
 
         return atoms_all, edges_all
 
+    def _forward_level(self, idx, atom_reps, atom_mask, edge_net, edge_mask, rad_func, norms, sph_harm, pairs=None):
+        """
+        Runs the edge level and atom level at level `idx`.
+        """
+        atom_level, edge_level, max_sh = self.atom_levels[idx], self.edge_levels[idx], self.max_sh[idx]
+
+        edge_net = edge_level(edge_net, atom_reps, rad_func, edge_mask, norms, pairs=pairs)
+        edge_reps = edge_net * sph_harm[:max_sh+1]
+        atom_reps = atom_level(atom_reps, edge_reps, atom_mask, pairs=pairs)
+
+        return edge_net, atom_reps
+
@@ -11,6 +11,11 @@ from cormorant.nn import RadialFilters
 from cormorant.nn import InputLinear, InputMPNN
 from cormorant.nn import OutputLinear, OutputPMLP, OutputSoftmax, GetScalarsAtom
 from cormorant.nn import NoLayer
+from cormorant.nn import species_index, species_scalars
+
+from cormorant.so3_lib import SO3Vec, SO3Scalar
+from cormorant.data.collate import stack_siamese
+from cormorant.models.embedding_cache import EmbeddingCache
 
 
 class CormorantLEP(CGModule):
@@ -32,6 +37,13 @@ class CormorantLEP(CGModule):
         length :obj:`num_cg_levels`)
     num_species : :obj:`int`
         Number of species of atoms included in the input dataset.
+    stack_pairs : :obj:`bool`
+        Run both structures of each pair through the network as a single
+        padded batch, instead of running one after the other.
+    embedding_cache : :obj:`float`
+        Memory budget in MB of a cache of the atom scalars of each structure,
+        keyed on its charges and positions. The cache is only used when the
+        encoder does not require gradients. (0 to disable)
 
     device : :obj:`torch.device`
         Device to initialize the level to
@@ -45,6 +57,9 @@ class CormorantLEP(CGModule):
                  charge_scale, gaussian_mask, #top, input, num_mpnn_layers, 
                  activation='leakyrelu', num_classes=2, cgprod_bounded=False,
                  cg_agg_normalization='none', cg_pow_normalization='none',
+                 prune_edges=False,
+                 checkpoint_levels=False,
+                 parallel_levels=False, stack_pairs=True, embedding_cache=0,
                  device=None, dtype=None, cg_dict=None):
 
         logging.info('Initializing network!')
@@ -69,6 +84,8 @@ class CormorantLEP(CGModule):
         device, dtype, cg_dict = self.device, self.dtype, self.cg_dict
 
         self.num_cg_levels = num_cg_levels
+        self.stack_pairs = stack_pairs
+        self.embedding_cache = EmbeddingCache(int(embedding_cache * 2**20)) if embedding_cache > 0 else None
         self.num_channels = num_channels
         self.charge_power = charge_power
         self.charge_scale = charge_scale
@@ -100,6 +117,9 @@ class CormorantLEP(CGModule):
                      cgprod_bounded=cgprod_bounded,
                      cg_agg_normalization=cg_agg_normalization, 
                      cg_pow_normalization=cg_pow_normalization,
+                     prune_edges=prune_edges,
+                     checkpoint_levels=checkpoint_levels,
+                     parallel_levels=parallel_levels,
                      device=self.device, dtype=self.dtype, cg_dict=self.cg_dict)
 
         tau_cg_levels_atom = self.cormorant_cg.tau_levels_atom
@@ -120,7 +140,19 @@ class CormorantLEP(CGModule):
             sum([p.nelement() for p in self.parameters()])))
 
 
-    def forward_once(self, data):
+    @property
+    def encoder_frozen(self):
+        """
+        True if none of the parameters of the layers before the output layer require gradients.
+        """
+        encoder = [self.rad_funcs, self.input_func_atom, self.cormorant_cg, self.get_scalars_atom]
+        return not any(param.requires_grad for module in encoder for param in module.parameters())
+
+    def _encoder_version(self):
+        encoder = [self.rad_funcs, self.input_func_atom, self.cormorant_cg, self.get_scalars_atom]
+        return tuple(param._version for module in encoder for param in module.parameters())
+
+    def forward_once(self, data, use_cache=True):
         """
         Runs a single forward pass of the network.
 
@@ -128,8 +160,9 @@ class CormorantLEP(CGModule):
         ----------
         data : :obj:`dict`
             Dictionary of data to pass to the network.
-        covariance_test : :obj:`bool`, optional
-            If true, returns all of the atom-level representations twice.
+        use_cache : :obj:`bool`, optional
+            If true, use the embedding cache when possible. The atom-level and
+            edge-level representations are then not returned.
 
         Returns
         -------
@@ -139,9 +172,47 @@ class CormorantLEP(CGModule):
         # Get and prepare the data
         atom_scalars, atom_mask, edge_scalars, edge_mask, atom_positions = self.prepare_input(data)
 
+        use_cache = use_cache and self.embedding_cache is not None and \
+            (self.encoder_frozen or not torch.is_grad_enabled())
+
+        if use_cache:
+            # Cached entries are only valid for the current encoder weights
+            self.embedding_cache.validate(self._encoder_version())
+
+            # Only encode the structures that are not in the cache
+            def encode(idx):
+                return self.encode(atom_scalars[idx], atom_mask[idx], edge_scalars,
+                                   edge_mask[idx], atom_positions[idx])[0]
+
+            atom_scalars = self.embedding_cache(encode, data['charges'], data['positions'], atom_mask)
+            atoms_all, edges_all = None, None
+        else:
+            atom_scalars, atoms_all, edges_all = self.encode(atom_scalars, atom_mask, edge_scalars,
+                                                             edge_mask, atom_positions)
+
+        # Prediction in this case will depend only on the atom_scalars. Can make
+        # it more general here.
+        prediction = self.output_layer_atom(atom_scalars, atom_mask)
+
+        return prediction, atoms_all, edges_all
+
+    def encode(self, atom_scalars, atom_mask, edge_scalars, edge_mask, atom_positions):
+        """
+        Runs the layers of the network before the output layer.
+
+        Returns
+        -------
+        atom_scalars : :obj:`torch.Tensor`
+            Scalars of each atom, taken from all levels of the network.
+        atoms_all : :obj:`list` of :obj:`SO3Vec`
+            The atom-level representations of each level.
+        edges_all : :obj:`list` of :obj:`SO3Scalar`
+            The edge-level representations of each level.
+        """
         # Calculate spherical harmonics and radial functions
         spherical_harmonics, norms = self.sph_harms(atom_positions, atom_positions)
-        rad_func_levels = self.rad_funcs(norms, edge_mask * (norms > 0))
+        edge_pairs = self.cormorant_cg.edge_pairs(edge_mask, norms)
+        rad_func_levels = self.rad_funcs(norms, edge_mask * (norms > 0), pairs=edge_pairs)
 
         # Prepare the input reps for both the atom and edge network
         atom_reps_in = self.input_func_atom(atom_scalars, atom_mask, edge_scalars, edge_mask, norms)
@@ -149,17 +220,14 @@ class CormorantLEP(CGModule):
 
         # Clebsch-Gordan layers central to the network
         atoms_all, edges_all = self.cormorant_cg(atom_reps_in, atom_mask, edge_net_in, edge_mask,
-                                                 rad_func_levels, norms, spherical_harmonics)
+                                                 rad_func_levels, norms, spherical_harmonics,
+                                                 pairs=edge_pairs)
 
         # Construct scalars for network output
         atom_scalars = self.get_scalars_atom(atoms_all)
         edge_scalars = self.get_scalars_edge(edges_all)
 
-        # Prediction in this case will depend only on the atom_scalars. Can make
-        # it more general here.
-        prediction = self.output_layer_atom(atom_scalars, atom_mask)
-
-        return prediction, atoms_all, edges_all
+        return atom_scalars, atoms_all, edges_all
  
 
     def forward(self, data, covariance_test=False):
@@ -179,23 +247,38 @@ class CormorantLEP(CGModule):
             The output of the network
         """
 
-        data1 = {}
-        data2 = {}
-        data1['label'] = data['label']
-        data2['label'] = data['label']
-        data1['charges']   = data['charges1']
-        data2['charges']   = data['charges2']
-        data1['positions'] = data['positions1']
-        data2['positions'] = data['positions2']
-        data1['one_hot']   = data['one_hot1']
-        data2['one_hot']   = data['one_hot2']
-        data1['atom_mask'] = data['atom_mask1']
-        data2['atom_mask'] = data['atom_mask2']
-        data1['edge_mask'] = data['edge_mask1']
-        data2['edge_mask'] = data['edge_mask2']
-
-        prediction1, atoms_all1, edges_all1 = self.forward_once(data1)
-        prediction2, atoms_all2, edges_all2 = self.forward_once(data2)
+        if self.stack_pairs:
+            # Run both structures through the network as a single batch
+            num_pairs = data['charges1'].shape[0]
+
+            prediction, atoms_all, edges_all = self.forward_once(stack_siamese(data), use_cache=not covariance_test)
+
+            prediction1, prediction2 = prediction[:num_pairs], prediction[num_pairs:]
+            if covariance_test:
+                atoms_all1 = [SO3Vec([part[:num_pairs] for part in atoms]) for atoms in atoms_all]
+                # Pruned edges are stored as a flat list of pairs, and cannot be split by structure
+                if self.cormorant_cg.prune_edges:
+                    edges_all1 = edges_all
+                else:
+                    edges_all1 = [SO3Scalar([part[:num_pairs] for part in edges]) for edges in edges_all]
+        else:
+            data1 = {}
+            data2 = {}
+            data1['label'] = data['label']
+            data2['label'] = data['label']
+            data1['charges']   = data['charges1']
+            data2['charges']   = data['charges2']
+            data1['positions'] = data['positions1']
+            data2['positions'] = data['positions2']
+            data1['one_hot']   = data['one_hot1']
+            data2['one_hot']   = data['one_hot2']
+            data1['atom_mask'] = data['atom_mask1']
+            data2['atom_mask'] = data['atom_mask2']
+            data1['edge_mask'] = data['edge_mask1']
+            data2['edge_mask'] = data['edge_mask2']
+
+            prediction1, atoms_all1, edges_all1 = self.forward_once(data1, use_cache=not covariance_test)
+            prediction2, atoms_all2, edges_all2 = self.forward_once(data2, use_cache=not covariance_test)
 
         prediction = (prediction2 - prediction1)**2
 
@@ -229,15 +312,14 @@ class CormorantLEP(CGModule):
         charge_power, charge_scale, device, dtype = self.charge_power, self.charge_scale, self.device, self.dtype
 
         atom_positions = data['positions'].to(device, dtype)
-        one_hot = data['one_hot'].to(device, dtype)
+        species = species_index(data).to(device)
         charges = data['charges'].to(device, dtype)
 
         atom_mask = data['atom_mask'].to(device)
         edge_mask = data['edge_mask'].to(device)
 
         charge_tensor = (charges.unsqueeze(-1)/charge_scale).pow(torch.arange(charge_power+1., device=device, dtype=dtype))
-        charge_tensor = charge_tensor.view(charges.shape + (1, charge_power+1))
-        atom_scalars = (one_hot.unsqueeze(-1) * charge_tensor).view(charges.shape[:2] + (-1,))
+        atom_scalars = species_scalars(species, charge_tensor, self.num_species)
 
         edge_scalars = torch.tensor([])
 
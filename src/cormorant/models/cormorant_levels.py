@@ -5,6 +5,7 @@ from cormorant.cg_lib import CGProduct, CGModule
 
 from cormorant.nn import MaskLevel
 from cormorant.nn import CatMixReps, DotMatrix
+from cormorant.nn.utils import run_parallel
 
 import logging
 
@@ -71,10 +72,34 @@ class CormorantEdgeLevel(CGModule):
         self.mask_layer = MaskLevel(nout, hard_cut_rad, soft_cut_rad, soft_cut_width, cutoff_type,
                                     gaussian_mask=gaussian_mask, device=self.device, dtype=self.dtype)
 
-    def forward(self, edge_in, atom_reps, pos_funcs, base_mask, norms):
+    def forward(self, edge_in, atom_reps, pos_funcs, base_mask, norms, pairs=None):
+        """
+        Runs a forward pass of the network.
+
+        Parameters
+        ----------
+        edge_in : SO3Scalar or None
+            Edge network from the previous level.
+        atom_reps : SO3Vec
+            Representation of the atomic environment.
+        pos_funcs : SO3Scalar
+            Radial functions of the relative positions.
+        base_mask : pytorch Tensor
+            Mask determining which edges are active.
+        norms : pytorch Tensor
+            Pairwise distances between atoms.
+        pairs : tuple of pytorch Tensors, optional
+            Indices ``(batch, i, j)`` of the edges to compute. If specified,
+            `edge_in`, `pos_funcs`, `base_mask` and `norms` are given on those
+            edges only, and so is the output.
 
+        Returns
+        -------
+        edge_net : SO3Scalar
+            Output edge network.
+        """
         # Caculate the dot product matrix.
-        edge_dot = self.dot_matrix(atom_reps)
+        edge_dot = self.dot_matrix(atom_reps, pairs=pairs)
 
         # Concatenate and mix the three different types of edge features together
         edge_mix = self.cat_mix([edge_in, edge_dot, pos_funcs])
@@ -110,6 +135,10 @@ class CormorantAtomLevel(CGModule):
         Gain for the weights at each level.
     cgprod_bounded : :obj:`bool`
         Sets the CG product to bounded. Default: False.
+    parallel : :obj:`bool`
+        Run the CG aggregation and the CG power concurrently on separate
+        threads. These do not depend on each other, so on many-core CPUs
+        they can overlap. Default: False.
 
     device : :obj:`torch.device`
         Device to initialize the level to
@@ -121,12 +150,13 @@ class CormorantAtomLevel(CGModule):
     """
     def __init__(self, tau_in, tau_pos, maxl, num_channels, level_gain, weight_init,
                  cgprod_bounded=False, device=None, dtype=None, cg_dict=None,
-                 cg_agg_normalization = 'none', cg_pow_normalization='none'):
+                 cg_agg_normalization = 'none', cg_pow_normalization='none', parallel=False):
         super().__init__(maxl=maxl, device=device, dtype=dtype, cg_dict=cg_dict)
         device, dtype, cg_dict = self.device, self.dtype, self.cg_dict
 
         self.tau_in = tau_in
         self.tau_pos = tau_pos
+        self.parallel = parallel
 
         # Operations linear in input reps
         self.cg_aggregate = CGProduct(tau_pos, tau_in, maxl=self.maxl, aggregate=True,
@@ -144,7 +174,7 @@ class CormorantAtomLevel(CGModule):
                                   device=self.device, dtype=self.dtype)
         self.tau = self.cat_mix.tau
 
-    def forward(self, atom_reps, edge_reps, mask):
+    def forward(self, atom_reps, edge_reps, mask, pairs=None):
         """
         Runs a forward pass of the network.
 
@@ -156,6 +186,9 @@ class CormorantAtomLevel(CGModule):
             Representation of the connections between atoms
         mask : pytorch Tensor
             Mask determining which elements of atom_reps are active.
+        pairs : tuple of pytorch Tensors, optional
+            Indices ``(batch, i, j)`` of the edges in `edge_reps`, if it
+            is only given on a subset of the edges.
 
         Returns
         -------
@@ -163,11 +196,16 @@ class CormorantAtomLevel(CGModule):
             Output representation of the atomic environment.
         """
 
-        # Aggregate information based upon edge reps
-        reps_ag = self.cg_aggregate(edge_reps, atom_reps)
+        if self.parallel:
+            # The aggregation and the CG non-linearity are independent
+            reps_sq, reps_ag = run_parallel((self.cg_power, (atom_reps, atom_reps)),
+                                            (self.cg_aggregate, (edge_reps, atom_reps, pairs)))
+        else:
+            # Aggregate information based upon edge reps
+            reps_ag = self.cg_aggregate(edge_reps, atom_reps, pairs=pairs)
 
-        # CG non-linearity for each atom
-        reps_sq = self.cg_power(atom_reps, atom_reps)
+            # CG non-linearity for each atom
+            reps_sq = self.cg_power(atom_reps, atom_reps)
 
         # Concatenate and mix results
         reps_out = self.cat_mix([reps_ag, atom_reps, reps_sq])
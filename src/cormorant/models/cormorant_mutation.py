@@ -2,6 +2,7 @@ import torch
 import torch.nn as nn
 
 import logging
+from itertools import accumulate
 
 from cormorant.cg_lib import CGModule, SphericalHarmonicsRel
 
@@ -11,6 +12,11 @@ from cormorant.nn import RadialFilters
 from cormorant.nn import InputLinear, InputMPNN
 from cormorant.nn import OutputLinear, OutputPMLP, OutputSoftmax, GetScalarsAtom
 from cormorant.nn import NoLayer
+from cormorant.nn import species_index, species_scalars
+
+from cormorant.so3_lib import SO3Vec, SO3Scalar
+from cormorant.data.collate import stack_siamese
+from cormorant.models.embedding_cache import EmbeddingCache
 
 
 class CormorantMutation(CGModule):
@@ -32,6 +38,18 @@ class CormorantMutation(CGModule):
         length :obj:`num_cg_levels`)
     num_species : :obj:`int`
         Number of species of atoms included in the input dataset.
+    stack_pairs : :obj:`bool`
+        Run both structures of each pair through the network as a single
+        padded batch, instead of running one after the other.
+    embedding_cache : :obj:`float`
+        Memory budget in MB of a cache of the atom scalars of each structure,
+        keyed on its charges and positions. The cache is only used when the
+        encoder does not require gradients. (0 to disable)
+    incremental : :obj:`bool`
+        Only re-evaluate the atoms of the second (mutant) structure that are
+        within the receptive field of the atoms that differ from the first
+        (wildtype) structure, and reuse the wildtype representations for all
+        other atoms. Requires cutoffs with compact support at every level.
 
     device : :obj:`torch.device`
         Device to initialize the level to
@@ -43,6 +61,9 @@ class CormorantMutation(CGModule):
                  cutoff_type, hard_cut_rad, soft_cut_rad, soft_cut_width,
                  weight_init, level_gain, charge_power, basis_set,
                  charge_scale, gaussian_mask, num_classes=2, 
+                 prune_edges=False,
+                 checkpoint_levels=False,
+                 parallel_levels=False, stack_pairs=True, embedding_cache=0, incremental=False,
                  device=None, dtype=None, cg_dict=None):
 
         logging.info('Initializing network!')
@@ -67,6 +88,9 @@ class CormorantMutation(CGModule):
         device, dtype, cg_dict = self.device, self.dtype, self.cg_dict
 
         self.num_cg_levels = num_cg_levels
+        self.stack_pairs = stack_pairs
+        self.incremental = incremental
+        self.embedding_cache = EmbeddingCache(int(embedding_cache * 2**20)) if embedding_cache > 0 else None
         self.num_channels = num_channels
         self.charge_power = charge_power
         self.charge_scale = charge_scale
@@ -95,6 +119,9 @@ class CormorantMutation(CGModule):
                      tau_pos, num_cg_levels, num_channels, level_gain, weight_init,
                      cutoff_type, hard_cut_rad, soft_cut_rad, soft_cut_width,
                      cat=True, gaussian_mask=False, cgprod_bounded=True,
+                     prune_edges=prune_edges,
+                     checkpoint_levels=checkpoint_levels,
+                     parallel_levels=parallel_levels,
                      device=self.device, dtype=self.dtype, cg_dict=self.cg_dict)
 
         tau_cg_levels_atom = self.cormorant_cg.tau_levels_atom
@@ -115,7 +142,19 @@ class CormorantMutation(CGModule):
             sum([p.nelement() for p in self.parameters()])))
 
 
-    def forward_once(self, data):
+    @property
+    def encoder_frozen(self):
+        """
+        True if none of the parameters of the layers before the output layer require gradients.
+        """
+        encoder = [self.rad_funcs, self.input_func_atom, self.cormorant_cg, self.get_scalars_atom]
+        return not any(param.requires_grad for module in encoder for param in module.parameters())
+
+    def _encoder_version(self):
+        encoder = [self.rad_funcs, self.input_func_atom, self.cormorant_cg, self.get_scalars_atom]
+        return tuple(param._version for module in encoder for param in module.parameters())
+
+    def forward_once(self, data, use_cache=True):
         """
         Runs a single forward pass of the network.
 
@@ -123,8 +162,9 @@ class CormorantMutation(CGModule):
         ----------
         data : :obj:`dict`
             Dictionary of data to pass to the network.
-        covariance_test : :obj:`bool`, optional
-            If true, returns all of the atom-level representations twice.
+        use_cache : :obj:`bool`, optional
+            If true, use the embedding cache when possible. The atom-level and
+            edge-level representations are then not returned.
 
         Returns
         -------
@@ -134,9 +174,50 @@ class CormorantMutation(CGModule):
         # Get and prepare the data
         atom_scalars, atom_mask, edge_scalars, edge_mask, atom_positions = self.prepare_input(data)
 
+        use_cache = use_cache and self.embedding_cache is not None and \
+            (self.encoder_frozen or not torch.is_grad_enabled())
+
+        if use_cache:
+            # Cached entries are only valid for the current encoder weights
+            self.embedding_cache.validate(self._encoder_version())
+
+            # Only encode the structures that are not in the cache
+            def encode(idx):
+                return self.encode(atom_scalars[idx], atom_mask[idx], edge_scalars,
+                                   edge_mask[idx], atom_positions[idx])[0]
+
+            atom_scalars = self.embedding_cache(encode, data['charges'], data['positions'], atom_mask)
+            atoms_all, edges_all = None, None
+        else:
+            atom_scalars, atoms_all, edges_all = self.encode(atom_scalars, atom_mask, edge_scalars,
+                                                             edge_mask, atom_positions)
+
+        # Prediction in this case will depend only on the atom_scalars. Can make
+        # it more general here.
+        prediction = self.output_layer_atom(atom_scalars, atom_mask)
+
+        return prediction, atoms_all, edges_all
+
+    def encode(self, atom_scalars, atom_mask, edge_scalars, edge_mask, atom_positions, fixed_atoms=None):
+        """
+        Runs the layers of the network before the output layer.
+
+        If `fixed_atoms` is specified, it is passed on to :class:`CormorantCG`
+        to replace the representations of some atoms at each level.
+
+        Returns
+        -------
+        atom_scalars : :obj:`torch.Tensor`
+            Scalars of each atom, taken from all levels of the network.
+        atoms_all : :obj:`list` of :obj:`SO3Vec`
+            The atom-level representations of each level.
+        edges_all : :obj:`list` of :obj:`SO3Scalar`
+            The edge-level representations of each level.
+        """
         # Calculate spherical harmonics and radial functions
         spherical_harmonics, norms = self.sph_harms(atom_positions, atom_positions)
-        rad_func_levels = self.rad_funcs(norms, edge_mask * (norms > 0))
+        edge_pairs = self.cormorant_cg.edge_pairs(edge_mask, norms)
+        rad_func_levels = self.rad_funcs(norms, edge_mask * (norms > 0), pairs=edge_pairs)
 
         # Prepare the input reps for both the atom and edge network
         atom_reps_in = self.input_func_atom(atom_scalars, atom_mask, edge_scalars, edge_mask, norms)
@@ -144,17 +225,102 @@ class CormorantMutation(CGModule):
 
         # Clebsch-Gordan layers central to the network
         atoms_all, edges_all = self.cormorant_cg(atom_reps_in, atom_mask, edge_net_in, edge_mask,
-                                                 rad_func_levels, norms, spherical_harmonics)
+                                                 rad_func_levels, norms, spherical_harmonics,
+                                                 pairs=edge_pairs, fixed_atoms=fixed_atoms)
 
         # Construct scalars for network output
         atom_scalars = self.get_scalars_atom(atoms_all)
         edge_scalars = self.get_scalars_edge(edges_all)
 
-        # Prediction in this case will depend only on the atom_scalars. Can make
-        # it more general here.
-        prediction = self.output_layer_atom(atom_scalars, atom_mask)
+        return atom_scalars, atoms_all, edges_all
 
-        return prediction, atoms_all, edges_all
+    @property
+    def receptive_field(self):
+        """
+        Radius around an atom beyond which other atoms cannot affect its
+        representation at each level, or ``None`` if some level has a cutoff
+        with infinite support.
+        """
+        support_radii = self.cormorant_cg.support_radii
+        if any(radius is None for radius in support_radii):
+            return None
+        return list(accumulate(support_radii))
+
+    def forward_incremental(self, data):
+        """
+        Runs both structures through the network, fully evaluating the first
+        (wildtype) structure, and only re-evaluating the atoms of the second
+        (mutant) structure that can be affected by the mutation.
+
+        Atoms of the mutant are matched to wildtype atoms with the same charge
+        and position. An atom that is within the receptive field of level `k`
+        of an unmatched atom of either structure is re-evaluated at level `k`,
+        and the representation of the matching wildtype atom is used otherwise.
+        Only the atoms that these depend on are passed through the network.
+
+        Parameters
+        ----------
+        data : :obj:`dict`
+            Dictionary of data to pass to the network.
+
+        Returns
+        -------
+        prediction1 : :obj:`torch.Tensor`
+            The output of the first network
+        prediction2 : :obj:`torch.Tensor`
+            The output of the second network
+        """
+        receptive_field, support_radii = self.receptive_field, self.cormorant_cg.support_radii
+
+        keys = ['charges', 'positions', 'one_hot', 'atom_mask', 'edge_mask']
+        data1 = {key: data[key + '1'] for key in keys}
+        data2 = {key: data[key + '2'] for key in keys}
+
+        # Full evaluation of the wildtype
+        atom_scalars1, atom_mask1, edge_scalars1, edge_mask1, atom_positions1 = self.prepare_input(data1)
+        scalars1, atoms_all1, _ = self.encode(atom_scalars1, atom_mask1, edge_scalars1, edge_mask1, atom_positions1)
+        prediction1 = self.output_layer_atom(scalars1, atom_mask1)
+
+        atom_scalars2, atom_mask2, edge_scalars2, edge_mask2, atom_positions2 = self.prepare_input(data2)
+
+        match, changed_dist = match_atoms(data1['charges'].to(self.device), atom_positions1, atom_mask1,
+                                          data2['charges'].to(self.device), atom_positions2, atom_mask2)
+
+        # Representations of the mutant atoms, taken from the matching wildtype atoms
+        atoms_all2 = [gather_atoms(atoms, match) for atoms in atoms_all1]
+
+        # Atoms needed to re-evaluate all affected atoms at every level
+        crop = atom_mask2 & (changed_dist <= receptive_field[-1] + max(support_radii))
+        num_crop = int(crop.sum(1).max())
+
+        if num_crop > 0:
+            # Gather the cropped atoms at the front of a smaller batch
+            order = torch.argsort((~crop).to(torch.uint8), dim=1, stable=True)[:, :num_crop]
+            batch_idx = torch.arange(order.shape[0], device=order.device).unsqueeze(1).expand_as(order)
+
+            crop_mask = crop[batch_idx, order]
+            crop_dist = changed_dist[batch_idx, order]
+            crop_edge_mask = edge_mask2[batch_idx.unsqueeze(2), order.unsqueeze(2), order.unsqueeze(1)]
+            crop_edge_mask = crop_edge_mask & crop_mask.unsqueeze(1) & crop_mask.unsqueeze(2)
+
+            # Atoms outside the receptive field of the changes keep the wildtype representation
+            atoms_fixed = [SO3Vec([part[batch_idx, order] for part in atoms]) for atoms in atoms_all2]
+            fixed_mask = [crop_mask & (crop_dist > field) for field in receptive_field]
+
+            _, atoms_crop, _ = self.encode(atom_scalars2[batch_idx, order], crop_mask, edge_scalars2,
+                                           crop_edge_mask, atom_positions2[batch_idx, order],
+                                           fixed_atoms=(atoms_fixed, fixed_mask))
+
+            # Scatter the re-evaluated atoms back into the full mutant
+            crop_idx = (batch_idx[crop_mask], order[crop_mask])
+            atoms_all2 = [SO3Vec([part.index_put(crop_idx, part_crop[crop_mask])
+                                  for part, part_crop in zip(atoms, level_crop)])
+                          for atoms, level_crop in zip(atoms_all2, atoms_crop)]
+
+        scalars2 = self.get_scalars_atom(atoms_all2)
+        prediction2 = self.output_layer_atom(scalars2, atom_mask2)
+
+        return prediction1, prediction2
  
 
     def forward(self, data, covariance_test=False):
@@ -176,23 +342,40 @@ class CormorantMutation(CGModule):
             The output of the second network
         """
 
-        data1 = {}
-        data2 = {}
-        data1['label'] = data['label']
-        data2['label'] = data['label']
-        data1['charges']   = data['charges1']
-        data2['charges']   = data['charges2']
-        data1['positions'] = data['positions1']
-        data2['positions'] = data['positions2']
-        data1['one_hot']   = data['one_hot1']
-        data2['one_hot']   = data['one_hot2']
-        data1['atom_mask'] = data['atom_mask1']
-        data2['atom_mask'] = data['atom_mask2']
-        data1['edge_mask'] = data['edge_mask1']
-        data2['edge_mask'] = data['edge_mask2']
-
-        prediction1, atoms_all1, edges_all1 = self.forward_once(data1)
-        prediction2, atoms_all2, edges_all2 = self.forward_once(data2)
+        if self.incremental and not covariance_test and self.receptive_field is not None:
+            prediction1, prediction2 = self.forward_incremental(data)
+        elif self.stack_pairs:
+            # Run both structures through the network as a single batch
+            num_pairs = data['charges1'].shape[0]
+
+            prediction, atoms_all, edges_all = self.forward_once(stack_siamese(data), use_cache=not covariance_test)
+
+            prediction1, prediction2 = prediction[:num_pairs], prediction[num_pairs:]
+            if covariance_test:
+                atoms_all1 = [SO3Vec([part[:num_pairs] for part in atoms]) for atoms in atoms_all]
+                # Pruned edges are stored as a flat list of pairs, and cannot be split by structure
+                if self.cormorant_cg.prune_edges:
+                    edges_all1 = edges_all
+                else:
+                    edges_all1 = [SO3Scalar([part[:num_pairs] for part in edges]) for edges in edges_all]
+        else:
+            data1 = {}
+            data2 = {}
+            data1['label'] = data['label']
+            data2['label'] = data['label']
+            data1['charges']   = data['charges1']
+            data2['charges']   = data['charges2']
+            data1['positions'] = data['positions1']
+            data2['positions'] = data['positions2']
+            data1['one_hot']   = data['one_hot1']
+            data2['one_hot']   = data['one_hot2']
+            data1['atom_mask'] = data['atom_mask1']
+            data2['atom_mask'] = data['atom_mask2']
+            data1['edge_mask'] = data['edge_mask1']
+            data2['edge_mask'] = data['edge_mask2']
+
+            prediction1, atoms_all1, edges_all1 = self.forward_once(data1, use_cache=not covariance_test)
+            prediction2, atoms_all2, edges_all2 = self.forward_once(data2, use_cache=not covariance_test)
 
         prediction = (prediction2 - prediction1)**2
 
@@ -226,15 +409,14 @@ class CormorantMutation(CGModule):
         charge_power, charge_scale, device, dtype = self.charge_power, self.charge_scale, self.device, self.dtype
 
         atom_positions = data['positions'].to(device, dtype)
-        one_hot = data['one_hot'].to(device, dtype)
+        species = species_index(data).to(device)
         charges = data['charges'].to(device, dtype)
 
         atom_mask = data['atom_mask'].to(device)
         edge_mask = data['edge_mask'].to(device)
 
         charge_tensor = (charges.unsqueeze(-1)/charge_scale).pow(torch.arange(charge_power+1., device=device, dtype=dtype))
-        charge_tensor = charge_tensor.view(charges.shape + (1, charge_power+1))
-        atom_scalars = (one_hot.unsqueeze(-1) * charge_tensor).view(charges.shape[:2] + (-1,))
+        atom_scalars = species_scalars(species, charge_tensor, self.num_species)
 
         edge_scalars = torch.tensor([])
 
@@ -251,3 +433,57 @@ def expand_var_list(var, num_cg_levels):
     return var_list
 
 
+
+
+def match_atoms(charges1, positions1, atom_mask1, charges2, positions2, atom_mask2, tol=1e-4):
+    """
+    Match the atoms of a second structure to atoms of the first structure with
+    the same charge and position.
+
+    Parameters
+    ----------
+    charges1, charges2 : :obj:`torch.Tensor`
+        Charges of the atoms of each structure.
+    positions1, positions2 : :obj:`torch.Tensor`
+        Positions of the atoms of each structure.
+    atom_mask1, atom_mask2 : :obj:`torch.Tensor`
+        Masks of the atoms present in each structure.
+    tol : :obj:`float`
+        Largest distance between two atoms considered to be at the same position.
+
+    Returns
+    -------
+    match : :obj:`torch.Tensor`
+        For each atom of the second structure, the index of the matching atom
+        of the first structure, or -1 if there is none.
+    changed_dist : :obj:`torch.Tensor`
+        For each atom of the second structure, the distance to the closest
+        unmatched atom of either structure (``inf`` if all atoms match).
+    """
+    dist21 = torch.cdist(positions2, positions1, compute_mode='donot_use_mm_for_euclid_dist')
+    dist22 = torch.cdist(positions2, positions2, compute_mode='donot_use_mm_for_euclid_dist')
+
+    same = (dist21 < tol) & (charges2.unsqueeze(2) == charges1.unsqueeze(1))
+    same = same & atom_mask2.unsqueeze(2) & atom_mask1.unsqueeze(1)
+
+    matched2, match = same.any(2), same.to(torch.uint8).argmax(2)
+    match = torch.where(matched2, match, -1)
+
+    changed1 = atom_mask1 & ~same.any(1)
+    changed2 = atom_mask2 & ~matched2
+
+    inf = torch.tensor(float('inf'), device=dist21.device, dtype=dist21.dtype)
+    changed_dist = torch.minimum(torch.where(changed1.unsqueeze(1), dist21, inf).amin(2),
+                                 torch.where(changed2.unsqueeze(1), dist22, inf).amin(2))
+
+    return match, changed_dist
+
+
+def gather_atoms(atom_reps, match):
+    """
+    Gather atom representations by index, with zeros where the index is -1.
+    """
+    batch_idx = torch.arange(match.shape[0], device=match.device).unsqueeze(1).expand_as(match)
+    matched = (match >= 0).view(match.shape + (1, 1, 1))
+
+    return SO3Vec([part[batch_idx, match.clamp(min=0)] * matched for part in atom_reps])
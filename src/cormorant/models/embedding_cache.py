@@ -0,0 +1,175 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+
+class EmbeddingCache:
+    """
+    Least-recently-used cache of per-structure atom scalars, used by the
+    siamese models to avoid re-encoding structures that appear in many pairs.
+
+    Entries are keyed on a hash of the charges and positions of the atoms of a
+    structure, and store the output of :class:`GetScalarsAtom` for those atoms.
+    The cache should only be used when the encoder does not require gradients,
+    that is during inference or when training with a frozen encoder.
+
+    Parameters
+    ----------
+    max_bytes : :obj:`int`
+        Memory budget of the cached tensors. The least recently used entries
+        are evicted once it is exceeded.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+
+        self.entries = OrderedDict()
+        self.num_bytes = 0
+        self.version = None
+
+        self.reset_stats()
+
+    def reset_stats(self):
+        """
+        Reset the hit/miss counters and the time saved by the cache.
+        """
+        self.hits = 0
+        self.misses = 0
+        self.time_saved = 0.
+        # Running total of the time spent encoding structures that missed
+        self._encode_time = 0.
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def keys(charges, positions, atom_mask):
+        """
+        Content hash of each structure in a batch.
+
+        Parameters
+        ----------
+        charges : :obj:`torch.Tensor`
+            Charges of the atoms, of shape (batch, atoms).
+        positions : :obj:`torch.Tensor`
+            Positions of the atoms, of shape (batch, atoms, 3).
+        atom_mask : :obj:`torch.Tensor`
+            Mask of the atoms that are present.
+
+        Returns
+        -------
+        keys : :obj:`list` of :obj:`str`
+            One key for each structure in the batch.
+        """
+        charges, positions, atom_mask = charges.cpu(), positions.cpu(), atom_mask.cpu().bool()
+
+        keys = []
+        for charge, position, mask in zip(charges, positions, atom_mask):
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(charge[mask].contiguous().numpy().tobytes())
+            digest.update(position[mask].contiguous().numpy().tobytes())
+            keys.append(digest.hexdigest())
+
+        return keys
+
+    def get(self, key):
+        """
+        Look up an entry, and mark it as recently used. Returns None on a miss.
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if self.misses > 0:
+            self.time_saved += self._encode_time / self.misses
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        """
+        Store an entry, evicting the least recently used entries to stay within budget.
+        """
+        value = value.detach()
+        size = value.numel() * value.element_size()
+        if size > self.max_bytes:
+            return
+
+        if key in self.entries:
+            self.num_bytes -= self._size(self.entries.pop(key))
+
+        self.entries[key] = value
+        self.num_bytes += size
+
+        while self.num_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.num_bytes -= self._size(evicted)
+
+    def clear(self):
+        self.entries.clear()
+        self.num_bytes = 0
+
+    def validate(self, version):
+        """
+        Clear the cache if the encoder weights changed since it was filled.
+
+        Parameters
+        ----------
+        version : hashable
+            Identifier of the current encoder weights.
+        """
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+    @staticmethod
+    def _size(value):
+        return value.numel() * value.element_size()
+
+    def __call__(self, encode, charges, positions, atom_mask):
+        """
+        Get the atom scalars of a batch of structures, only encoding the
+        structures that are not in the cache.
+
+        Parameters
+        ----------
+        encode : :obj:`callable`
+            Function that takes the indices of the structures in the batch to
+            encode, and returns their padded atom scalars.
+        charges : :obj:`torch.Tensor`
+            Charges of the atoms, of shape (batch, atoms).
+        positions : :obj:`torch.Tensor`
+            Positions of the atoms, of shape (batch, atoms, 3).
+        atom_mask : :obj:`torch.Tensor`
+            Mask of the atoms that are present.
+
+        Returns
+        -------
+        atom_scalars : :obj:`torch.Tensor`
+            Padded atom scalars of the full batch.
+        """
+        keys = self.keys(charges, positions, atom_mask)
+
+        # Structures repeated within the batch are only encoded once
+        cached = {key: self.get(key) for key in OrderedDict.fromkeys(keys)}
+        missing = [keys.index(key) for key, value in cached.items() if value is None]
+
+        if missing:
+            t0 = time.perf_counter()
+            scalars_missing = encode(missing)
+            self._encode_time += time.perf_counter() - t0
+
+            for idx, scalars in zip(missing, scalars_missing):
+                cached[keys[idx]] = scalars[atom_mask[idx]]
+                self.put(keys[idx], cached[keys[idx]])
+
+        first = next(iter(cached.values()))
+        atom_scalars = first.new_zeros(atom_mask.shape + first.shape[1:])
+        for idx, key in enumerate(keys):
+            atom_scalars[idx][atom_mask[idx]] = cached[key]
+
+        return atom_scalars
@@ -0,0 +1,62 @@
+import torch
+import torch.nn as nn
+
+from cormorant.data.feature_cache import OUTPUT_PREFIXES
+
+
+class FeatureHead(nn.Module):
+    """
+    Output layers of a Cormorant model, applied to cached atom features.
+
+    The trunk of the model (everything up to :class:`cormorant.nn.GetScalarsAtom`)
+    is frozen, and only the output layers are trained, on batches of a
+    :class:`cormorant.data.feature_cache.FeatureDataset`. The state dict is the
+    one of the full model, so that checkpoints can be loaded back into it.
+
+    Parameters
+    ----------
+    model : :obj:`torch.nn.Module`
+        Model with a pretrained trunk, and either an ``output_layer_atom`` or
+        an ``output_layers_atom`` layer.
+    """
+    def __init__(self, model):
+        super().__init__()
+
+        if hasattr(model, 'forward_once'):
+            raise NotImplementedError('Training on cached features is not supported for siamese models')
+
+        self.model = model
+
+        for name, param in model.named_parameters():
+            param.requires_grad_(name.startswith(OUTPUT_PREFIXES))
+
+    def forward(self, data):
+        """
+        Forward pass of the output layers.
+
+        Parameters
+        ----------
+        data : :obj:`dict`
+            Batch collated from a :class:`FeatureDataset`.
+
+        Returns
+        -------
+        prediction : :obj:`torch.Tensor`
+            The output of the output layers.
+        """
+        device, dtype = self.model.device, self.model.dtype
+
+        atom_scalars = data['atom_features'].to(device, dtype)
+        atom_mask = data['atom_mask'].to(device)
+
+        if hasattr(self.model, 'output_layers_atom'):
+            return torch.stack([output_layer(atom_scalars, atom_mask)
+                                for output_layer in self.model.output_layers_atom], dim=-1)
+
+        return self.model.output_layer_atom(atom_scalars, atom_mask)
+
+    def state_dict(self, *args, **kwargs):
+        return self.model.state_dict(*args, **kwargs)
+
+    def load_state_dict(self, *args, **kwargs):
+        return self.model.load_state_dict(*args, **kwargs)
@@ -2,7 +2,7 @@ from cormorant.nn.utils import NoLayer
 
 from cormorant.nn.generic_levels import BasicMLP, DotMatrix
 
-from cormorant.nn.input_levels import InputLinear, InputEdgeLinear, InputMPNN
+from cormorant.nn.input_levels import InputLinear, InputEdgeLinear, InputMPNN, species_index, species_scalars
 from cormorant.nn.output_levels import OutputLinear, OutputLinearMeanPool, OutputPMLP, OutputSoftmax, OutputLinearOnce, OutputSiamesePMLP, OutputSoftmaxPMLP, GetScalarsAtom
 
 from cormorant.nn.position_levels import RadialFilters, RadPolyTrig
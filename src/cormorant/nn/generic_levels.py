@@ -20,13 +20,21 @@ class DotMatrix(CGModule):
                 self.tau = SO3Tau([sum(tau_in)] * len(tau_in))
             else:
                 self.tau = SO3Tau([t for t in tau_in])
-            self.signs = [torch.tensor(-1.).pow(torch.arange(-ell, ell+1).float()).to(device=self.device, dtype=self.dtype).unsqueeze(-1) for ell in range(len(tau_in)+1)]
-            self.conj = torch.tensor([1., -1.]).to(device=self.device, dtype=self.dtype)
+            # Constants are buffers, so they follow the module across devices and dtypes
+            for ell in range(len(tau_in)+1):
+                sign = torch.tensor(-1.).pow(torch.arange(-ell, ell+1).float()).unsqueeze(-1)
+                self.register_buffer('sign_{}'.format(ell), sign.to(device=self.device, dtype=self.dtype), persistent=False)
+            self.register_buffer('conj', torch.tensor([1., -1.], device=self.device, dtype=self.dtype), persistent=False)
         else:
             self.tau = None
-            self.signs = None
 
-    def forward(self, reps):
+    @property
+    def signs(self):
+        if self.tau_in is None:
+            return None
+        return [getattr(self, 'sign_{}'.format(ell)) for ell in range(len(self.tau_in)+1)]
+
+    def forward(self, reps, pairs=None):
         """
         Performs the forward pass.
 
@@ -34,6 +42,9 @@ class DotMatrix(CGModule):
         ----------
         reps : :class:`SO3Vec <cormorant.so3_lib.SO3Vec>`
             Input SO3 Vector. 
+        pairs : :class:`tuple` of :class:`torch.Tensor`, optional
+            Indices ``(batch, i, j)`` of the pairs to calculate dot products
+            for. If not specified, the full matrix of dot products is calculated.
         
         Returns
         -------
@@ -46,8 +57,13 @@ class DotMatrix(CGModule):
         signs = self.signs
         conj = self.conj
 
-        reps1 = [part.unsqueeze(-4) for part in reps]
-        reps2 = [part.unsqueeze(-5) for part in reps]
+        if pairs is None:
+            reps1 = [part.unsqueeze(-4) for part in reps]
+            reps2 = [part.unsqueeze(-5) for part in reps]
+        else:
+            batch_idx, idx1, idx2 = pairs
+            reps1 = [part[batch_idx, idx1] for part in reps]
+            reps2 = [part[batch_idx, idx2] for part in reps]
 
         reps2 = [part.flip(-2)*sign for part, sign in zip(reps2, signs)]
 
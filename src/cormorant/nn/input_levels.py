@@ -10,6 +10,63 @@ from cormorant.so3_lib import SO3Tau, SO3Scalar, SO3Vec, SO3Tensor
 
 ############# Input to network #############
 
+def species_index(data, key='species'):
+    """
+    Species of each atom of a batch, as an index: ``0`` for padding atoms
+    (and atoms of species left out of the dataset), and ``i + 1`` for atoms
+    of the ``i``-th included species.
+
+    Batches with a one-hot encoding of the species (``one_hot``) instead of
+    the index are converted.
+
+    Parameters
+    ----------
+    data : :class:`dict`
+        Batch of data.
+    key : :class:`str`, optional
+        Key of the species index in the batch.
+
+    Returns
+    -------
+    species : :class:`torch.Tensor`
+        Species index of each atom.
+    """
+    if key in data:
+        return data[key].long()
+
+    one_hot = data[key.replace('species', 'one_hot')].bool()
+    return torch.where(one_hot.any(-1), one_hot.long().argmax(-1) + 1, 0)
+
+
+def species_scalars(species, charge_powers, num_species):
+    """
+    One-hot encoding of the species of each atom, multiplied by the powers of
+    its charge, and flattened to ``num_species * num_powers`` scalars per atom.
+
+    Parameters
+    ----------
+    species : :class:`torch.Tensor`
+        Species index of each atom, as returned by :func:`species_index`.
+    charge_powers : :class:`torch.Tensor`
+        Powers of the (scaled) charge of each atom.
+    num_species : :class:`int`
+        Number of species.
+
+    Returns
+    -------
+    atom_scalars : :class:`torch.Tensor`
+        Scalars of each atom.
+    """
+    num_powers = charge_powers.shape[-1]
+
+    # Padding atoms are scattered to a first species that is dropped
+    scalars = charge_powers.new_zeros(species.shape + (num_species + 1, num_powers))
+    index = species.view(species.shape + (1, 1)).expand(species.shape + (1, num_powers))
+    scalars.scatter_(-2, index, charge_powers.unsqueeze(-2))
+
+    return scalars[..., 1:, :].flatten(-2)
+
+
 class InputLinear(nn.Module):
     """
     Module to create rotationally invariant atom feature vectors
@@ -18,6 +75,12 @@ class InputLinear(nn.Module):
     This module applies a simple linear mixing matrix to a one-hot of atom
     embeddings based upon the number of atomic types.
 
+    The input features are usually the one-hot encoding of the species of each
+    atom multiplied by the powers of its charge. In that case, the species
+    index and the powers of the charge can be given instead, and the weights
+    of the species of each atom are looked up rather than multiplied with the
+    mostly zero one-hot features. The result is the same.
+
     Parameters
     ----------
     channels_in : :class:`int`
@@ -43,7 +106,7 @@ class InputLinear(nn.Module):
 
         self.zero = torch.tensor(0, dtype=dtype, device=device)
 
-    def forward(self, atom_features, atom_mask, ignore, edge_mask, norms):
+    def forward(self, atom_features, atom_mask, ignore, edge_mask, norms, species=None):
         """
         Forward pass for :class:`InputLinear` layer.
 
@@ -51,7 +114,8 @@ class InputLinear(nn.Module):
         ----------
         atom_features : :class:`torch.Tensor`
             Input atom features, i.e., a one-hot embedding of the atom type,
-            atom charge, and any other related inputs.
+            atom charge, and any other related inputs. If `species` is given,
+            the powers of the charge of each atom instead.
         atom_mask : :class:`torch.Tensor`
             Mask used to account for padded atoms for unequal batch sizes.
         edge_features : :class:`torch.Tensor`
@@ -60,6 +124,8 @@ class InputLinear(nn.Module):
             Unused. Included only for pedagogical purposes.
         norms : :class:`torch.Tensor`
             Unused. Included only for pedagogical purposes.
+        species : :class:`torch.Tensor`, optional
+            Species index of each atom, as returned by :func:`species_index`.
 
         Returns
         -------
@@ -69,12 +135,35 @@ class InputLinear(nn.Module):
         """
         atom_mask = atom_mask.unsqueeze(-1)
 
-        out = torch.where(atom_mask, self.lin(atom_features), self.zero)
+        if species is None:
+            out = self.lin(atom_features)
+        else:
+            out = self._embed(species, atom_features)
+
+        out = torch.where(atom_mask, out, self.zero)
         out = out.view(atom_features.shape[0:2] + (self.channels_out, 1, 2))
-        print("Output shape from InputLinear:", out.size())
 
         return SO3Vec([out])
 
+    def _embed(self, species, charge_powers):
+        """
+        Same as applying :attr:`lin` to :func:`species_scalars`, as a sum of
+        the weights of the species of each atom, weighed by the powers of its charge.
+        """
+        num_powers = charge_powers.shape[-1]
+
+        # Columns of the weights of the species of each atom, one per power
+        index = (species.clamp(min=1) - 1).unsqueeze(-1) * num_powers + torch.arange(num_powers, device=species.device)
+        powers = charge_powers * (species > 0).unsqueeze(-1).to(charge_powers.dtype)
+
+        weight = self.lin.weight.t()
+        out = nn.functional.embedding_bag(index.view(-1, num_powers), weight, mode='sum',
+                                          per_sample_weights=powers.reshape(-1, num_powers).to(weight.dtype))
+        if self.lin.bias is not None:
+            out = out + self.lin.bias
+
+        return out.view(species.shape + (-1,))
+
     @property
     def tau(self):
         return SO3Tau([self.channels_out])
@@ -140,7 +229,6 @@ class InputEdgeLinear(nn.Module):
 
         out = self.lin(edge_features) 
         out = out.view(out.shape[:-1] + (self.channels_out, 2))
-        print("Output shape from InputLinear:", out.size())
 
         return SO3Scalar([out])
 
@@ -1,10 +1,12 @@
 import torch
 import torch.nn as nn
 
+from math import pi
+
 from cormorant.so3_lib import SO3Scalar
 
 class MaskLevel(nn.Module):
-    """
+    r"""
     Mask level for implementing hard and soft cutoffs. With the current
     architecutre, we have all-to-all communication.
 
@@ -12,6 +14,19 @@ class MaskLevel(nn.Module):
     and implements either a hard cutoff, a soft cutoff, or both. The soft
     cutoffs can also be made learnable.
 
+    The sigmoid and gaussian soft cutoffs never reach zero, so every pair of
+    atoms contributes. The ``cos`` and ``poly`` cutoffs instead use envelopes
+    with compact support: the envelope is one for
+    :math:`r \leq r_c - w`, smoothly tapers to zero over the width :math:`w`,
+    and is exactly zero for :math:`r \geq r_c`. For these cutoffs (and for
+    the hard cutoff), :meth:`edge_support` gives the set of edges that can be
+    non-zero. :class:`cormorant.models.CormorantCG` uses it to restrict the
+    edge and atom levels to those pairs when ``prune_edges`` is set.
+
+    The compact envelopes replace the sigmoid/gaussian soft cutoff, so they
+    cannot be combined with ``soft``, ``learn``, ``learn_rad``, ``learn_width``,
+    or ``gaussian_mask``.
+
     Parameters
     ----------
     num_channels : :class:`int`
@@ -19,11 +34,17 @@ class MaskLevel(nn.Module):
     hard_cut_rad : :class:`float`
         Hard cutoff radius. Beyond this radius two atoms will never communicate.
     soft_cut_rad : :class:`float`
-        Soft cutoff radius used in cutoff function.
+        Soft cutoff radius used in cutoff function. For the compact ``cos``
+        and ``poly`` cutoffs, this is the radius at which the envelope
+        reaches zero.
     soft_cut_width : :class:`float`
         Soft cutoff width if ``sigmoid`` form of cutoff cuntion is used.
+        For the compact ``cos`` and ``poly`` cutoffs, this is the width of
+        the region over which the envelope tapers to zero.
     cutoff_type : :class:`list` of :class:`str`
-        Specify what types of cutoffs to use: `hard`, `soft`, `learn`-albe soft cutoff.
+        Specify what types of cutoffs to use: `hard`, `soft`, `learn`-albe soft cutoff,
+        compact `cos` or `poly` envelopes, or their learnable versions
+        `learn_cos` and `learn_poly`.
     gaussian_mask : :class:`bool`
         Mask using gaussians instead of sigmoids.
     eps : :class:`float`
@@ -46,18 +67,33 @@ class MaskLevel(nn.Module):
         self.soft_cut_rad = None
         self.soft_cut_width = None
 
+        # Compact support envelopes that reach exactly zero at soft_cut_rad.
+        envelopes = [env for env in ['cos', 'poly'] if (env in cutoff_type) or ('learn_' + env in cutoff_type)]
+        soft_types = [cut for cut in ['soft', 'learn', 'learn_rad', 'learn_width'] if cut in cutoff_type]
+
+        if len(envelopes) > 1:
+            raise ValueError('Can only use one of the cos and poly envelopes! {}'.format(cutoff_type))
+        elif envelopes and soft_types:
+            raise ValueError('Compact envelopes cannot be combined with {} cutoffs! {}'.format(soft_types, cutoff_type))
+        elif envelopes and gaussian_mask:
+            raise ValueError('Compact envelopes cannot be combined with gaussian_mask! {}'.format(cutoff_type))
+
+        self.envelope = envelopes[0] if envelopes else None
+
+        learn_compact = ('learn_cos' in cutoff_type) or ('learn_poly' in cutoff_type)
+
         if 'hard' in cutoff_type:
             self.hard_cut_rad = hard_cut_rad
 
-        if ('soft' in cutoff_type) or ('learn' in cutoff_type) or ('learn_rad' in cutoff_type) or ('learn_width' in cutoff_type):
+        if ('soft' in cutoff_type) or ('learn' in cutoff_type) or ('learn_rad' in cutoff_type) or ('learn_width' in cutoff_type) or (self.envelope is not None):
 
             self.soft_cut_rad = soft_cut_rad*torch.ones(num_channels, device=device, dtype=dtype).view((1, 1, 1, -1))
             self.soft_cut_width = soft_cut_width*torch.ones(num_channels, device=device, dtype=dtype).view((1, 1, 1, -1))
 
-            if ('learn' in cutoff_type) or ('learn_rad' in cutoff_type):
+            if ('learn' in cutoff_type) or ('learn_rad' in cutoff_type) or learn_compact:
                 self.soft_cut_rad = nn.Parameter(self.soft_cut_rad)
 
-            if ('learn' in cutoff_type) or ('learn_width' in cutoff_type):
+            if ('learn' in cutoff_type) or ('learn_width' in cutoff_type) or learn_compact:
                 self.soft_cut_width = nn.Parameter(self.soft_cut_width)
 
         # Standard bookkeeping
@@ -91,10 +127,12 @@ class MaskLevel(nn.Module):
         edge_mask = edge_mask.to(self.dtype).unsqueeze(-1).to(self.dtype)
 
         if self.soft_cut_rad is not None:
-            cut_width = torch.max(self.eps, self.soft_cut_width.abs())
-            cut_rad = torch.max(self.eps, self.soft_cut_rad.abs())
+            cut_width = torch.max(self.eps, self.soft_cut_width.abs()).view(-1)
+            cut_rad = torch.max(self.eps, self.soft_cut_rad.abs()).view(-1)
 
-            if self.gaussian_mask:
+            if self.envelope is not None:
+                edge_mask = edge_mask * compact_envelope(norms.unsqueeze(-1), cut_rad, cut_width, self.envelope)
+            elif self.gaussian_mask:
                 edge_mask = edge_mask * torch.exp(-(norms.unsqueeze(-1)/cut_rad).pow(2))
             else:
                 edge_mask = edge_mask * torch.sigmoid((cut_rad - norms.unsqueeze(-1))/cut_width)
@@ -104,3 +142,103 @@ class MaskLevel(nn.Module):
         edge_net = edge_net * edge_mask
 
         return edge_net
+
+    @property
+    def support_radius(self):
+        """
+        Radius beyond which the mask is guaranteed to be exactly zero.
+
+        This reads the (possibly learnable) cutoff radius back to the host,
+        so it is meant for inspection and not for use inside the forward pass.
+
+        Returns
+        -------
+        support_radius : :class:`float` or None
+            The smaller of the hard cutoff and the (largest) compact
+            envelope radius. If neither is used, the mask has infinite
+            support and ``None`` is returned.
+        """
+        radii = []
+
+        if self.hard_cut_rad is not None:
+            radii.append(float(self.hard_cut_rad))
+
+        if self.envelope is not None:
+            radii.append(max(self.eps.item(), self.soft_cut_rad.detach().abs().max().item()))
+
+        return min(radii) if radii else None
+
+    @property
+    def compact_support(self):
+        """
+        Whether the mask is guaranteed to be zero beyond a finite radius.
+        """
+        return (self.hard_cut_rad is not None) or (self.envelope is not None)
+
+    def edge_support(self, edge_mask, norms):
+        """
+        Restrict an edge mask to the set of edges for which this mask
+        can be non-zero. Edges outside of the support are exactly zero
+        after :meth:`forward`, so they can be skipped entirely.
+
+        The comparison is done with tensor operations, so this does
+        not synchronize with the device.
+
+        Parameters
+        ----------
+        edge_mask : :class:`torch.Tensor`
+            Mask to account for padded batches.
+        norms : :class:`torch.Tensor`
+            Pairwise distance matrices.
+
+        Returns
+        -------
+        edge_mask : :class:`torch.Tensor`
+            Input ``edge_mask`` with edges outside of the support removed.
+        """
+        edge_mask = edge_mask.bool()
+
+        if self.hard_cut_rad is not None:
+            edge_mask = edge_mask & (norms < self.hard_cut_rad)
+
+        if self.envelope is not None:
+            cut_rad = torch.max(self.eps, self.soft_cut_rad.detach().abs()).amax()
+            edge_mask = edge_mask & (norms < cut_rad)
+
+        return edge_mask
+
+
+def compact_envelope(norms, cut_rad, cut_width, envelope='cos'):
+    """
+    Smooth envelope with compact support.
+
+    The envelope is one for ``norms <= cut_rad - cut_width``, tapers
+    smoothly to zero over a region of width ``cut_width``, and is exactly
+    zero for ``norms >= cut_rad``.
+
+    Parameters
+    ----------
+    norms : :class:`torch.Tensor`
+        Pairwise distances.
+    cut_rad : :class:`torch.Tensor`
+        Radius at which the envelope reaches zero.
+    cut_width : :class:`torch.Tensor`
+        Width of the tapering region.
+    envelope : :class:`str`
+        Form of the taper: ``cos`` (cosine) or ``poly`` (quintic
+        polynomial with vanishing first and second derivatives at
+        both ends).
+
+    Returns
+    -------
+    envelope : :class:`torch.Tensor`
+        Value of the envelope.
+    """
+    t = ((norms - (cut_rad - cut_width)) / cut_width).clamp(0, 1)
+
+    if envelope == 'cos':
+        return 0.5 * (1 + torch.cos(pi * t))
+    elif envelope == 'poly':
+        return 1 - t.pow(3) * (10 - 15 * t + 6 * t.pow(2))
+    else:
+        raise ValueError('Envelope can only be cos or poly! {}'.format(envelope))
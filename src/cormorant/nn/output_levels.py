@@ -1,6 +1,8 @@
 import torch
 import torch.nn as nn
 
+import logging
+
 from cormorant.nn import BasicMLP
 from cormorant.so3_lib import cat
 
@@ -34,7 +36,8 @@ class GetScalarsAtom(nn.Module):
 
         signs_tr = [torch.pow(-1, torch.arange(-m, m+1.)) for m in range(self.maxl+1)]
         signs_tr = [torch.stack([s, -s], dim=-1) for s in signs_tr]
-        self.signs_tr = [s.view(1, 1, 1, -1, 2).to(device=device, dtype=dtype) for s in signs_tr]
+        for m, s in enumerate(signs_tr):
+            self.register_buffer('sign_tr_{}'.format(m), s.view(1, 1, 1, -1, 2).to(device=device, dtype=dtype), persistent=False)
 
         split_l0 = [tau[0] for tau in tau_levels]
         split_full = [sum(tau) for tau in tau_levels]
@@ -47,7 +50,11 @@ class GetScalarsAtom(nn.Module):
             self.num_scalars = sum(split_l0)
             self.split = split_l0
 
-        print('Number of scalars at top:', self.num_scalars)
+        logging.info('Number of scalars at top: {}'.format(self.num_scalars))
+
+    @property
+    def signs_tr(self):
+        return [getattr(self, 'sign_tr_{}'.format(m)) for m in range(self.maxl+1)]
 
     def forward(self, reps_all_levels):
         """
@@ -68,9 +75,6 @@ class GetScalarsAtom(nn.Module):
 
         scalars = reps[0]
 
-        import pdb
-        pdb.set_trace()
-
         if self.full_scalars:
             scalars_tr  = [(sign*part*part.flip(-2)).sum(dim=(-1, -2), keepdim=True) for part, sign in zip(reps, self.signs_tr)]
             scalars_mag = [(part*part).sum(dim=(-1, -2), keepdim=True) for part in reps]
@@ -469,7 +473,6 @@ class OutputSiamesePMLP(nn.Module):
             Tensor used for predictions.
         """
         # Reshape scalars appropriately
-        print('atom_scalars:', atom_scalars.shape)
         # First MLP applied to each atom
         x = self.mlp1(atom_scalars)
         # Prediction on permutation invariant representation of molecules
@@ -44,7 +44,7 @@ class RadialFilters(nn.Module):
 
         self.zero = torch.tensor(0, device=device, dtype=dtype)
 
-    def forward(self, norms, base_mask):
+    def forward(self, norms, base_mask, pairs=None):
         """
         Forward pass of the network.
 
@@ -55,12 +55,19 @@ class RadialFilters(nn.Module):
         base_mask : :class:`torch.Tensor`
             Masking tensor with 1s on locations that correspond to active edges
             and zero otherwise.
+        pairs : :class:`tuple` of :class:`torch.Tensor`, optional
+            Indices ``(batch, i, j)`` of the edges to evaluate, as returned by
+            :meth:`cormorant.models.CormorantCG.edge_pairs`. If specified, the
+            radial functions are only evaluated on those edges, and are returned
+            with a single leading edge dimension.
 
         Returns
         -------
         rad_func_vals :  list of :class:`RadPolyTrig`
             Values of the radial functions.
         """
+        if pairs is not None:
+            norms, base_mask = norms[pairs], base_mask[pairs]
 
         return [rad_func(norms, base_mask) for rad_func in self.rad_funcs]
 
@@ -119,11 +126,14 @@ class RadPolyTrig(nn.Module):
         edge_mask = (edge_mask * (norms > 0)).unsqueeze(-1)
         norms = norms.unsqueeze(-1)
 
+        # Flatten the basis parameters so any number of edge dimensions broadcast
+        scales, phases = self.scales.view(-1), self.phases.view(-1)
+
         # Get inverse powers
         rad_powers = torch.stack([torch.where(edge_mask, norms.pow(-pow), self.zero) for pow in range(self.rpow+1)], dim=-1)
 
         # Calculate trig functions
-        rad_trig = torch.where(edge_mask, torch.sin((2*pi*self.scales)*norms+self.phases), self.zero).unsqueeze(-1)
+        rad_trig = torch.where(edge_mask, torch.sin((2*pi*scales)*norms+phases), self.zero).unsqueeze(-1)
 
         # Take the product of the radial powers and the trig components and reshape
         rad_prod = (rad_powers*rad_trig).view(s + (1, 2*self.num_rad,))
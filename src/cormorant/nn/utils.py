@@ -2,6 +2,8 @@ import torch
 import torch.nn as nn
 from torch.nn import Module, Parameter, ParameterList
 
+from concurrent.futures import ThreadPoolExecutor
+
 from cormorant.so3_lib import SO3Tau
 
 class NoLayer(nn.Module):
@@ -27,6 +29,47 @@ class NoLayer(nn.Module):
         return 0
 
 
+# Inter-op parallelism
+
+_branch_pool = None
+
+def run_parallel(*branches):
+    """
+    Run independent branches of a forward pass concurrently.
+
+    The last branch runs on the calling thread, and the others run on a
+    shared thread pool. PyTorch releases the GIL inside its kernels, so the
+    branches overlap on multi-core CPUs. The grad mode of the calling thread
+    is propagated to the worker threads, so autograd is unaffected.
+
+    Parameters
+    ----------
+    branches : :obj:`tuple` of (callable, :obj:`tuple`)
+        The functions to call, and the positional arguments to call them with.
+
+    Returns
+    -------
+    outputs : :obj:`list`
+        Outputs of each branch, in the same order as `branches`.
+    """
+    global _branch_pool
+
+    if _branch_pool is None:
+        _branch_pool = ThreadPoolExecutor(thread_name_prefix='cormorant-branch')
+
+    grad_enabled = torch.is_grad_enabled()
+
+    def call(fn, args):
+        with torch.set_grad_enabled(grad_enabled):
+            return fn(*args)
+
+    futures = [_branch_pool.submit(call, fn, args) for fn, args in branches[:-1]]
+    fn, args = branches[-1]
+    last = fn(*args)
+
+    return [future.result() for future in futures] + [last]
+
+
 # Save reps
 
 def save_grads(reps):
@@ -124,6 +124,21 @@ class TestCGModule():
         assert cg_mod.cg_dict.dtype == torch.half
         assert all([t.dtype == torch.half for t in cg_mod.cg_dict.values()])
 
+    # Check that .bfloat16() keeps the CG coefficients in float
+    @pytest.mark.parametrize('dtype', [None, torch.bfloat16, torch.float, torch.double])
+    @pytest.mark.parametrize('maxl', [2])
+    def test_cg_mod_bfloat16(self, maxl, dtype):
+
+        cg_mod = CGModule(maxl=maxl, dtype=dtype)
+        cg_mod.bfloat16()
+        assert cg_mod.dtype == torch.bfloat16
+        assert cg_mod.cg_dtype == torch.float
+        assert cg_mod.cg_dict.dtype == torch.float
+        assert all([t.dtype == torch.float for t in cg_mod.cg_dict.values()])
+
+        cg_mod.double()
+        assert cg_mod.cg_dict.dtype == torch.double
+
     # Check that .float() work as expected
     @pytest.mark.parametrize('dtype', [None, torch.half, torch.float, torch.double])
     @pytest.mark.parametrize('maxl', [2])
@@ -139,3 +139,39 @@ class TestCGProductCovariance():
 
         for part1, part2 in zip(cg_prod_rot_out, cg_prod_rot_in):
             assert torch.allclose(part1, part2)
+
+
+class TestCGProductPrecision():
+
+    @pytest.mark.parametrize('aggregate', [False, True])
+    def test_bfloat16(self, aggregate):
+        cg_dict = CGDict(maxl=2, dtype=torch.float)
+
+        batch1, batch2 = ((2, 3, 3), (2, 3)) if aggregate else ((2, 3), (2, 3))
+        rep1 = SO3Vec.rand(batch1, [2, 2, 2])
+        rep2 = SO3Vec.rand(batch2, [2, 2, 2])
+
+        rep1_bf16 = SO3Vec([part.bfloat16() for part in rep1])
+        rep2_bf16 = SO3Vec([part.bfloat16() for part in rep2])
+
+        # Accumulated in float, returned in bfloat16
+        cg_prod = cg_product(cg_dict, rep1_bf16, rep2_bf16, aggregate=aggregate, maxl=2)
+        cg_prod_ref = cg_product(cg_dict, rep1_bf16.float(), rep2_bf16.float(), aggregate=aggregate, maxl=2)
+
+        for part, part_ref in zip(cg_prod, cg_prod_ref):
+            assert part.dtype == torch.bfloat16
+            assert torch.allclose(part.float(), part_ref.bfloat16().float())
+
+    def test_autocast(self):
+        cg_dict = CGDict(maxl=2, dtype=torch.float)
+
+        rep1 = SO3Vec.rand((2, 3), [2, 2, 2])
+        rep2 = SO3Vec.rand((2, 3), [2, 2, 2])
+
+        cg_prod_ref = cg_product(cg_dict, rep1, rep2, maxl=2)
+        with torch.autocast('cpu', dtype=torch.bfloat16):
+            cg_prod = cg_product(cg_dict, rep1, rep2, maxl=2)
+
+        for part, part_ref in zip(cg_prod, cg_prod_ref):
+            assert part.dtype == torch.bfloat16
+            assert torch.allclose(part.float(), part_ref.bfloat16().float())
@@ -0,0 +1,154 @@
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+from cormorant.data.collate import collate_fn, collate_siamese, collate_activity, StaticShapeCollate, GeometryCollate
+from cormorant.data.dataset import ProcessedDataset
+
+
+def structure(num_atoms, max_atoms):
+    charges = torch.zeros(max_atoms, dtype=torch.int)
+    charges[:num_atoms] = torch.randint(1, 4, (num_atoms,))
+    positions = torch.zeros(max_atoms, 3)
+    positions[:num_atoms] = torch.randn(num_atoms, 3)
+    return charges, positions
+
+
+def check_half(batch, idx, sizes, charges, positions):
+    assert batch['charges' + idx].shape == (len(sizes), max(sizes))
+    assert batch['positions' + idx].shape == (len(sizes), max(sizes), 3)
+    assert batch['one_hot' + idx].shape == (len(sizes), max(sizes), 3)
+    assert batch['edge_mask' + idx].shape == (len(sizes), max(sizes), max(sizes))
+    for mol, size in enumerate(sizes):
+        assert batch['atom_mask' + idx][mol].sum() == size
+        assert batch['edge_mask' + idx][mol].sum() == size**2
+        assert (batch['charges' + idx][mol, :size] == charges[mol][:size]).all()
+        assert (batch['positions' + idx][mol, :size] == positions[mol][:size]).all()
+
+
+class TestCollate():
+
+    def test_collate_siamese(self):
+        torch.manual_seed(0)
+        sizes1, sizes2, max_atoms = [5, 3, 7], [4, 6, 2], 8
+
+        batch, structures1, structures2 = [], [], []
+        for size1, size2 in zip(sizes1, sizes2):
+            structures1.append(structure(size1, max_atoms))
+            structures2.append(structure(size2, max_atoms))
+            charges = torch.cat([structures1[-1][0], structures2[-1][0]])
+            positions = torch.cat([structures1[-1][1], structures2[-1][1]])
+            batch.append({'charges': charges, 'positions': positions,
+                          'one_hot': charges.unsqueeze(-1) == torch.arange(1, 4),
+                          'label': torch.tensor(size1 > size2)})
+
+        batch = collate_siamese(batch)
+
+        assert (batch['label'] == torch.tensor([True, False, True])).all()
+        check_half(batch, '1', sizes1, *zip(*structures1))
+        check_half(batch, '2', sizes2, *zip(*structures2))
+
+    def test_collate_activity(self):
+        torch.manual_seed(0)
+        sizes1, sizes2, max_atoms = [5, 3, 7], [4, 6, 2], 12
+
+        batch, structures1, structures2 = [], [], []
+        for size1, size2 in zip(sizes1, sizes2):
+            structures1.append(structure(size1, size1))
+            structures2.append(structure(size2, max_atoms - size1))
+            charges = torch.cat([structures1[-1][0], structures2[-1][0]])
+            positions = torch.cat([structures1[-1][1], structures2[-1][1]])
+            active = torch.arange(max_atoms) < size1
+            batch.append({'charges': charges, 'positions': positions, 'active': active,
+                          'one_hot': charges.unsqueeze(-1) == torch.arange(1, 4),
+                          'label': torch.tensor(1.)})
+
+        batch = collate_activity(batch)
+
+        assert 'active' not in batch
+        assert batch['label'].shape == (3,)
+        check_half(batch, '1', sizes1, *zip(*structures1))
+        check_half(batch, '2', sizes2, *zip(*structures2))
+
+    def test_static_shapes(self):
+        torch.manual_seed(0)
+        sizes, max_atoms = [5, 3, 7], 8
+
+        batch = []
+        for size in sizes:
+            charges, positions = structure(size, max_atoms)
+            batch.append({'charges': charges, 'positions': positions,
+                          'one_hot': charges.unsqueeze(-1) == torch.arange(1, 4),
+                          'bonds': torch.ones(max_atoms, max_atoms, dtype=torch.int8),
+                          'label': torch.tensor(float(size))})
+
+        collate = StaticShapeCollate([4, 10, 16], batch_size=5)
+        static = collate(batch)
+        dynamic = collate_fn(batch)
+
+        assert static['charges'].shape == (5, 10)
+        assert static['positions'].shape == (5, 10, 3)
+        assert static['one_hot'].shape == (5, 10, 3)
+        assert static['edge_mask'].shape == static['bonds'].shape == (5, 10, 10)
+        assert static['mol_mask'].tolist() == [True, True, True, False, False]
+        assert static['label'].tolist() == [5., 3., 7., 7., 7.]
+
+        for key, val in dynamic.items():
+            real = static[key][:3]
+            if val.dim() > 1:
+                real = real[:, :7, :7] if key in StaticShapeCollate.pair_keys else real[:, :7]
+            assert torch.equal(real, val)
+        assert not static['atom_mask'][:, 7:].any() and not static['edge_mask'][:, 7:].any()
+
+        with pytest.raises(ValueError):
+            StaticShapeCollate([4, 6])(batch)
+
+    def test_geometry(self):
+        torch.manual_seed(0)
+        sizes, max_atoms = [5, 3, 7], 8
+
+        batch = []
+        for size in sizes:
+            charges, positions = structure(size, max_atoms)
+            batch.append({'charges': charges, 'positions': positions})
+
+        geometry = GeometryCollate(maxl=2, cutoff=1.5)(batch)
+        positions = geometry['positions']
+
+        norms = (positions.unsqueeze(2) - positions.unsqueeze(1)).norm(dim=-1)
+        assert torch.allclose(geometry['norms'], norms)
+        assert [part.shape for part in geometry['sph_harms']] == [(3, 7, 7, 1, 2*l+1, 2) for l in range(3)]
+
+        edges = geometry['edge_mask'] & (norms < 1.5)
+        assert geometry['edge_pairs'].shape == (3, edges.sum())
+        assert edges[tuple(geometry['edge_pairs'])].all()
+
+        # Padding atoms stay out of the edges
+        static = GeometryCollate(cutoff=1.5, collate_fn=StaticShapeCollate([10]))(batch)
+        assert 'sph_harms' not in static and static['norms'].shape == (3, 10, 10)
+        assert torch.equal(static['edge_pairs'], geometry['edge_pairs'])
+
+    def test_getitems(self):
+        torch.manual_seed(0)
+        sizes, max_atoms = [5, 3, 7, 2, 6], 9
+
+        charges, positions = zip(*[structure(size, max_atoms) for size in sizes])
+        dataset = ProcessedDataset({'charges': torch.stack(charges), 'positions': torch.stack(positions),
+                                    'bonds': torch.randint(0, 3, (len(sizes), max_atoms, max_atoms)),
+                                    'label': torch.randn(len(sizes))}, shuffle=True)
+        indices = [3, 0, 4]
+
+        def check(batch, reference):
+            assert batch.keys() == reference.keys()
+            assert all(torch.equal(val, reference[key]) for key, val in batch.items())
+
+        # Fetching and collating the whole batch at once matches collating one molecule at a time
+        molecules = [dataset[idx] for idx in indices]
+        fetched = dataset.__getitems__(indices)
+        check(collate_fn(fetched), collate_fn(molecules))
+        check(StaticShapeCollate([8, 12], batch_size=5)(fetched), StaticShapeCollate([8, 12], batch_size=5)(molecules))
+        check(collate_siamese(fetched), collate_siamese(molecules))
+
+        loader = DataLoader(dataset, batch_size=3, collate_fn=collate_fn)
+        for batch, start in zip(loader, range(0, len(sizes), 3)):
+            check(batch, collate_fn([dataset[idx] for idx in range(start, min(start + 3, len(sizes)))]))
@@ -0,0 +1,38 @@
+import torch
+
+from cormorant.data.dataset import ProcessedDataset, charges_to_species
+
+
+class TestProcessedDataset():
+
+    def test_stats_missing_labels(self):
+        charges = torch.tensor([[1, 6, 0], [1, 1, 8], [6, 0, 0], [1, 8, 0]])
+        herg = torch.tensor([1., float('nan'), 3., float('nan')])
+        pxr = torch.tensor([2., 4., 6., 8.], dtype=torch.float64)
+
+        dataset = ProcessedDataset({'charges': charges, 'herg': herg, 'pxr': pxr})
+
+        mu, sigma = dataset.stats['herg']
+        assert torch.allclose(mu, torch.tensor(2.)) and torch.allclose(sigma, torch.tensor(2.).sqrt())
+        mu, sigma = dataset.stats['pxr']
+        assert torch.allclose(mu, pxr.mean()) and torch.allclose(sigma, pxr.std())
+
+    def test_share_memory(self):
+        charges = torch.tensor([[1, 6, 0], [1, 1, 8], [6, 0, 0], [1, 8, 0]])
+        dataset = ProcessedDataset({'charges': charges, 'positions': torch.randn(4, 3, 3), 'U0': torch.randn(4)},
+                                   shuffle=True)
+        items = [dataset[idx] for idx in range(4)]
+
+        assert dataset.share_memory() is dataset
+        assert all(val.is_shared() for val in dataset.data.values()) and dataset.perm.is_shared()
+        for idx, item in enumerate(items):
+            assert all(torch.equal(val, dataset[idx][key]) for key, val in item.items())
+
+    def test_species(self):
+        charges = torch.tensor([[1, 6, 0], [1, 1, 8], [6, 0, 0], [9, 8, 0]])
+        dataset = ProcessedDataset({'charges': charges, 'U0': torch.randn(4)}, included_species=torch.tensor([8, 1, 6]))
+
+        # Species follow the order of included_species, and padding or left out species are 0
+        assert 'one_hot' not in dataset.data and dataset.data['species'].dtype == torch.uint8
+        assert dataset.data['species'].tolist() == [[2, 3, 0], [2, 2, 1], [3, 0, 0], [0, 1, 0]]
+        assert charges_to_species(charges, torch.arange(1, 301)).dtype == torch.int16
@@ -0,0 +1,85 @@
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+from cormorant.data.collate import collate_fn
+from cormorant.data.dataset import ProcessedDataset
+from cormorant.data.feature_cache import cache_features
+from cormorant.models import CormorantQM9, CormorantADME
+from cormorant.models.feature_head import FeatureHead
+
+
+def build(Cormorant, num_species, charge_scale, *extra):
+    torch.manual_seed(0)
+    return Cormorant([3, 2], [2, 3], 3, 4, num_species, ['hard', 'soft'], 2.5, 2.5, 0.4,
+                     'rand', 1., 2, (3, 3), charge_scale, False, 'linear', 'linear', 1, *extra).eval()
+
+
+@pytest.fixture
+def dataset(sample_batch):
+    data, num_species, charge_scale = sample_batch
+    props = {'charges': data['charges'].long(), 'positions': data['positions'],
+             'U0': torch.arange(4, dtype=torch.float)}
+    return ProcessedDataset(props, included_species=torch.arange(1, num_species + 1)), num_species, charge_scale
+
+
+class TestFeatureCache():
+
+    @pytest.mark.parametrize('Cormorant,extra', [
+        (CormorantQM9, ()),
+        (CormorantADME, (['a', 'b'],)),
+    ])
+    def test_head(self, Cormorant, extra, dataset, tmp_path):
+        dataset, num_species, charge_scale = dataset
+        model = build(Cormorant, num_species, charge_scale, *extra)
+
+        features = cache_features(model, dataset, str(tmp_path), batch_size=3)
+        assert len(features) == len(dataset)
+
+        head = FeatureHead(model)
+        full = next(iter(DataLoader(dataset, batch_size=4, collate_fn=collate_fn)))
+        cached = next(iter(DataLoader(features, batch_size=4, collate_fn=collate_fn)))
+
+        with torch.no_grad():
+            assert torch.allclose(head(cached), model(full), rtol=1e-5, atol=1e-6)
+        assert torch.equal(cached['U0'], full['U0'])
+
+    def test_reuse(self, dataset, tmp_path):
+        dataset, num_species, charge_scale = dataset
+        model = build(CormorantQM9, num_species, charge_scale)
+
+        cache_features(model, dataset, str(tmp_path))
+        mtime = (tmp_path / 'features.npy').stat().st_mtime_ns
+
+        # Changing the output layers keeps the cache
+        with torch.no_grad():
+            next(model.output_layer_atom.parameters()).add_(1.)
+        cache_features(model, dataset, str(tmp_path))
+        assert (tmp_path / 'features.npy').stat().st_mtime_ns == mtime
+
+        # Changing the trunk invalidates it
+        with torch.no_grad():
+            next(model.cormorant_cg.parameters()).add_(1.)
+        features = cache_features(model, dataset, str(tmp_path))
+        assert (tmp_path / 'features.npy').stat().st_mtime_ns != mtime
+
+        head = FeatureHead(model)
+        full = next(iter(DataLoader(dataset, batch_size=4, collate_fn=collate_fn)))
+        cached = next(iter(DataLoader(features, batch_size=4, collate_fn=collate_fn)))
+        with torch.no_grad():
+            assert torch.allclose(head(cached), model(full), rtol=1e-5, atol=1e-6)
+
+    def test_trainable(self, dataset, tmp_path):
+        dataset, num_species, charge_scale = dataset
+        model = build(CormorantQM9, num_species, charge_scale)
+
+        features = cache_features(model, dataset, str(tmp_path))
+        head = FeatureHead(model).train()
+
+        trainable = [name for name, param in head.named_parameters() if param.requires_grad]
+        assert trainable and all(name.startswith('model.output_layer') for name in trainable)
+
+        cached = next(iter(DataLoader(features, batch_size=4, collate_fn=collate_fn)))
+        head(cached).sum().backward()
+        assert all(param.grad is None for param in model.cormorant_cg.parameters())
+        assert set(head.state_dict()) == set(model.state_dict())
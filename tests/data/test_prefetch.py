@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+from cormorant.data.collate import collate_fn, GeometryCollate
+from cormorant.data.dataset import ProcessedDataset
+from cormorant.data.prefetch import DevicePrefetcher
+
+
+@pytest.fixture
+def loader():
+    torch.manual_seed(0)
+    charges = torch.randint(1, 4, (10, 6))
+    charges[::3, 4:] = 0
+    dataset = ProcessedDataset({'charges': charges, 'positions': torch.randn(10, 6, 3), 'U0': torch.randn(10)},
+                               included_species=torch.arange(1, 4))
+    return DataLoader(dataset, batch_size=3, collate_fn=GeometryCollate(maxl=1, collate_fn=collate_fn))
+
+
+class TestPrefetch():
+
+    @pytest.mark.parametrize('depth', [0, 1, 2, 5])
+    def test_batches(self, loader, depth):
+        prefetcher = DevicePrefetcher(loader, 'cpu', depth=depth)
+        assert prefetcher._loader is loader and prefetcher.dataset is loader.dataset
+        assert len(prefetcher) == len(loader) == 4
+
+        # Twice, as for two epochs
+        for _ in range(2):
+            batches = list(prefetcher)
+            assert len(batches) == 4
+            for batch, ref in zip(batches, loader):
+                assert batch.keys() == ref.keys()
+                assert all(torch.equal(part, ref_part) for part, ref_part in zip(batch['sph_harms'], ref['sph_harms']))
+                assert all(torch.equal(val, ref[key]) for key, val in batch.items() if key != 'sph_harms')
+
+    def test_early_stop(self, loader):
+        num_threads = threading.active_count()
+
+        batches = iter(DevicePrefetcher(loader, 'cpu', depth=1))
+        next(batches)
+        batches.close()
+
+        assert threading.active_count() == num_threads
+
+    def test_error(self, loader):
+        def fail(batch):
+            raise RuntimeError('collate failed')
+        loader = DataLoader(loader.dataset, batch_size=3, collate_fn=fail)
+
+        with pytest.raises(RuntimeError, match='collate failed'):
+            list(DevicePrefetcher(loader, 'cpu'))
@@ -0,0 +1,64 @@
+import io
+import logging
+import tarfile
+
+import numpy as np
+import torch
+
+from cormorant.data.dataset import RaggedDataset
+from cormorant.data.prepare.process import process_xyz_files, process_xyz_gdb9, write_xyz_files
+
+
+def gdb9_tarball(path, num_molecules, seed=0):
+    rng = np.random.default_rng(seed)
+    with tarfile.open(path, 'w:bz2') as tardata:
+        for idx in range(num_molecules):
+            num_atoms = int(rng.integers(2, 9))
+            atoms = rng.choice(['H', 'C', 'N', 'O', 'F'], num_atoms)
+            lines = [str(num_atoms), 'gdb {} '.format(idx + 1) + ' '.join('{:.5f}'.format(x) for x in rng.normal(size=15))]
+            lines += ['{} {:.6f} {:.6f} {:.6f} 0.0'.format(atom, *rng.normal(size=3)) for atom in atoms]
+            lines += [' '.join('{:.4f}'.format(x) for x in rng.uniform(100, 4000, size=3)), 'C', 'InChI=1S/C']
+
+            raw = '\n'.join(lines).encode('UTF-8')
+            member = tarfile.TarInfo('dsgdb9nsd_{:06d}.xyz'.format(idx + 1))
+            member.size = len(raw)
+            tardata.addfile(member, io.BytesIO(raw))
+
+
+class TestPrepare():
+
+    def test_parallel(self, tmp_path, caplog):
+        tarball = str(tmp_path / 'gdb9.tar.bz2')
+        gdb9_tarball(tarball, 50)
+        file_idx_list = np.random.default_rng(1).permutation(50)[:30]
+
+        # Worker processes give the molecules of the serial pipeline, in the order of the files
+        serial = process_xyz_files(tarball, process_xyz_gdb9, file_idx_list=file_idx_list)
+        with caplog.at_level(logging.INFO):
+            parallel = process_xyz_files(tarball, process_xyz_gdb9, file_idx_list=file_idx_list, num_workers=2)
+        assert serial.keys() == parallel.keys()
+        assert all(torch.equal(val, parallel[key]) for key, val in serial.items())
+        assert serial['index'].tolist() == sorted(idx + 1 for idx in file_idx_list)
+        assert 'Processed 30 files' in caplog.text
+
+    def test_write(self, tmp_path):
+        tarball = str(tmp_path / 'gdb9.tar.bz2')
+        gdb9_tarball(tarball, 50)
+        splits = {'train': np.arange(0, 50, 2), 'valid': np.arange(1, 50, 4), 'test': np.arange(3, 50, 4)}
+
+        def thermo(batch):
+            batch['U0_thermo'] = batch['charges'].sum(-1).double()
+            return batch
+
+        paths = {split: str(tmp_path / split) for split in splits}
+        write_xyz_files(tarball, process_xyz_gdb9, paths, splits=splits, transform=thermo, num_workers=2, batch_size=7)
+
+        # Splits streamed to disk in batches match the splits processed in memory
+        for split, file_idx_list in splits.items():
+            reference = thermo(process_xyz_files(tarball, process_xyz_gdb9, file_idx_list=file_idx_list))
+            dataset = RaggedDataset(paths[split])
+            assert len(dataset) == len(file_idx_list)
+            assert torch.equal(dataset.data['U0_thermo'], reference['U0_thermo'])
+            for idx in range(len(dataset)):
+                num_atoms = reference['num_atoms'][idx]
+                assert torch.equal(dataset[idx]['positions'], reference['positions'][idx, :num_atoms])
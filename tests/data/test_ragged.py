@@ -0,0 +1,112 @@
+import argparse
+import pickle
+
+import numpy as np
+import pytest
+import torch
+
+from cormorant.data.collate import collate_fn
+from cormorant.data.dataset import ProcessedDataset, RaggedDataset
+from cormorant.data.ragged import RaggedWriter, RaggedData, write_ragged
+from cormorant.data.utils import initialize_datasets
+
+
+def padded(sizes, max_atoms, seed=0):
+    torch.manual_seed(seed)
+    charges = torch.zeros(len(sizes), max_atoms, dtype=torch.long)
+    bonds = torch.zeros(len(sizes), max_atoms, max_atoms, dtype=torch.int8)
+    for mol, size in enumerate(sizes):
+        charges[mol, :size] = torch.randint(1, 4, (size,))
+        bonds[mol, :size, :size] = torch.randint(0, 3, (size, size))
+    atom_mask = (charges > 0).unsqueeze(-1)
+    return {'charges': charges,
+            'positions': torch.randn(len(sizes), max_atoms, 3) * atom_mask,
+            'forces': torch.randn(len(sizes), max_atoms, 3, dtype=torch.double) * atom_mask,
+            'bonds': bonds,
+            'num_atoms': torch.tensor(sizes),
+            'U0': torch.randn(len(sizes))}
+
+
+class TestRagged():
+
+    def test_dataset(self, tmp_path):
+        sizes = [5, 3, 7, 1]
+        data = padded(sizes, 9)
+        write_ragged(data, str(tmp_path))
+
+        store = RaggedData(str(tmp_path))
+        assert len(store) == 4 and store.species.tolist() == data['charges'].unique()[1:].tolist()
+        assert store.arrays['positions'].shape == (sum(sizes), 3)
+        assert store.arrays['bonds'].shape == (sum(size**2 for size in sizes),)
+
+        reference = ProcessedDataset({key: val.clone() for key, val in data.items()})
+        dataset = RaggedDataset(str(tmp_path))
+        assert len(dataset) == 4 and dataset.stats.keys() == reference.stats.keys()
+
+        for idx, size in enumerate(sizes):
+            item, ref = dataset[idx], reference[idx]
+            assert item.keys() == ref.keys()
+            for key, val in item.items():
+                if key == 'bonds':
+                    assert torch.equal(val, ref[key][:size, :size])
+                elif val.dim() > 0:
+                    assert torch.equal(val, ref[key][:size])
+                else:
+                    assert torch.equal(val, ref[key])
+
+        batch = collate_fn([dataset[idx] for idx in range(4)])
+        ref_batch = collate_fn([reference[idx] for idx in range(4)])
+        for key, val in batch.items():
+            assert torch.equal(val, ref_batch[key])
+
+    def test_append(self, tmp_path):
+        sizes = [5, 3, 7, 1, 4]
+        data = padded(sizes, 7)
+
+        # Batches padded to different sizes give the same dataset
+        with RaggedWriter(str(tmp_path)) as writer:
+            writer.append({key: val[:2, :5] if val.dim() == 2 else val[:2, :5, :5] if key == 'bonds'
+                           else val[:2, :5] if val.dim() == 3 else val[:2] for key, val in data.items()})
+            writer.append({key: val[2:] for key, val in data.items()})
+
+        dataset = RaggedDataset(str(tmp_path))
+        reference = ProcessedDataset({key: val.clone() for key, val in data.items()})
+        for idx, size in enumerate(sizes):
+            assert torch.equal(dataset[idx]['positions'], reference[idx]['positions'][:size])
+            assert torch.equal(dataset[idx]['bonds'], reference[idx]['bonds'][:size, :size])
+
+    def test_not_trailing(self, tmp_path):
+        data = padded([3, 2], 4)
+        data['charges'][0, 1] = 0
+
+        with pytest.raises(ValueError):
+            write_ragged(data, str(tmp_path))
+
+    def test_initialize_datasets(self, tmp_path):
+        (tmp_path / 'qm9').mkdir()
+        for seed, split in enumerate(['train', 'valid', 'test']):
+            data = padded([4, 6, 2, 5], 8, seed=seed)
+            data['charges'][:3, 0] = torch.arange(1, 4)
+            np.savez_compressed(str(tmp_path / 'qm9' / split), **{key: val.numpy() for key, val in data.items()})
+
+        args = argparse.Namespace(num_train=3, num_valid=-1, num_test=-1)
+        args, datasets, num_species, max_charge = initialize_datasets(args, str(tmp_path), 'qm9')
+
+        assert all(isinstance(dataset, RaggedDataset) for dataset in datasets.values())
+        assert (tmp_path / 'qm9' / 'train' / 'meta.json').exists()
+        assert num_species == 3 and max_charge == 3
+        assert args.num_train == 3 and args.num_valid == 4
+        assert datasets['valid'][1]['positions'].shape == (6, 3)
+
+    def test_pickle(self, tmp_path):
+        data = padded([500, 300], 500)
+        write_ragged(data, str(tmp_path))
+
+        # Workers reopen the memory maps rather than receiving the arrays
+        store = RaggedData(str(tmp_path))
+        pickled = pickle.dumps(store)
+        assert len(pickled) < 1000
+
+        copy = pickle.loads(pickled)
+        assert isinstance(copy.arrays['bonds'], np.memmap)
+        assert all(torch.equal(val, store.atom_data(1)[key]) for key, val in copy.atom_data(1).items())
@@ -0,0 +1,137 @@
+import argparse
+
+import pytest
+import torch
+
+from cormorant.data.dataset import ProcessedDataset
+from cormorant.data.samplers import BucketBatchSampler, AtomBudgetBatchSampler, padding_efficiency
+from cormorant.data.utils import init_dataloaders, static_atom_buckets, memory_usage
+
+
+def dataset(num_mols=200, max_atoms=30):
+    torch.manual_seed(0)
+    sizes = torch.randint(1, max_atoms + 1, (num_mols,))
+    charges = (torch.arange(max_atoms) < sizes.unsqueeze(-1)).long()
+    return ProcessedDataset({'charges': charges, 'positions': torch.randn(num_mols, max_atoms, 3),
+                             'U0': torch.randn(num_mols)}), sizes
+
+
+class TestBucketBatchSampler():
+
+    def test_batches(self):
+        _, sizes = dataset()
+        sampler = BucketBatchSampler(sizes, 16, bucket_width=4, seed=0)
+
+        batches = list(sampler)
+        assert len(batches) == len(sampler) == 13
+        assert sorted(idx for batch in batches for idx in batch) == list(range(200))
+        # Only batches straddling two buckets mix sizes from more than one bucket
+        assert sum(len(set((sizes[batch] // 4).tolist())) > 1 for batch in batches) <= 8
+
+        # Each epoch is shuffled differently, but reproducibly
+        assert list(sampler) != batches
+        assert list(BucketBatchSampler(sizes, 16, bucket_width=4, seed=0)) == batches
+
+    def test_boundaries(self):
+        _, sizes = dataset()
+        sampler = BucketBatchSampler(sizes, 16, boundaries=[10, 20, 30], seed=0)
+
+        batches = list(sampler)
+        assert sorted(idx for batch in batches for idx in batch) == list(range(200))
+        # At most two batches straddle the boundaries
+        buckets = [set(((sizes[batch] - 1) // 10).tolist()) for batch in batches]
+        assert sum(len(bucket) > 1 for bucket in buckets) <= 2
+
+    def test_drop_last(self):
+        _, sizes = dataset()
+        sampler = BucketBatchSampler(sizes, 16, drop_last=True, seed=0)
+        assert len(list(sampler)) == len(sampler) == 12
+        assert all(len(batch) == 16 for batch in sampler)
+
+    def test_padding_efficiency(self):
+        _, sizes = dataset()
+        bucketed = BucketBatchSampler(sizes, 16, seed=0).padding_efficiency()
+        shuffled = padding_efficiency(sizes, torch.randperm(200).split(16))
+        assert bucketed['atoms'] > 0.9 and bucketed['atoms'] > shuffled['atoms']
+        assert bucketed['edges'] > shuffled['edges']
+
+        assert padding_efficiency(torch.tensor([2, 4]), [[0, 1]]) == {'atoms': 6 / 8, 'edges': 20 / 32}
+
+    def test_init_dataloaders(self):
+        data, sizes = dataset()
+        assert torch.equal(data.atom_counts(), sizes)
+
+        args = argparse.Namespace(sampler='bucket', bucket_width=2, batch_size=16, shuffle=True, num_workers=0)
+        dataloaders = init_dataloaders(args, {'train': data, 'valid': data})
+
+        assert isinstance(dataloaders['train'].batch_sampler, BucketBatchSampler)
+        batch = next(iter(dataloaders['train']))
+        assert batch['atom_mask'].float().mean() > 0.75
+        assert len(dataloaders['valid']) == 13
+
+    def test_workers(self):
+        data, sizes = dataset()
+
+        # Datasets are moved to shared memory before the workers start
+        args = argparse.Namespace(sampler='random', batch_size=16, shuffle=False, num_workers=2)
+        dataloaders = init_dataloaders(args, {'train': data})
+        assert all(val.is_shared() for val in data.data.values())
+
+        batches = list(dataloaders['train'])
+        assert len(batches) == 13 and torch.equal(batches[0]['U0'], data.data['U0'][:16])
+
+        usage = memory_usage()
+        assert not usage or usage['resident'] >= usage['private'] > 0
+
+
+class TestAtomBudgetBatchSampler():
+
+    def test_budget(self):
+        _, sizes = dataset()
+        sampler = AtomBudgetBatchSampler(sizes, 2000, seed=0)
+
+        num_batches = len(sampler)
+        batches = list(sampler)
+        assert len(batches) == num_batches
+        assert sorted(idx for batch in batches for idx in batch) == list(range(200))
+        assert all(len(batch) * sizes[batch].max()**2 <= 2000 for batch in batches)
+        # Batches of small molecules hold more molecules
+        assert max(len(batch) for batch in batches) > 10 * min(len(batch) for batch in batches)
+
+        assert len(sampler) == len(list(sampler))
+
+    def test_atoms(self):
+        _, sizes = dataset()
+        batches = list(AtomBudgetBatchSampler(sizes, 100, cost='atoms', seed=0))
+        assert all(len(batch) * sizes[batch].max() <= 100 for batch in batches)
+
+    def test_oversized(self):
+        sizes = torch.tensor([3, 50, 3, 3])
+        batches = list(AtomBudgetBatchSampler(sizes, 100, shuffle=False))
+        assert batches == [[0, 2, 3], [1]]
+
+
+class TestStaticShapes():
+
+    def test_atom_buckets(self):
+        data, sizes = dataset()
+        buckets = static_atom_buckets({'train': data, 'valid': data}, 4)
+        assert len(buckets) == 4 and buckets[-1] == sizes.max()
+        assert buckets == sorted(buckets)
+
+    def test_init_dataloaders(self):
+        data, sizes = dataset()
+
+        args = argparse.Namespace(sampler='random', static_shapes=True, atom_buckets=[], num_atom_buckets=3,
+                                  batch_size=16, shuffle=True, num_workers=0)
+        dataloaders = init_dataloaders(args, {'train': data, 'valid': data})
+        buckets = static_atom_buckets({'train': data}, 3)
+
+        for split in ['train', 'valid']:
+            shapes = {tuple(batch['charges'].shape) for batch in dataloaders[split]}
+            assert shapes <= {(16, bucket) for bucket in buckets}
+            assert sum(batch['mol_mask'].sum().item() for batch in dataloaders[split]) == 200
+
+        args.sampler = 'budget'
+        with pytest.raises(ValueError):
+            init_dataloaders(args, {'train': data})
@@ -0,0 +1,49 @@
+import pytest
+import torch
+
+from cormorant.models import CormorantQM9, CormorantHERG
+from cormorant.inference import freeze, fold, count_flops
+
+from .test_freeze import build
+
+
+class TestFold():
+
+    @pytest.mark.parametrize('Cormorant,cutoff_type', [
+        (CormorantQM9, ['hard', 'soft']),
+        (CormorantQM9, ['learn']),
+        (CormorantHERG, ['cos']),
+    ])
+    def test_fold(self, Cormorant, cutoff_type, sample_batch):
+        data, num_species, charge_scale = sample_batch
+        model = build(Cormorant, num_species, charge_scale, cutoff_type)
+
+        with torch.no_grad():
+            frozen = freeze(model)
+            folded = fold(frozen)
+            assert torch.allclose(model(data), folded(data), rtol=1e-4, atol=1e-6)
+            assert torch.allclose(frozen(data), folded(data), rtol=1e-5, atol=1e-6)
+
+    def test_flops(self, sample_batch):
+        data, num_species, charge_scale = sample_batch
+        model = build(CormorantQM9, num_species, charge_scale, ['hard', 'soft'])
+
+        frozen = freeze(model)
+        assert count_flops(fold(frozen), data) < count_flops(frozen, data)
+
+    def test_script(self, sample_batch):
+        data, num_species, charge_scale = sample_batch
+        model = build(CormorantQM9, num_species, charge_scale, ['hard', 'soft'])
+
+        folded = fold(freeze(model))
+        scripted = torch.jit.script(folded)
+
+        with torch.no_grad():
+            assert torch.allclose(scripted(data), folded(data), rtol=1e-5, atol=1e-7)
+
+    def test_not_frozen(self, sample_batch):
+        data, num_species, charge_scale = sample_batch
+        model = build(CormorantQM9, num_species, charge_scale, ['hard', 'soft'])
+
+        with pytest.raises(ValueError):
+            fold(model)
@@ -0,0 +1,75 @@
+import pytest
+import torch
+
+from cormorant.models import CormorantQM9, CormorantHERG, CormorantADME, CormorantLEP
+from cormorant.inference import freeze
+
+from ..models.test_siamese import build_siamese
+
+
+def build(Cormorant, num_species, charge_scale, cutoff_type, *extra, **kwargs):
+    torch.manual_seed(0)
+    return Cormorant([3, 2], [2, 3], 3, 4, num_species, cutoff_type, 2.5, 2.5, 0.4,
+                     'rand', 1., 2, (3, 3), charge_scale, False, 'linear', 'linear', 1,
+                     *extra, **kwargs).eval()
+
+
+class TestFreeze():
+
+    @pytest.mark.parametrize('Cormorant,cutoff_type,extra,kwargs', [
+        (CormorantQM9, ['hard', 'soft'], (), {}),
+        (CormorantQM9, ['learn_poly'], (), {}),
+        (CormorantHERG, ['cos'], (), {'cgprod_bounded': True, 'cg_pow_normalization': 'relu'}),
+        (CormorantADME, ['learn'], (['a', 'b'],), {}),
+    ])
+    def test_freeze(self, Cormorant, cutoff_type, extra, kwargs, sample_batch):
+        data, num_species, charge_scale = sample_batch
+        model = build(Cormorant, num_species, charge_scale, cutoff_type, *extra, **kwargs)
+
+        with torch.no_grad():
+            prediction = model(data)
+            frozen = freeze(model)
+            prediction_frozen = frozen(data)
+
+        assert prediction_frozen.shape == prediction.shape
+        assert torch.allclose(prediction, prediction_frozen, rtol=1e-4, atol=1e-6)
+
+    def test_copies_weights(self, sample_batch):
+        data, num_species, charge_scale = sample_batch
+        model = build(CormorantQM9, num_species, charge_scale, ['hard', 'soft'])
+
+        with torch.no_grad():
+            frozen = freeze(model)
+            prediction = frozen(data)
+            for param in model.parameters():
+                param.mul_(2)
+
+            assert torch.equal(frozen(data), prediction)
+
+    def test_script(self, sample_batch):
+        data, num_species, charge_scale = sample_batch
+        model = build(CormorantQM9, num_species, charge_scale, ['hard', 'soft'])
+
+        frozen = freeze(model)
+        scripted = torch.jit.script(frozen)
+
+        with torch.no_grad():
+            assert torch.allclose(scripted(data), frozen(data), rtol=1e-5, atol=1e-7)
+
+    def test_compile(self, sample_batch):
+        data, num_species, charge_scale = sample_batch
+        model = build(CormorantHERG, num_species, charge_scale, ['cos'])
+
+        frozen = freeze(model)
+        # A graph break would raise with fullgraph=True
+        compiled = torch.compile(frozen, backend='eager', fullgraph=True)
+
+        with torch.no_grad():
+            assert torch.allclose(compiled(data), frozen(data), rtol=1e-5, atol=1e-7)
+
+    def test_unsupported(self, sample_batch):
+        _, num_species, charge_scale = sample_batch
+        model = build_siamese(CormorantLEP, num_species, charge_scale)
+
+        with pytest.raises(NotImplementedError):
+            freeze(model)
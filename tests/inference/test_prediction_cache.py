@@ -0,0 +1,63 @@
+import torch
+
+from cormorant.models import CormorantQM9
+from cormorant.inference import PredictionCache, build_model
+from cormorant.inference.prediction_cache import geometry_keys
+
+from tests.inference.test_predictor import training_args
+
+
+def build_qm9(sample_batch):
+    _, num_species, charge_scale = sample_batch
+    torch.manual_seed(0)
+    return build_model(CormorantQM9, training_args(), num_species, charge_scale)
+
+
+class TestPredictionCache():
+
+    def test_geometry_keys(self, sample_batch):
+        data, _, _ = sample_batch
+        charges, positions, atom_mask = data['charges'], data['positions'], data['atom_mask']
+
+        keys = geometry_keys(charges, positions, atom_mask)
+        assert len(set(keys)) == len(keys)
+
+        # Invariant to the order of the atoms, to the padding, and to noise below the rounding
+        perm = torch.randperm(charges.shape[1])
+        padded = [torch.nn.functional.pad(t, (0, 0) * (t.dim() - 2) + (0, 2)) for t in (charges, positions, atom_mask)]
+        assert geometry_keys(charges[:, perm], positions[:, perm], atom_mask[:, perm]) == keys
+        assert geometry_keys(*padded) == keys
+        assert geometry_keys(charges, positions + 1e-7, atom_mask) == keys
+        assert geometry_keys(charges, positions + 1e-2, atom_mask) != keys
+
+    def test_cache(self, sample_batch, tmp_path):
+        data, _, _ = sample_batch
+        model = build_qm9(sample_batch)
+        path = str(tmp_path / 'cache.db')
+
+        with torch.no_grad():
+            expected = model(data)
+
+            cache = PredictionCache(16, path=path)
+            assert torch.allclose(cache(model, data), expected, rtol=1e-4, atol=1e-5)
+            assert (cache.hits, cache.misses) == (0, 4)
+            assert torch.allclose(cache(model, data), expected, rtol=1e-4, atol=1e-5)
+            assert (cache.hits, cache.misses) == (4, 4)
+
+            # The on-disk tier persists between caches
+            cache = PredictionCache(16, path=path)
+            assert torch.allclose(cache(model, data), expected, rtol=1e-4, atol=1e-5)
+            assert (cache.disk_hits, cache.misses) == (4, 0)
+
+            # Changing the weights invalidates both tiers
+            next(model.parameters()).mul_(2)
+            assert torch.allclose(cache(model, data), model(data), rtol=1e-4, atol=1e-5)
+            assert cache.misses == 4
+            assert PredictionCache(16, path=path).db.execute('SELECT COUNT(*) FROM predictions').fetchone()[0] == 4
+
+    def test_lru(self):
+        cache = PredictionCache(2)
+        cache.model_hash = ''
+        for key in 'abc':
+            cache.put(key, torch.tensor(1.))
+        assert list(cache.entries) == ['b', 'c']
@@ -0,0 +1,95 @@
+import asyncio
+import json
+from argparse import Namespace
+
+import pytest
+import torch
+
+from cormorant.models import CormorantQM9
+from cormorant.inference import Predictor, build_model
+
+
+def training_args():
+    return Namespace(maxl=2, max_sh=2, num_cg_levels=2, num_channels=3, cutoff_type=['hard', 'soft'],
+                     hard_cut_rad=1.5, soft_cut_rad=1.5, soft_cut_width=0.2, weight_init='rand',
+                     level_gain=1., charge_power=2, basis_set=(3, 3), gaussian_mask=False,
+                     top='linear', input='linear', num_mpnn_levels=1, target='U0')
+
+
+def molecules(sample_batch):
+    data, _, _ = sample_batch
+    return [(data['charges'][idx, :num_atoms], data['positions'][idx, :num_atoms])
+            for idx, num_atoms in enumerate(data['num_atoms'])]
+
+
+@pytest.fixture
+def predictor(sample_batch):
+    _, num_species, charge_scale = sample_batch
+
+    torch.manual_seed(0)
+    model = build_model(CormorantQM9, training_args(), num_species, charge_scale)
+    stats = {'U0': (torch.tensor(-2.), torch.tensor(3.))}
+
+    return Predictor(model, torch.arange(1, num_species + 1), stats=stats, target='U0',
+                     max_batch_size=3, max_delay=0.01)
+
+
+class TestPredictor():
+
+    def test_predict(self, predictor, sample_batch):
+        mols = molecules(sample_batch)
+
+        predict = predictor.predict(mols)
+        assert predict.shape == (len(mols),)
+
+        # Predictions do not depend on the other molecules in the batch
+        for mol, value in zip(mols, predict):
+            assert torch.allclose(predictor.predict([mol])[0], value, rtol=1e-4, atol=1e-5)
+
+    def test_from_checkpoint(self, predictor, sample_batch, tmp_path):
+        checkfile = str(tmp_path / 'checkpoint.pt')
+        torch.save({'args': training_args(), 'model_state': predictor.model.state_dict(),
+                    'included_species': predictor.included_species,
+                    'stats': {'U0': (predictor.mu, predictor.sigma)}}, checkfile)
+
+        loaded = Predictor.from_checkpoint(checkfile, CormorantQM9)
+
+        mols = molecules(sample_batch)
+        assert torch.allclose(loaded.predict(mols), predictor.predict(mols))
+
+    def test_micro_batching(self, predictor, sample_batch):
+        mols = molecules(sample_batch) * 3
+        expected = [predictor.predict([mol])[0] for mol in mols]
+
+        async def client():
+            server = await predictor.serve(port=0)
+            port = server.sockets[0].getsockname()[1]
+
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            for idx, (charges, positions) in enumerate(mols):
+                request = {'id': idx, 'charges': charges.tolist(), 'positions': positions.tolist()}
+                writer.write((json.dumps(request) + '\n').encode())
+            await writer.drain()
+
+            responses = [json.loads(await reader.readline()) for _ in mols]
+
+            writer.write(b'{"metrics": true}\n')
+            metrics = json.loads(await reader.readline())
+
+            writer.close()
+            server.close()
+            await server.wait_closed()
+
+            return responses, metrics
+
+        predictor.num_batches = 0
+        responses, metrics = asyncio.run(client())
+
+        predict = {response['id']: response['prediction'] for response in responses}
+        for idx, value in enumerate(expected):
+            assert predict[idx] == pytest.approx(value.item(), rel=1e-4, abs=1e-5)
+
+        # Concurrent requests share batches
+        assert metrics['requests'] == len(mols)
+        assert metrics['batches'] < len(mols)
+        assert metrics['p50'] <= metrics['p99']
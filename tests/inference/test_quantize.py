@@ -0,0 +1,56 @@
+import pytest
+import torch
+
+from cormorant.models import CormorantQM9, CormorantHERG
+from cormorant.inference import freeze, quantize, quantization_report
+from cormorant.inference.quantize import _QuantizedCatMix, _QuantizedLinear
+
+from .test_freeze import build
+
+
+class TestQuantize():
+
+    @pytest.mark.parametrize('Cormorant,cutoff_type', [
+        (CormorantQM9, ['hard', 'soft']),
+        (CormorantHERG, ['cos']),
+    ])
+    def test_quantize(self, Cormorant, cutoff_type, sample_batch):
+        data, num_species, charge_scale = sample_batch
+        model = build(Cormorant, num_species, charge_scale, cutoff_type)
+
+        frozen = freeze(model)
+        quantized = quantize(frozen, [data])
+
+        assert not any(isinstance(module, torch.nn.Linear) for name, module in quantized.named_modules()
+                       if '.rad_filt.' not in name)
+        assert any(isinstance(module, _QuantizedCatMix) for module in quantized.modules())
+        assert any(isinstance(module, _QuantizedLinear) for module in quantized.modules())
+
+        with torch.no_grad():
+            prediction, prediction_int8 = frozen(data), quantized(data)
+
+        assert prediction_int8.shape == prediction.shape
+        assert (prediction - prediction_int8).abs().max() < 0.05 * prediction.abs().max()
+
+    def test_script(self, sample_batch):
+        data, num_species, charge_scale = sample_batch
+        model = build(CormorantQM9, num_species, charge_scale, ['hard', 'soft'])
+
+        quantized = quantize(freeze(model), [data])
+        scripted = torch.jit.script(quantized)
+
+        with torch.no_grad():
+            assert torch.allclose(scripted(data), quantized(data))
+
+    def test_report(self, sample_batch):
+        data, num_species, charge_scale = sample_batch
+        model = build(CormorantQM9, num_species, charge_scale, ['hard', 'soft'])
+        data = dict(data, target=torch.zeros(data['charges'].shape[0]))
+
+        frozen = freeze(model)
+        report = quantization_report(frozen, quantize(frozen, [data]), [data], 'target', stats={'target': (1., 2.)})
+
+        with torch.no_grad():
+            mae = (frozen(data) * 2 + 1).abs().mean().item()
+        assert report['mae_float'] == pytest.approx(mae)
+        assert report['latency_int8'] > 0
@@ -1,5 +1,7 @@
 import pytest
+import torch
 
+from cormorant.data.collate import collate_fn, StaticShapeCollate, GeometryCollate
 from cormorant.models import CormorantQM9, CormorantMD17
 
 
@@ -35,3 +37,70 @@ class TestCormorant():
 
         # Get data and then try pushing through a single example
         cormorant(data)
+
+    @pytest.mark.parametrize('Cormorant', [CormorantQM9, CormorantMD17])
+    def test_Cormorant_bfloat16(self, Cormorant, sample_batch):
+        data, num_species, charge_scale = sample_batch
+
+        torch.manual_seed(0)
+        cormorant = Cormorant(2, 2, 2, 4, num_species, ['hard', 'learn'], 1., 1., 1., 'rand', 1, 2, (3, 3),
+                              charge_scale, False, 'linear', 'linear', 2)
+
+        prediction = cormorant(data)
+        with torch.autocast('cpu', dtype=torch.bfloat16):
+            prediction_bf16 = cormorant(data)
+
+        # Weights stay in float, and the gradients reach every weight
+        prediction_bf16.float().sum().backward()
+        assert all(param.dtype == torch.float for param in cormorant.parameters())
+        assert all(param.grad is not None for param in cormorant.parameters() if param.requires_grad)
+
+        assert (prediction_bf16.float() - prediction).abs().max() < 0.05 * prediction.abs().max()
+
+
+    @pytest.mark.parametrize('Cormorant', [CormorantQM9, CormorantMD17])
+    def test_Cormorant_static_shapes(self, Cormorant):
+        torch.manual_seed(0)
+        molecules = []
+        for num_atoms in [5, 3, 7]:
+            charges = torch.randint(1, 4, (num_atoms,))
+            molecules.append({'charges': charges, 'positions': torch.randn(num_atoms, 3),
+                              'one_hot': charges.unsqueeze(-1) == torch.arange(1, 4)})
+
+        cormorant = Cormorant(2, 2, 2, 4, 3, ['hard', 'learn'], 1., 1., 1., 'rand', 1, 2, (3, 3),
+                              3, False, 'linear', 'linear', 2)
+
+        # Padding atoms and molecules does not change the predictions of the real molecules
+        static = StaticShapeCollate([10], batch_size=5)(molecules)
+        prediction = cormorant(collate_fn(molecules))
+        assert torch.allclose(cormorant(static)[static['mol_mask']], prediction, atol=1e-6)
+
+    @pytest.mark.parametrize('Cormorant', [CormorantQM9, CormorantMD17])
+    @pytest.mark.parametrize('maxl,cutoff', [(None, None), (2, None), (3, 1.5), (2, 0.5)])
+    def test_Cormorant_geometry(self, Cormorant, maxl, cutoff):
+        torch.manual_seed(0)
+        molecules = []
+        for num_atoms in [5, 3, 7]:
+            charges = torch.randint(1, 4, (num_atoms,))
+            molecules.append({'charges': charges, 'positions': torch.randn(num_atoms, 3),
+                              'one_hot': charges.unsqueeze(-1) == torch.arange(1, 4)})
+
+        cormorant = Cormorant(2, 2, 2, 4, 3, ['hard', 'cos'], 1., 1., 0.5, 'rand', 1, 2, (3, 3),
+                              3, False, 'linear', 'linear', 2, prune_edges=True)
+
+        # Geometry computed in the collate function gives the same predictions,
+        # and edges are recomputed if the cutoff is smaller than the support of the masks
+        batch = GeometryCollate(maxl=maxl, cutoff=cutoff)(molecules)
+        prediction = cormorant(collate_fn(molecules))
+        assert torch.allclose(cormorant(batch), prediction, atol=1e-6)
+
+    @pytest.mark.parametrize('Cormorant', [CormorantQM9, CormorantMD17])
+    def test_Cormorant_species(self, Cormorant, sample_batch):
+        data, num_species, charge_scale = sample_batch
+        cormorant = Cormorant(2, 2, 2, 4, 3, ['hard', 'learn'], 1., 1., 1., 'rand', 1, 2, (3, 3),
+                              3, False, 'linear', 'linear', 2)
+
+        # The species index gives the same predictions as the one-hot encoding
+        batch = {key: val for key, val in data.items() if key != 'one_hot'}
+        batch['species'] = data['charges'].to(torch.uint8)
+        assert torch.allclose(cormorant(batch), cormorant(data), atol=1e-6)
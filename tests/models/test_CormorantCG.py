@@ -0,0 +1,144 @@
+import pytest
+import torch
+from torch.utils.flop_counter import FlopCounterMode
+
+from cormorant.cg_lib import SphericalHarmonicsRel
+from cormorant.nn import RadialFilters, InputLinear
+from cormorant.models import CormorantCG
+
+
+def build_cg(sample_batch, num_cg_levels=3, maxl=2, num_channels=3,
+             cutoff_type=['hard', 'soft'], soft_cut_rad=1.5, prune_edges=False):
+    data, num_species, charge_scale = sample_batch
+    torch.manual_seed(0)
+
+    maxl_list = [maxl] * num_cg_levels
+    channels = [num_channels] * (num_cg_levels + 1)
+
+    sph_harms = SphericalHarmonicsRel(maxl, conj=True)
+    rad_funcs = RadialFilters(maxl_list, (3, 3), channels, num_cg_levels)
+    input_func = InputLinear(num_species, num_channels)
+
+    cormorant_cg = CormorantCG(maxl_list, maxl_list, input_func.tau, [], rad_funcs.tau,
+                               num_cg_levels, channels, [1.] * num_cg_levels, 'rand',
+                               cutoff_type, [1.5] * num_cg_levels, [soft_cut_rad] * num_cg_levels,
+                               [0.2] * num_cg_levels, prune_edges=prune_edges)
+
+    positions = data['positions']
+    atom_mask, edge_mask = data['atom_mask'], data['edge_mask']
+
+    def run():
+        sph_harm, norms = sph_harms(positions, positions)
+        pairs = cormorant_cg.edge_pairs(edge_mask, norms)
+        rads = rad_funcs(norms, edge_mask * (norms > 0), pairs=pairs)
+        atom_reps = input_func(data['one_hot'].float(), atom_mask, None, edge_mask, norms)
+        return cormorant_cg(atom_reps, atom_mask, None, edge_mask, rads, norms, sph_harm, pairs=pairs)
+
+    params = list(cormorant_cg.parameters()) + list(rad_funcs.parameters()) + list(input_func.parameters())
+
+    return cormorant_cg, run, params
+
+
+class TestCormorantCG():
+
+    def test_checkpoint_levels(self, sample_batch):
+        cormorant_cg, run, params = build_cg(sample_batch)
+
+        saved = {}
+        for checkpoint_levels in [False, True]:
+            cormorant_cg.checkpoint_levels = checkpoint_levels
+            for param in params:
+                param.grad = None
+
+            saved_bytes = [0]
+
+            def pack(tensor):
+                saved_bytes[0] += tensor.numel() * tensor.element_size()
+                return tensor
+
+            with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+                atoms_all, edges_all = run()
+                loss = sum(part.pow(2).sum() for atoms in atoms_all for part in atoms)
+
+            loss.backward()
+
+            saved[checkpoint_levels] = (loss.detach(), [param.grad.clone() for param in params], saved_bytes[0])
+
+        loss_full, grads_full, bytes_full = saved[False]
+        loss_ckpt, grads_ckpt, bytes_ckpt = saved[True]
+
+        assert torch.allclose(loss_full, loss_ckpt)
+        for grad_full, grad_ckpt in zip(grads_full, grads_ckpt):
+            assert torch.allclose(grad_full, grad_ckpt, rtol=1e-4, atol=1e-5)
+
+        assert bytes_ckpt < bytes_full
+
+    def test_checkpoint_levels_eval(self, sample_batch):
+        cormorant_cg, run, _ = build_cg(sample_batch)
+        cormorant_cg.eval()
+
+        saved_bytes = {}
+        for checkpoint_levels in [False, True]:
+            cormorant_cg.checkpoint_levels = checkpoint_levels
+            saved_bytes[checkpoint_levels] = [0]
+
+            def pack(tensor, saved=saved_bytes[checkpoint_levels]):
+                saved[0] += tensor.numel() * tensor.element_size()
+                return tensor
+
+            with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+                run()
+
+        assert saved_bytes[True] == saved_bytes[False]
+
+    def test_support_radii(self, sample_batch):
+        cormorant_cg, _, _ = build_cg(sample_batch)
+
+        assert cormorant_cg.support_radii == [1.5] * 3
+
+    @pytest.mark.parametrize('cutoff_type', [['hard'], ['cos'], ['hard', 'learn_poly']])
+    def test_prune_edges(self, sample_batch, cutoff_type):
+        cormorant_cg, run, _ = build_cg(sample_batch, cutoff_type=cutoff_type, soft_cut_rad=1.2)
+
+        flops = {}
+        atoms = {}
+        for prune_edges in [False, True]:
+            cormorant_cg.prune_edges = prune_edges
+            with FlopCounterMode(display=False) as counter:
+                atoms[prune_edges], _ = run()
+            flops[prune_edges] = counter.get_total_flops()
+
+        assert flops[True] < flops[False]
+        for atoms_full, atoms_pruned in zip(atoms[False], atoms[True]):
+            for part_full, part_pruned in zip(atoms_full, atoms_pruned):
+                assert torch.allclose(part_full, part_pruned, atol=1e-6)
+
+    def test_prune_edges_infinite_support(self, sample_batch):
+        cormorant_cg, run, _ = build_cg(sample_batch, cutoff_type=['soft'], prune_edges=True)
+
+        positions, edge_mask = sample_batch[0]['positions'], sample_batch[0]['edge_mask']
+        norms = (positions.unsqueeze(-2) - positions.unsqueeze(-3)).norm(dim=-1)
+
+        assert cormorant_cg.edge_pairs(edge_mask, norms) is None
+
+    @pytest.mark.parametrize('checkpoint_levels', [False, True])
+    def test_parallel_levels(self, sample_batch, checkpoint_levels):
+        cormorant_cg, run, params = build_cg(sample_batch)
+        cormorant_cg.checkpoint_levels = checkpoint_levels
+
+        results = {}
+        for parallel in [False, True]:
+            for level in cormorant_cg.atom_levels:
+                level.parallel = parallel
+            for param in params:
+                param.grad = None
+
+            atoms_all, _ = run()
+            loss = sum(part.pow(2).sum() for atoms in atoms_all for part in atoms)
+            loss.backward()
+
+            results[parallel] = (loss.detach(), [param.grad.clone() for param in params])
+
+        assert torch.allclose(results[False][0], results[True][0])
+        for grad_serial, grad_parallel in zip(results[False][1], results[True][1]):
+            assert torch.allclose(grad_serial, grad_parallel, rtol=1e-4, atol=1e-6)
@@ -0,0 +1,39 @@
+import torch
+
+from cormorant.models import CormorantADME
+
+
+class TestCormorantADME():
+
+    def test_multitarget(self, sample_batch):
+        data, num_species, charge_scale = sample_batch
+        targets = ['herg', 'pxr', 'fup']
+
+        torch.manual_seed(0)
+        cormorant = CormorantADME(2, 2, 2, 3, num_species, ['hard', 'soft'], 1.5, 1.5, 0.2,
+                                  'rand', 1., 2, (3, 3), charge_scale, False,
+                                  'linear', 'linear', 2, targets)
+
+        prediction = cormorant(data)
+        assert prediction.shape == (data['charges'].shape[0], len(targets))
+
+        # The heads share the trunk, so each column is the output of its own head
+        # on the same scalars
+        atom_scalars = []
+        handle = cormorant.get_scalars_atom.register_forward_hook(lambda module, inputs, output: atom_scalars.append(output))
+        cormorant(data)
+        handle.remove()
+
+        for idx, output_layer in enumerate(cormorant.output_layers_atom):
+            assert torch.allclose(prediction[:, idx], output_layer(atom_scalars[0], data['atom_mask']))
+
+        # A loss over the known labels only still trains every head that has a label
+        labels = torch.randn_like(prediction)
+        labels[:, 1] = float('nan')
+        present = ~labels.isnan()
+        loss = (prediction[present] - labels[present]).pow(2).mean()
+        loss.backward()
+
+        grads = [output_layer.lin.weight.grad for output_layer in cormorant.output_layers_atom]
+        assert grads[1] is None or (grads[1] == 0).all()
+        assert grads[0].abs().sum() > 0 and grads[2].abs().sum() > 0
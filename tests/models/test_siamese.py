@@ -0,0 +1,165 @@
+import pytest
+import torch
+
+from cormorant.models import CormorantLEP, CormorantMutation
+from cormorant.models.embedding_cache import EmbeddingCache
+from cormorant.models.cormorant_mutation import match_atoms
+
+
+def siamese_batch(sample_batch):
+    data, num_species, charge_scale = sample_batch
+
+    # Use the first two molecules as the first structures and the last two as the
+    # second structures, trimmed to their own largest molecule.
+    halves = [slice(0, 2), slice(2, 4)]
+    batch = {'label': torch.tensor([0, 1])}
+    for idx, half in enumerate(halves, start=1):
+        num_atoms = int(data['num_atoms'][half].max())
+        batch['charges{}'.format(idx)] = data['charges'][half, :num_atoms]
+        batch['positions{}'.format(idx)] = data['positions'][half, :num_atoms]
+        batch['one_hot{}'.format(idx)] = data['one_hot'][half, :num_atoms]
+        batch['atom_mask{}'.format(idx)] = data['atom_mask'][half, :num_atoms]
+        batch['edge_mask{}'.format(idx)] = data['edge_mask'][half, :num_atoms, :num_atoms]
+
+    return batch, num_species, charge_scale
+
+
+def build_siamese(Cormorant, num_species, charge_scale, **kwargs):
+    torch.manual_seed(0)
+    return Cormorant(2, 2, 2, 3, num_species, ['hard', 'soft'], 1.5, 1.5, 0.2,
+                     'rand', 1., 2, (3, 3), charge_scale, False, **kwargs)
+
+
+class TestSiamese():
+
+    @pytest.mark.parametrize('Cormorant', [CormorantLEP, CormorantMutation])
+    def test_stack_pairs(self, Cormorant, sample_batch):
+        batch, num_species, charge_scale = siamese_batch(sample_batch)
+        assert batch['charges1'].shape[1] != batch['charges2'].shape[1]
+
+        cormorant = build_siamese(Cormorant, num_species, charge_scale)
+
+        predictions = {}
+        for stack_pairs in [False, True]:
+            cormorant.stack_pairs = stack_pairs
+            predictions[stack_pairs], atoms_all, _ = cormorant(batch, covariance_test=True)
+            assert all(part.shape[0] == 2 for atoms in atoms_all for part in atoms)
+
+        assert predictions[True].shape == predictions[False].shape
+        assert torch.allclose(predictions[True], predictions[False], rtol=1e-4, atol=1e-6)
+
+    @pytest.mark.parametrize('stack_pairs', [False, True])
+    @pytest.mark.parametrize('Cormorant', [CormorantLEP, CormorantMutation])
+    def test_embedding_cache(self, Cormorant, stack_pairs, sample_batch):
+        batch, num_species, charge_scale = siamese_batch(sample_batch)
+
+        cormorant = build_siamese(Cormorant, num_species, charge_scale,
+                                  stack_pairs=stack_pairs, embedding_cache=1)
+        cache = cormorant.embedding_cache
+
+        # Gradients are required, so the cache is not used
+        prediction = cormorant(batch)
+        assert cache.hits + cache.misses == 0
+
+        with torch.no_grad():
+            prediction_miss = cormorant(batch)
+            assert (cache.hits, cache.misses, len(cache)) == (0, 4, 4)
+            prediction_hit = cormorant(batch)
+            assert (cache.hits, cache.misses, len(cache)) == (4, 4, 4)
+
+        assert torch.allclose(prediction, prediction_miss, rtol=1e-4, atol=1e-6)
+        assert torch.allclose(prediction, prediction_hit, rtol=1e-4, atol=1e-6)
+
+        # Changing the encoder weights invalidates the cache
+        with torch.no_grad():
+            next(cormorant.cormorant_cg.parameters()).mul_(2)
+            prediction_new = cormorant(batch)
+        assert (cache.hits, cache.misses, len(cache)) == (4, 8, 4)
+        assert torch.allclose(prediction_new, cormorant(batch), rtol=1e-4, atol=1e-6)
+
+    def test_embedding_cache_frozen(self, sample_batch):
+        batch, num_species, charge_scale = siamese_batch(sample_batch)
+
+        cormorant = build_siamese(CormorantLEP, num_species, charge_scale, embedding_cache=1)
+        for module in [cormorant.rad_funcs, cormorant.input_func_atom, cormorant.cormorant_cg]:
+            module.requires_grad_(False)
+        assert cormorant.encoder_frozen
+
+        cormorant(batch).sum().backward()
+        cormorant(batch).sum().backward()
+        assert cormorant.embedding_cache.hits == 4
+        assert all(param.grad is not None for param in cormorant.output_layer_atom.parameters())
+
+    def test_embedding_cache_budget(self):
+        cache = EmbeddingCache(max_bytes=2 * 4 * 10)
+        for key in 'abc':
+            cache.put(key, torch.zeros(10))
+        assert list(cache.entries) == ['b', 'c']
+        assert cache.get('a') is None and cache.get('b') is not None
+
+        cache.put('d', torch.zeros(10))
+        assert list(cache.entries) == ['b', 'd']
+        assert cache.num_bytes == 80
+
+
+def mutation_batch(num_species=3, num_atoms=40, box=10.):
+    torch.manual_seed(1)
+
+    charges1 = torch.randint(1, num_species + 1, (2, num_atoms))
+    positions1 = box * torch.rand(2, num_atoms, 3)
+
+    # Move one atom and change the species of another in the first pair,
+    # and replace an atom by a new one in the second pair
+    charges2, positions2 = charges1.clone(), positions1.clone()
+    positions2[0, 3] += 0.5
+    charges2[0, 7] = charges2[0, 7] % num_species + 1
+    charges2[1, 5] = 0
+    charges2 = torch.cat([charges2, torch.tensor([[0], [2]])], dim=1)
+    positions2 = torch.cat([positions2, box * torch.rand(2, 1, 3)], dim=1)
+
+    batch = {'label': torch.tensor([0, 1])}
+    for idx, (charges, positions) in enumerate([(charges1, positions1), (charges2, positions2)], start=1):
+        atom_mask = charges > 0
+        batch['charges{}'.format(idx)] = charges
+        batch['positions{}'.format(idx)] = positions
+        batch['one_hot{}'.format(idx)] = charges.unsqueeze(-1) == torch.arange(1, num_species + 1)
+        batch['atom_mask{}'.format(idx)] = atom_mask
+        batch['edge_mask{}'.format(idx)] = atom_mask.unsqueeze(1) * atom_mask.unsqueeze(2)
+
+    return batch, num_species, num_species
+
+
+class TestIncremental():
+
+    @pytest.mark.parametrize('cutoff_type', [['hard'], ['cos']])
+    def test_incremental(self, cutoff_type):
+        batch, num_species, charge_scale = mutation_batch()
+
+        torch.manual_seed(0)
+        cormorant = CormorantMutation(2, 2, 2, 3, num_species, cutoff_type, 1.5, 1.5, 0.2,
+                                      'rand', 1., 2, (3, 3), charge_scale, False)
+        assert cormorant.receptive_field == pytest.approx([1.5, 3.])
+
+        # Only part of the mutant is re-evaluated
+        match, changed_dist = match_atoms(*[batch[key + idx] for idx in '12'
+                                            for key in ['charges', 'positions', 'atom_mask']])
+        assert (match[batch['atom_mask2']] < 0).sum() == 3
+        assert ((changed_dist <= 4.5) & batch['atom_mask2']).sum() < batch['atom_mask2'].sum() / 2
+
+        cormorant.incremental = False
+        prediction_full = cormorant(batch)
+        cormorant.incremental = True
+        prediction_incremental = cormorant(batch)
+
+        assert torch.allclose(prediction_full, prediction_incremental, rtol=1e-4, atol=1e-6)
+
+    def test_incremental_infinite_support(self):
+        batch, num_species, charge_scale = mutation_batch()
+
+        torch.manual_seed(0)
+        cormorant = CormorantMutation(2, 2, 2, 3, num_species, ['soft'], 1.5, 1.5, 0.2,
+                                      'rand', 1., 2, (3, 3), charge_scale, False, incremental=True)
+        assert cormorant.receptive_field is None
+
+        # Falls back to a full evaluation
+        cormorant(batch)
@@ -0,0 +1,22 @@
+import torch
+
+from cormorant.nn import InputLinear, species_index, species_scalars
+
+
+class TestInputLinear():
+
+    def test_species(self):
+        torch.manual_seed(0)
+        num_species, num_powers, num_channels = 4, 3, 5
+        species = torch.randint(0, num_species + 1, (2, 6))
+        atom_mask = species > 0
+        charge_powers = torch.rand(2, 6, num_powers)
+
+        # The embedding lookup of the species index matches the dense one-hot features
+        one_hot = species.unsqueeze(-1) == torch.arange(1, num_species + 1)
+        assert torch.equal(species_index({'one_hot': one_hot}), species)
+
+        input_linear = InputLinear(num_species * num_powers, num_channels)
+        dense = input_linear(species_scalars(species, charge_powers, num_species), atom_mask, None, None, None)
+        embedded = input_linear(charge_powers, atom_mask, None, None, None, species=species)
+        assert torch.allclose(embedded[0], dense[0], atol=1e-6)
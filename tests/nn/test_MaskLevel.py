@@ -0,0 +1,80 @@
+import torch
+import pytest
+
+from cormorant.nn import MaskLevel
+
+
+def make_norms(num_atoms=7, scale=2.):
+    torch.manual_seed(1)
+    pos = scale * torch.randn(2, num_atoms, 3)
+    norms = (pos.unsqueeze(-2) - pos.unsqueeze(-3)).norm(dim=-1)
+    edge_mask = torch.ones(2, num_atoms, num_atoms, dtype=torch.bool)
+    return norms, edge_mask
+
+
+class TestMaskLevel():
+
+    @pytest.mark.parametrize('cutoff_type', [['cos'], ['poly'], ['learn_cos'], ['learn_poly']])
+    @pytest.mark.parametrize('num_channels', [1, 3])
+    def test_compact_support(self, cutoff_type, num_channels):
+        norms, edge_mask = make_norms()
+        soft_cut_rad, soft_cut_width = 2., 0.5
+
+        mask = MaskLevel(num_channels, 1., soft_cut_rad, soft_cut_width, cutoff_type)
+        edge_net = torch.ones(norms.shape + (num_channels, 2))
+
+        out = mask(edge_net, edge_mask, norms)
+
+        outside = (norms >= soft_cut_rad)
+        inside = (norms <= soft_cut_rad - soft_cut_width)
+        assert outside.any() and inside.any()
+        assert (out[outside] == 0).all()
+        assert (out[inside] == 1).all()
+
+        assert mask.support_radius == pytest.approx(soft_cut_rad)
+        support = mask.edge_support(edge_mask, norms)
+        assert (support == ~outside).all()
+
+    @pytest.mark.parametrize('envelope', ['cos', 'poly'])
+    def test_envelope_continuous(self, envelope):
+        norms = torch.linspace(0, 3, 3001).view(1, 1, -1)
+        edge_mask = torch.ones_like(norms, dtype=torch.bool)
+
+        mask = MaskLevel(1, None, 2., 1., [envelope])
+        out = mask(torch.ones(norms.shape + (1, 2)), edge_mask, norms)[..., 0, 0].view(-1)
+
+        assert out.max() <= 1 and out.min() >= 0
+        assert (out[1:] - out[:-1]).abs().max() < 5e-3
+
+    def test_learnable(self):
+        norms, edge_mask = make_norms()
+        mask = MaskLevel(2, None, 2., 0.5, ['learn_poly'])
+
+        assert isinstance(mask.soft_cut_rad, torch.nn.Parameter)
+        assert isinstance(mask.soft_cut_width, torch.nn.Parameter)
+
+        out = mask(torch.ones(norms.shape + (2, 2)), edge_mask, norms)
+        out.sum().backward()
+
+        assert mask.soft_cut_rad.grad.abs().sum() > 0
+        assert mask.soft_cut_width.grad.abs().sum() > 0
+
+    def test_hard_and_compact_support(self):
+        norms, edge_mask = make_norms()
+        mask = MaskLevel(1, 1.5, 2., 0.5, ['hard', 'cos'])
+
+        assert mask.support_radius == pytest.approx(1.5)
+
+        out = mask(torch.ones(norms.shape + (1, 2)), edge_mask, norms)
+        assert (out[norms >= 1.5] == 0).all()
+
+    def test_soft_has_no_support(self):
+        mask = MaskLevel(1, 1.5, 2., 0.5, ['soft'])
+        assert mask.support_radius is None
+
+    @pytest.mark.parametrize('cutoff_type,gaussian_mask', [(['cos', 'poly'], False), (['learn_cos', 'poly'], False),
+                                                           (['learn', 'cos'], False), (['soft', 'poly'], False),
+                                                           (['cos'], True)])
+    def test_conflicting_cutoffs(self, cutoff_type, gaussian_mask):
+        with pytest.raises(ValueError):
+            MaskLevel(1, 1.5, 2., 0.5, cutoff_type, gaussian_mask=gaussian_mask)